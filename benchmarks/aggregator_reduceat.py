@@ -0,0 +1,66 @@
+# Compares the generic groupby/agg aggregation with the sorted reduceat path of DemandAggregator on the gold dataset,
+# at every AggregationLevel, with the feature list of the workflow test.
+#
+#   python benchmarks/aggregator_reduceat.py data/m5-forecasting-accuracy [repeats]
+import os
+import sys
+import time
+
+import pandas as pd
+
+from retail.data.m5.loader import M5DataLoader
+from retail.data_layer.generic_silver_to_gold import GenericSilverToGold
+from retail.domain import Feature
+from retail.transformer.demand_aggregator import AggregationLevel, DemandAggregator
+from retail.transformer.lagged_feature import LaggedFeature
+
+
+FEATURE_LIST = [
+    Feature('price', False, 'mean'),
+    Feature('sales_qty', False, 'sum'),
+    Feature('store_id', True, 'first'),
+    Feature('year_week', False, 'first'),
+    Feature('sku_id', True, 'first'),
+    Feature('price_lag_1', False, 'mean'),
+    Feature('price_lag_2', False, 'mean'),
+]
+
+
+def _load_gold_df(directory: str) -> pd.DataFrame:
+    directory = os.path.abspath(directory)
+    loader = M5DataLoader(sales_file=os.path.join(directory, "sales_train_evaluation.csv"),
+                          catalog_file=os.path.join(directory, "sell_prices.csv"),
+                          calendar_file=os.path.join(directory, "calendar.csv"),
+                          validation_mode='off')
+    gold_df = GenericSilverToGold().get_gold_dataset(*loader.get_silver_datasets())
+    return LaggedFeature('price', lags=[1, 2]).transform(gold_df)
+
+
+def _best_time(f, repeats: int) -> (float, pd.DataFrame):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = f()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    directory = sys.argv[1]
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    gold_df = _load_gold_df(directory)
+    print(f"{len(gold_df)} gold rows")
+
+    for level_name, level in AggregationLevel.items():
+        aggregation_f_dict = {f.name: f.aggregation_f for f in FEATURE_LIST if f.name not in level}
+        generic_time, generic_df = _best_time(
+            lambda: gold_df.groupby(level, observed=True).agg(aggregation_f_dict).reset_index(), repeats)
+        sorted_time, sorted_df = _best_time(
+            lambda: DemandAggregator(level, FEATURE_LIST).fit_transform(gold_df), repeats)
+        pd.testing.assert_frame_equal(generic_df, sorted_df, check_exact=False)
+        print(f"{level_name:>16}: {len(sorted_df):>9} groups, generic {generic_time:6.2f}s, "
+              f"reduceat {sorted_time:6.2f}s, x{generic_time / sorted_time:.1f}")
+
+
+if __name__ == '__main__':
+    main()
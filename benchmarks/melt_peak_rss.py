@@ -0,0 +1,65 @@
+# Compares peak RSS of the in-memory melt + merge of the M5 sales file with the chunked streaming melt.
+#
+#   python benchmarks/melt_peak_rss.py data/m5-forecasting-accuracy [chunk_size]
+#
+# Each path runs in a fresh process so that ru_maxrss only measures that path.
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from retail.data.m5.loader import SALES_DTYPES, SALES_KEY_COLUMNS, _is_sales_column
+from retail.data.m5.sales_melt import melt_sales_chunks, read_melted_sales
+
+
+def _load_calendar(directory: str) -> pd.DataFrame:
+    return pd.read_csv(os.path.join(directory, 'calendar.csv'), usecols=['d', 'date'])
+
+
+def in_memory_melt(directory: str, chunk_size: int) -> int:
+    sales_df = pd.read_csv(os.path.join(directory, 'sales_train_evaluation.csv'))
+    key_columns = ['id', 'item_id', 'dept_id', 'cat_id', 'store_id', 'state_id']
+    sales_df = sales_df.melt(id_vars=key_columns, var_name='day_no', value_name='sales_qty')
+    calendar_df = _load_calendar(directory).rename(columns={'d': 'day_no'})
+    sales_df = pd.merge(sales_df, calendar_df, on='day_no', how='left')
+    sales_df.date = pd.to_datetime(sales_df.date)
+    return len(sales_df)
+
+
+def streaming_melt(directory: str, chunk_size: int) -> int:
+    calendar_df = _load_calendar(directory)
+    date_by_day_no = pd.to_datetime(calendar_df.set_index('d').date)
+    wide_chunks = pd.read_csv(os.path.join(directory, 'sales_train_evaluation.csv'),
+                              usecols=_is_sales_column, dtype=SALES_DTYPES, chunksize=chunk_size)
+    with tempfile.TemporaryDirectory() as tmp_directory:
+        path = os.path.join(tmp_directory, 'sales.parquet')
+        melt_sales_chunks(wide_chunks, SALES_KEY_COLUMNS, date_by_day_no, path)
+        sales_df = read_melted_sales(path)
+    return len(sales_df)
+
+
+def _run(path_name: str, directory: str, chunk_size: int):
+    start = time.perf_counter()
+    n_rows = globals()[path_name](directory, chunk_size)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        max_rss //= 1024
+    return n_rows, elapsed, max_rss / 1024
+
+
+if __name__ == '__main__':
+    directory = sys.argv[1]
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    context = multiprocessing.get_context('spawn')
+    print(f"{'path':<16}{'rows':>14}{'seconds':>10}{'peak RSS (MB)':>16}")
+    for path_name in ['in_memory_melt', 'streaming_melt']:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            n_rows, elapsed, max_rss_mb = executor.submit(_run, path_name, directory, chunk_size).result()
+        print(f"{path_name:<16}{n_rows:>14}{elapsed:>10.2f}{max_rss_mb:>16.1f}")
@@ -0,0 +1,115 @@
+import threading
+from collections import OrderedDict
+from dataclasses import replace
+
+import numpy as np
+
+from data_gold.domain import Observation, Scope, Period, SegmentationScheme
+from data_gold.repository import ObservationRepository
+
+
+class CachedObservationRepository(ObservationRepository):
+    # Totals of another repository, cached by period: an entry holds the totals of every offer segment of the
+    # segmentation scheme for one period, filled as scopes ask for them. Shifted scopes of lag featurizers and the
+    # training scope then only aggregate the (offer segment, period) cells that no previous scope has covered.
+    # The least recently used periods are evicted above max_periods entries.
+    def __init__(self, observation_repository: ObservationRepository, max_periods: int = 1024):
+        self.observation_repository = observation_repository
+        self.max_periods = max_periods
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # The cached schemes are kept alive, so that their ids stay unique
+        self._segmentation_schemes = {}
+        self._segment_positions = {}
+        # Featurizers running in threads share the cache. The lock only guards the entries: the queries of missing
+        # cells run outside of it, concurrently, and are written back under it
+        self._lock = threading.RLock()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._segmentation_schemes.clear()
+            self._segment_positions.clear()
+
+    def invalidate(self, periods: list[Period]):
+        # To be called when the transactions of these periods change
+        periods = set(periods)
+        with self._lock:
+            for key in [key for key in self._entries if key[1] in periods]:
+                del self._entries[key]
+
+    def invalidate_dates(self, dates: list[str]):
+        # To be called when the transactions of these dates change (e.g. appended days): the periods holding them are
+        # invalidated in every cached segmentation scheme
+        with self._lock:
+            periods = [period for segmentation_scheme in self._segmentation_schemes.values()
+                       for period in map(segmentation_scheme.horizon.date_to_period.get, dates) if period is not None]
+            self.invalidate(periods)
+
+    def find(self, scope: Scope) -> list[Observation]:
+        totals = self.find_total_sales_qty(scope).ravel().tolist()
+        return [Observation(offer_segment_period=offer_segment_period, total_sales_qty=total)
+                for offer_segment_period, total in zip(scope.offer_segment_periods, totals)]
+
+    def _get_segment_positions(self, segmentation_scheme: SegmentationScheme, scope: Scope) -> np.ndarray:
+        key = id(segmentation_scheme)
+        if key not in self._segment_positions:
+            self._segmentation_schemes[key] = segmentation_scheme
+            self._segment_positions[key] = {offer_segment: i
+                                            for i, offer_segment in enumerate(segmentation_scheme.offer_segments)}
+        positions = self._segment_positions[key]
+        return np.array([positions.get(offer_segment, -1) for offer_segment in scope.offer_segments], dtype=int)
+
+    def _get_entry(self, key: tuple, n_segments: int) -> tuple[np.ndarray, np.ndarray]:
+        # (totals, known) over the offer segments of the scheme
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = (np.zeros(n_segments), np.zeros(n_segments, dtype=bool))
+            self._entries[key] = entry
+        else:
+            self._entries.move_to_end(key)
+        return entry
+
+    def find_total_sales_qty(self, scope: Scope) -> np.ndarray:
+        segmentation_scheme = scope.segmentation_scheme
+        with self._lock:
+            segment_positions = self._get_segment_positions(segmentation_scheme, scope)
+            cached = not (segment_positions < 0).any() and len(scope.periods) <= self.max_periods
+            if not cached:
+                # Offer segments outside of the scheme, or more periods than the cache can hold
+                self.misses += len(scope.offer_segments) * len(scope.periods)
+            else:
+                n_segments = len(segmentation_scheme.offer_segments)
+                entries = [self._get_entry((id(segmentation_scheme), period), n_segments) for period in scope.periods]
+                known = np.stack([entry_known[segment_positions] for _, entry_known in entries], axis=1) \
+                    if entries else np.ones((len(scope.offer_segments), 0), dtype=bool)
+                missing = ~known
+                n_missing = int(missing.sum())
+                self.hits += known.size - n_missing
+                self.misses += n_missing
+        if not cached:
+            return self.observation_repository.find_total_sales_qty(scope)
+
+        missing_totals = None
+        if n_missing:
+            # One query for the offer segments and periods having at least one missing cell
+            missing_segments = np.flatnonzero(missing.any(axis=1))
+            missing_periods = np.flatnonzero(missing.any(axis=0))
+            missing_scope = replace(scope,
+                                    offer_segments=[scope.offer_segments[i] for i in missing_segments],
+                                    periods=[scope.periods[j] for j in missing_periods])
+            missing_totals = self.observation_repository.find_total_sales_qty(missing_scope)
+
+        with self._lock:
+            # Entries evicted or invalidated in the meantime are no longer in the cache: writing to them is harmless
+            if missing_totals is not None:
+                for k, j in enumerate(missing_periods):
+                    entry_totals, entry_known = entries[j]
+                    entry_totals[segment_positions[missing_segments]] = missing_totals[:, k]
+                    entry_known[segment_positions[missing_segments]] = True
+            totals = np.stack([entry_totals[segment_positions] for entry_totals, _ in entries], axis=1) \
+                if entries else np.zeros((len(scope.offer_segments), 0))
+            while len(self._entries) > self.max_periods:
+                self._entries.popitem(last=False)
+        return totals
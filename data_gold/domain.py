@@ -1,4 +1,9 @@
 from dataclasses import dataclass
+from functools import cached_property
+
+import numpy as np
+
+from data_silver.domain import SkuStoreDateIndex
 
 
 @dataclass(frozen=True)
@@ -46,7 +51,7 @@ class SegmentationScheme:
     sku_segmentation: SkuSegmentation
     horizon: Horizon
 
-    @property
+    @cached_property
     def offer_segments(self):
         result = []
         for store_group_name in self.store_segmentation.store_groups:
@@ -109,7 +114,7 @@ class Scope:
     offer_segments: list[OfferSegment]
     periods: list[Period]
 
-    @property
+    @cached_property
     def offer_segment_periods(self):
         result = []
         for offer_segment in self.offer_segments:
@@ -117,6 +122,33 @@ class Scope:
                 result.append(OfferSegmentPeriod(offer_segment.store_group_name,offer_segment.sku_group_name, period))
         return result
 
-    @property
+    @cached_property
     def sku_store_dates(self):
         return OfferSegmentPeriod.to_sku_store_dates(self.segmentation_scheme, self.offer_segment_periods)
+
+    @cached_property
+    def sku_store_date_index(self) -> SkuStoreDateIndex:
+        # Same content as sku_store_dates, as (sku, store) pairs and dates rather than their cross product
+        skus, stores, dates = {}, {}, {}
+
+        def positions(values, position_by_value):
+            return np.array([position_by_value.setdefault(v, len(position_by_value)) for v in values], dtype=np.int32)
+
+        period_to_dates = self.segmentation_scheme.horizon.period_to_dates
+        date_idx = positions([d for period in self.periods for d in period_to_dates[period]], dates)
+
+        sku_idx, store_idx = [np.empty(0, dtype=np.int32)], [np.empty(0, dtype=np.int32)]
+        for offer_segment in self.offer_segments:
+            sku_group = self.segmentation_scheme.sku_segmentation.sku_groups[offer_segment.sku_group_name]
+            store_group = self.segmentation_scheme.store_segmentation.store_groups[offer_segment.store_group_name]
+            sku_positions = positions(sku_group.skus, skus)
+            store_positions = positions(store_group.stores, stores)
+            sku_idx.append(np.repeat(sku_positions, len(store_positions)))
+            store_idx.append(np.tile(store_positions, len(sku_positions)))
+
+        return SkuStoreDateIndex(skus=np.array(list(skus), dtype=object),
+                                 stores=np.array(list(stores), dtype=object),
+                                 dates=np.array(list(dates), dtype=object),
+                                 sku_idx=np.concatenate(sku_idx),
+                                 store_idx=np.concatenate(store_idx),
+                                 date_idx=date_idx)
@@ -1,7 +1,9 @@
-from collections import defaultdict
+import numpy as np
+import pandas as pd
 
-from data_gold.domain import Observation, Scope, SkuGroup, OfferSegmentPeriod, PriceDistribution, StoreGroup
+from data_gold.domain import Observation, Scope, SkuGroup, OfferSegmentPeriod, PriceDistribution
 from data_gold.repository import ObservationRepository, PriceRepository, SkuStatusRepository
+from data_silver.arrays import ensure_capacity
 from data_silver.domain import SkuDetails, PriceHistory, SkuHistory
 from data_silver.repository import TransactionRepository, PriceHistoryRepository, SkuHistoryRepository
 
@@ -15,31 +17,50 @@ class BasicObservationRepository(ObservationRepository):
             self.sku_details_by_sku[sku_details.sku_number] = sku_details
 
     def find(self, scope: Scope) -> list[Observation]:
-
-        sku_store_dates = scope.sku_store_dates
-
-        bookings_by_sku_and_period = defaultdict(float)
-        transaction_list = self.transaction_repository.find_by_sku_store_and_date(sku_store_dates)
-        for transaction in transaction_list:
-            period = scope.segmentation_scheme.horizon.date_to_period[transaction.transaction_date]
-            bookings_by_sku_and_period[transaction.sku_number, period] += transaction.sales_qty
-
-        bookings_by_offer_segment_period = defaultdict(float)
-        for offer_segment in scope.offer_segments:
-            for period in scope.periods:
-                offer_segment_period = OfferSegmentPeriod(sku_group_name=offer_segment.sku_group_name,
-                                                          store_group_name=offer_segment.store_group_name,
-                                                          period=period)
-                sku_group: SkuGroup = scope.segmentation_scheme.sku_segmentation.sku_groups[
-                    offer_segment.sku_group_name]
-                for sku in sku_group.skus:
-                    bookings_by_offer_segment_period[offer_segment_period] += bookings_by_sku_and_period[sku, period]
-
-        result = []
-        for k, v in bookings_by_offer_segment_period.items():
-            result.append(Observation(offer_segment_period=k, total_sales_qty=v))
-
-        return result
+        # offer_segment_periods enumerates offer segments then periods, like the rows and columns of the totals
+        totals = self.find_total_sales_qty(scope).ravel().tolist()
+        return [Observation(offer_segment_period=offer_segment_period, total_sales_qty=total)
+                for offer_segment_period, total in zip(scope.offer_segment_periods, totals)]
+
+    def find_total_sales_qty(self, scope: Scope) -> np.ndarray:
+        segmentation_scheme = scope.segmentation_scheme
+        transactions = self.transaction_repository.find_by_sku_store_date_index(scope.sku_store_date_index)
+
+        # Integer codes are computed once per distinct sku, store and date, then broadcast to the transactions
+        sku_group_positions = {name: i for i, name in enumerate(segmentation_scheme.sku_segmentation.sku_groups)}
+        store_group_positions = {name: i for i, name in enumerate(segmentation_scheme.store_segmentation.store_groups)}
+        period_positions = {period: i for i, period in enumerate(scope.periods)}
+
+        sku_codes, skus = pd.factorize(transactions.sku_number)
+        sku_to_sku_group = segmentation_scheme.sku_segmentation.sku_to_sku_group
+        sku_group_codes = np.array([sku_group_positions.get(sku_to_sku_group.get(sku), -1) for sku in skus],
+                                   dtype=int)[sku_codes]
+
+        store_codes, stores = pd.factorize(transactions.store_number)
+        store_to_store_group = segmentation_scheme.store_segmentation.store_to_store_group
+        store_group_codes = np.array([store_group_positions.get(store_to_store_group.get(store), -1)
+                                      for store in stores], dtype=int)[store_codes]
+
+        date_codes, dates = pd.factorize(transactions.transaction_date)
+        date_to_period = segmentation_scheme.horizon.date_to_period
+        period_codes = np.array([period_positions.get(date_to_period.get(date), -1) for date in dates],
+                                dtype=int)[date_codes]
+
+        segment_by_group = np.full((len(store_group_positions), len(sku_group_positions)), -1, dtype=int)
+        for i, offer_segment in enumerate(scope.offer_segments):
+            segment_by_group[store_group_positions[offer_segment.store_group_name],
+                             sku_group_positions[offer_segment.sku_group_name]] = i
+
+        valid = (sku_group_codes >= 0) & (store_group_codes >= 0) & (period_codes >= 0)
+        segment_codes = segment_by_group[store_group_codes[valid], sku_group_codes[valid]]
+        period_codes = period_codes[valid]
+        sales_qty = np.asarray(transactions.sales_qty, dtype=np.float64)[valid]
+        valid = segment_codes >= 0
+
+        n_periods = len(scope.periods)
+        totals = np.bincount(segment_codes[valid] * n_periods + period_codes[valid], weights=sales_qty[valid],
+                             minlength=len(scope.offer_segments) * n_periods)
+        return totals.reshape(len(scope.offer_segments), n_periods)
 
 class BasicPriceRepository(PriceRepository):
 
@@ -48,32 +69,113 @@ class BasicPriceRepository(PriceRepository):
         self.sku_details_by_sku = {}
         for sku_details in all_sku_details:
             self.sku_details_by_sku[sku_details.sku_number] = sku_details
+        self._build_price_cube()
+
+    def _build_price_cube(self):
+        # Dense (sku, store, price change date) cube of prices, NaN where the sku is not sold
+        price_histories = self.price_history_repository.find_all()
+        self.sku_positions = {}
+        self.store_positions = {}
+        for price_history in price_histories:
+            self.sku_positions.setdefault(price_history.sku_number, len(self.sku_positions))
+            self.store_positions.setdefault(price_history.store_number, len(self.store_positions))
+        lengths = [len(price_history.change_dates) for price_history in price_histories]
+        change_dates = np.concatenate([price_history.change_dates for price_history in price_histories] +
+                                      [np.empty(0, dtype=object)])
+        date_codes, dates = pd.factorize(change_dates)
+        date_order = np.argsort(dates)
+        self.price_change_dates = dates[date_order]
+        date_positions = np.empty(len(dates), dtype=int)
+        date_positions[date_order] = np.arange(len(dates))
+
+        # price_cube is a view of a buffer with room for the skus, stores and dates added later
+        self._price_cube_buffer = np.full((len(self.sku_positions), len(self.store_positions),
+                                           len(self.price_change_dates)), np.nan)
+        self.price_cube = self._price_cube_buffer
+        self.price_cube[np.repeat([self.sku_positions[h.sku_number] for h in price_histories], lengths),
+                        np.repeat([self.store_positions[h.store_number] for h in price_histories], lengths),
+                        date_positions[date_codes]] = \
+            np.concatenate([price_history.prices for price_history in price_histories] + [np.empty(0)])
+
+    def update_price_histories(self, price_histories: list[PriceHistory]):
+        # Rewrites the prices of the given histories only. New skus, stores and later change dates extend the cube;
+        # a change date falling between known ones needs the cube to be rebuilt.
+        if not price_histories:
+            return
+        lengths = [len(price_history.change_dates) for price_history in price_histories]
+        change_dates = np.concatenate([price_history.change_dates for price_history in price_histories])
+        dates = pd.unique(change_dates)
+        new_dates = np.sort(dates[pd.Index(self.price_change_dates).get_indexer(dates) < 0])
+        if len(new_dates) and len(self.price_change_dates) and new_dates[0] < self.price_change_dates[-1]:
+            self._build_price_cube()
+            return
+
+        sku_positions = [self.sku_positions.setdefault(h.sku_number, len(self.sku_positions)) for h in price_histories]
+        store_positions = [self.store_positions.setdefault(h.store_number, len(self.store_positions))
+                           for h in price_histories]
+        self.price_change_dates = np.concatenate([self.price_change_dates, new_dates])
+        shape = (len(self.sku_positions), len(self.store_positions), len(self.price_change_dates))
+        self._price_cube_buffer = ensure_capacity(self._price_cube_buffer, shape, np.nan)
+        self.price_cube = self._price_cube_buffer[:shape[0], :shape[1], :shape[2]]
+
+        self.price_cube[sku_positions, store_positions, :] = np.nan
+        self.price_cube[np.repeat(sku_positions, lengths), np.repeat(store_positions, lengths),
+                        np.searchsorted(self.price_change_dates, change_dates)] = \
+            np.concatenate([price_history.prices for price_history in price_histories])
+
+    def _find_prices(self, scope: Scope) -> tuple[np.ndarray, np.ndarray]:
+        # Every observed price of the scope, with the position of its offer segment period in
+        # scope.offer_segment_periods
+        segmentation_scheme = scope.segmentation_scheme
+        pair_segments, pair_skus, pair_stores = [], [], []
+        for i, offer_segment in enumerate(scope.offer_segments):
+            sku_group = segmentation_scheme.sku_segmentation.sku_groups[offer_segment.sku_group_name]
+            store_group = segmentation_scheme.store_segmentation.store_groups[offer_segment.store_group_name]
+            for sku in sku_group.skus:
+                for store in store_group.stores:
+                    if sku in self.sku_positions and store in self.store_positions:
+                        pair_segments.append(i)
+                        pair_skus.append(self.sku_positions[sku])
+                        pair_stores.append(self.store_positions[store])
+
+        period_starts = np.searchsorted(self.price_change_dates, [p.start for p in scope.periods], side='left')
+        period_ends = np.searchsorted(self.price_change_dates, [p.end for p in scope.periods], side='right')
+        week_periods = np.repeat(np.arange(len(scope.periods)), period_ends - period_starts)
+        weeks = np.concatenate([np.arange(s, e) for s, e in zip(period_starts, period_ends)] + [np.empty(0, dtype=int)])
+
+        prices = self.price_cube[np.array(pair_skus, dtype=int)[:, None], np.array(pair_stores, dtype=int)[:, None],
+                                 weeks[None, :]]
+        codes = np.array(pair_segments, dtype=int)[:, None] * len(scope.periods) + week_periods[None, :]
+        observed = ~np.isnan(prices)
+        return codes[observed], prices[observed]
 
     def find(self, scope: Scope) -> list[PriceDistribution]:
+        codes, prices = self._find_prices(scope)
+
+        # Histogram of the prices of each offer segment period: sort by (period, price), then count the runs
+        order = np.lexsort((prices, codes))
+        codes, prices = codes[order], prices[order]
+        run_starts = np.flatnonzero(np.r_[True, (codes[1:] != codes[:-1]) | (prices[1:] != prices[:-1])])
+        run_codes = codes[run_starts]
+        run_prices = prices[run_starts].tolist()
+        run_probabilities = (np.diff(np.r_[run_starts, len(codes)]) /
+                             np.bincount(codes, minlength=len(scope.offer_segment_periods))[run_codes]).tolist()
+        code_starts = np.searchsorted(run_codes, np.arange(len(scope.offer_segment_periods) + 1))
 
         result = []
-        for offer_segment in scope.offer_segments:
-            sku_group: SkuGroup = scope.segmentation_scheme.sku_segmentation.sku_groups[offer_segment.sku_group_name]
-            store_group : StoreGroup = scope.segmentation_scheme.store_segmentation.store_groups[offer_segment.store_group_name]
-
-
-        occurrences_by_price = defaultdict(int)
-        for sku in sku_group.skus:
-            for store in store_group.stores:
-                price_history = self.price_history_repository.find_by_sku_and_store_number(sku, store)
-                for period in scope.periods:
-                    prices = price_history.find_observed_prices(period.start, period.end)
-                    for price in prices:
-                        occurrences_by_price[price] += 1
-                    total = sum(v for v in occurrences_by_price.values())
-                    probabilities_by_price = {k: v / total for k, v in occurrences_by_price.items()}
-                    price_distribution = PriceDistribution(
-                        OfferSegmentPeriod(offer_segment.store_group_name, offer_segment.sku_group_name, period),
-                        probabilities_by_price)
-                    result.append(price_distribution)
-
+        for i, offer_segment_period in enumerate(scope.offer_segment_periods):
+            start, end = code_starts[i], code_starts[i + 1]
+            result.append(PriceDistribution(offer_segment_period,
+                                            dict(zip(run_prices[start:end], run_probabilities[start:end]))))
         return result
 
+    def find_mean_price(self, scope: Scope) -> np.ndarray:
+        codes, prices = self._find_prices(scope)
+        n = len(scope.offer_segment_periods)
+        with np.errstate(invalid='ignore'):
+            mean_prices = np.bincount(codes, weights=prices, minlength=n) / np.bincount(codes, minlength=n)
+        return mean_prices.reshape(len(scope.offer_segments), len(scope.periods))
+
 class BasicSkuStatusRepository(SkuStatusRepository):
 
     def __init__(self, sku_history_repository: SkuHistoryRepository, all_sku_details: list[SkuDetails]):
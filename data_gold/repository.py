@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
 
+import numpy as np
+
 from data_gold.domain import Observation, Scope, PriceDistribution, SkuStatusDistribution
 
 
@@ -9,6 +11,17 @@ class ObservationRepository(ABC):
     def find(self, scope: Scope) -> list[Observation]:
         pass
 
+    def find_total_sales_qty(self, scope: Scope) -> np.ndarray:
+        # (offer segment x period) totals, in the order of scope.offer_segments and scope.periods
+        segment_positions = {offer_segment: i for i, offer_segment in enumerate(scope.offer_segments)}
+        period_positions = {period: i for i, period in enumerate(scope.periods)}
+        totals = np.zeros((len(scope.offer_segments), len(scope.periods)))
+        for obs in self.find(scope):
+            offer_segment_period = obs.offer_segment_period
+            totals[segment_positions[offer_segment_period.offer_segment],
+                   period_positions[offer_segment_period.period]] = obs.total_sales_qty
+        return totals
+
 
 class PriceRepository(ABC):
 
@@ -16,6 +29,19 @@ class PriceRepository(ABC):
     def find(self, scope: Scope) -> list[PriceDistribution]:
         pass
 
+    def find_mean_price(self, scope: Scope) -> np.ndarray:
+        # (offer segment x period) expected prices, in the order of scope.offer_segments and scope.periods
+        segment_positions = {offer_segment: i for i, offer_segment in enumerate(scope.offer_segments)}
+        period_positions = {period: i for i, period in enumerate(scope.periods)}
+        mean_prices = np.full((len(scope.offer_segments), len(scope.periods)), np.nan)
+        for price_distribution in self.find(scope):
+            offer_segment_period = price_distribution.offer_segment_period
+            if price_distribution.price_probabilities:
+                mean_prices[segment_positions[offer_segment_period.offer_segment],
+                            period_positions[offer_segment_period.period]] = \
+                    sum(k * v for k, v in price_distribution.price_probabilities.items())
+        return mean_prices
+
 
 class SkuStatusRepository(ABC):
 
@@ -0,0 +1,12 @@
+import numpy as np
+
+
+def ensure_capacity(buffer: np.ndarray, shape: tuple, fill_value) -> np.ndarray:
+    # Returns the buffer itself when it can hold shape, otherwise a larger copy: axes that must grow get at least a
+    # quarter more room, so that appending items one batch at a time stays linear in the number of items appended
+    if all(n <= c for n, c in zip(shape, buffer.shape)):
+        return buffer
+    grown_shape = tuple(c if n <= c else max(n, c + c // 4 + 1) for n, c in zip(shape, buffer.shape))
+    grown = np.full(grown_shape, fill_value, dtype=buffer.dtype)
+    grown[tuple(slice(0, c) for c in buffer.shape)] = buffer
+    return grown
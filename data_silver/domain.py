@@ -1,8 +1,8 @@
-from bisect import bisect_right, bisect_left
 from dataclasses import dataclass
 from datetime import datetime
 from typing import NamedTuple
 
+import numpy as np
 from pandas import DataFrame
 
 
@@ -25,16 +25,18 @@ class PriceHistory:
     sku_number: str
     store_number: str
 
-    price_changes : list[tuple[str,float]]
+    # Views over arrays shared by every price history, sorted by date
+    change_dates : np.ndarray
+    prices : np.ndarray
+
+    @property
+    def price_changes(self) -> list[tuple[str,float]]:
+        return list(zip(self.change_dates.tolist(), self.prices.tolist()))
 
     def find_observed_prices(self, start_date : str, end_date)->list[float]:
-        big_number = 99999999999.0
-        start = bisect_right(self.price_changes, (start_date,-big_number))
-        end = bisect_left(self.price_changes, (end_date,big_number))
-        prices = []
-        for i in range(start,end):
-            prices.append(self.price_changes[i])
-        return prices
+        start = np.searchsorted(self.change_dates, start_date, side='left')
+        end = np.searchsorted(self.change_dates, end_date, side='right')
+        return list(zip(self.change_dates[start:end].tolist(), self.prices[start:end].tolist()))
 
 
 @dataclass
@@ -54,3 +56,37 @@ class Transaction(NamedTuple):
     sku_number : str
     sales_qty: float
 
+
+@dataclass(frozen=True)
+class TransactionColumns:
+
+    transaction_date : np.ndarray
+    store_number : np.ndarray
+    sku_number : np.ndarray
+    sales_qty : np.ndarray
+
+    def __len__(self):
+        return len(self.sales_qty)
+
+
+@dataclass(frozen=True)
+class SkuStoreDateIndex:
+
+    # Distinct values referenced by the positions below
+    skus : np.ndarray
+    stores : np.ndarray
+    dates : np.ndarray
+
+    # One entry per (sku, store) pair, and one per date: every pair spans every date
+    sku_idx : np.ndarray
+    store_idx : np.ndarray
+    date_idx : np.ndarray
+
+    def __len__(self):
+        return len(self.sku_idx) * len(self.date_idx)
+
+    def to_sku_store_dates(self) -> list[tuple[str, str, str]]:
+        n_dates = len(self.date_idx)
+        return list(zip(np.repeat(self.skus[self.sku_idx], n_dates),
+                        np.repeat(self.stores[self.store_idx], n_dates),
+                        np.tile(self.dates[self.date_idx], len(self.sku_idx))))
@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 
-from data_silver.domain import Transaction
+from data_silver.domain import TransactionColumns, SkuStoreDateIndex
 
 
 class StoreDetailsRepository(ABC):
@@ -68,9 +68,12 @@ class SkuHistoryRepository(ABC):
 class TransactionRepository(ABC):
 
     @abstractmethod
-    def find_by_category(self, label_type : str, label: str, start_date: str, end_date: str)->list[Transaction]:
+    def find_by_category(self, label_type : str, label: str, start_date: str, end_date: str) -> TransactionColumns:
         pass
 
     @abstractmethod
-    def find_by_sku_store_and_date(self, sku_store_dates: list[str, str, str]) -> list[Transaction]:
+    def find_by_sku_store_and_date(self, sku_store_dates: list[str, str, str]) -> TransactionColumns:
         pass
+
+    def find_by_sku_store_date_index(self, sku_store_date_index: SkuStoreDateIndex) -> TransactionColumns:
+        return self.find_by_sku_store_and_date(sku_store_date_index.to_sku_store_dates())
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import uuid
+from dataclasses import replace
+from typing import Any, Callable, Optional, Union
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from data_gold.domain import Scope, OfferSegmentPeriod, SegmentationScheme
+from model.featurizer import Featurizer, FeatureMatrix
+
+
+KEY_COLUMNS = ['store_group_name', 'sku_group_name', 'period_index']
+# Written with the first features of a fingerprint, ignored by the dataset readers
+METADATA_FILE = '_featurizer.json'
+
+
+class FeatureStore:
+    # Features of featurizers, persisted by fingerprint of the featurizer configuration. Each fingerprint is a parquet
+    # dataset in store_group_name=<store group> directories, keyed by (store group, sku group, period index): a scope
+    # reads only the directories of its store groups and the rows of its sku groups and periods.
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def fingerprint(self, featurizer: Featurizer, data_key: str, segmentation_scheme: SegmentationScheme) -> str:
+        # The config of the featurizer, data_key for the data its repositories serve (e.g. their source files), and the
+        # segmentation scheme: the features of an offer segment period depend on the stores and skus of its groups,
+        # and lags on the periods of the horizon
+        config = json.dumps({'featurizer': featurizer.config(),
+                             'data_key': data_key,
+                             'store_groups': {name: sorted(store_group.stores) for name, store_group
+                                              in segmentation_scheme.store_segmentation.store_groups.items()},
+                             'sku_groups': {name: sorted(sku_group.skus) for name, sku_group
+                                            in segmentation_scheme.sku_segmentation.sku_groups.items()},
+                             'periods': [[period.index, period.start, period.end]
+                                         for period in segmentation_scheme.horizon.periods]},
+                            sort_keys=True)
+        return hashlib.sha1(config.encode()).hexdigest()
+
+    def _get_directory(self, fingerprint: str) -> str:
+        return os.path.join(self.directory, fingerprint)
+
+    def write(self, fingerprint: str, feature_matrix: FeatureMatrix, featurizer: Featurizer = None):
+        # Adds the rows of the matrix to the features of the fingerprint, as one file per store group
+        directory = self._get_directory(fingerprint)
+        metadata_path = os.path.join(directory, METADATA_FILE)
+        if not os.path.exists(metadata_path):
+            os.makedirs(directory, exist_ok=True)
+            with open(metadata_path, 'w') as f:
+                json.dump({'featurizer': None if featurizer is None else featurizer.config(),
+                           'feature_names': feature_matrix.feature_names}, f)
+
+        offer_segment_periods = feature_matrix.offer_segment_periods
+        store_group_names = pd.Series([osp.store_group_name for osp in offer_segment_periods], dtype=object)
+        columns = {'sku_group_name': np.array([osp.sku_group_name for osp in offer_segment_periods], dtype=object),
+                   'period_index': np.array([osp.period.index for osp in offer_segment_periods], dtype=np.int64)}
+        columns.update(feature_matrix.columns)
+        part_name = f"part-{uuid.uuid4().hex}.parquet"
+        for store_group_name, rows in store_group_names.groupby(store_group_names, sort=False).indices.items():
+            table = pa.table({name: values[rows] for name, values in columns.items()})
+            store_directory = os.path.join(directory, f"store_group_name={quote(store_group_name, safe='')}")
+            os.makedirs(store_directory, exist_ok=True)
+            pq.write_table(table, os.path.join(store_directory, part_name))
+
+    def find(self, fingerprint: str, scope: Scope) -> Optional[FeatureMatrix]:
+        # The features of every offer segment period of the scope, or None if some are not stored
+        feature_matrix, stored = self.find_stored(fingerprint, scope)
+        return feature_matrix if stored.all() else None
+
+    def find_stored(self, fingerprint: str, scope: Scope) -> tuple[Optional[FeatureMatrix], np.ndarray]:
+        # The features of the offer segment periods of the scope, and whether each one is stored: the values of the
+        # others are undefined. The matrix is None when nothing is stored under the fingerprint.
+        n = len(scope.offer_segment_periods)
+        directory = self._get_directory(fingerprint)
+        if not os.path.exists(os.path.join(directory, METADATA_FILE)):
+            return None, np.zeros(n, dtype=bool)
+        store_group_names = list(dict.fromkeys(segment.store_group_name for segment in scope.offer_segments))
+        sku_group_names = list(dict.fromkeys(segment.sku_group_name for segment in scope.offer_segments))
+        period_indexes = [period.index for period in scope.periods]
+        dataset = ds.dataset(directory, format='parquet', partitioning='hive')
+        table = dataset.to_table(filter=ds.field('store_group_name').isin(store_group_names) &
+                                 ds.field('sku_group_name').isin(sku_group_names) &
+                                 ds.field('period_index').isin(period_indexes))
+
+        # Position of each stored row in scope.offer_segment_periods, -1 for rows of other offer segments
+        segment_index = pd.MultiIndex.from_tuples([(offer_segment.store_group_name, offer_segment.sku_group_name)
+                                                   for offer_segment in scope.offer_segments])
+        segment_positions = segment_index.get_indexer(pd.MultiIndex.from_arrays(
+            [table['store_group_name'].to_numpy().astype(str), table['sku_group_name'].to_numpy(zero_copy_only=False)]))
+        period_positions = pd.Index(period_indexes).get_indexer(table['period_index'].to_numpy())
+        valid = (segment_positions >= 0) & (period_positions >= 0)
+        positions = segment_positions[valid] * len(scope.periods) + period_positions[valid]
+
+        stored = np.bincount(positions, minlength=n) > 0
+        columns = {}
+        for name in table.column_names:
+            if name in KEY_COLUMNS:
+                continue
+            values = table[name].to_numpy(zero_copy_only=False)[valid]
+            column = np.empty(n, dtype=values.dtype)
+            column[positions] = values
+            columns[name] = column
+        return FeatureMatrix(scope.offer_segment_periods, columns), stored
+
+
+class StoredFeaturizer(Featurizer):
+    # Features of another featurizer, read from the feature store for the offer segment periods of the scope stored
+    # under its fingerprint. The others are computed, and stored for the next runs.
+    def __init__(self, featurizer: Featurizer, feature_store: FeatureStore, data_key: Union[str, Callable[[], str]]):
+        self.featurizer = featurizer
+        self.feature_store = feature_store
+        # Identifies the data of the repositories of the featurizer. A function is called at each build, for data that
+        # changes between builds (e.g. appended days).
+        self.data_key = data_key
+
+    def config(self) -> dict[str, Any]:
+        return self.featurizer.config()
+
+    def get_fingerprint(self, segmentation_scheme: SegmentationScheme) -> str:
+        data_key = self.data_key() if callable(self.data_key) else self.data_key
+        return self.feature_store.fingerprint(self.featurizer, data_key, segmentation_scheme)
+
+    def build_features(self, scope: Scope) -> dict[OfferSegmentPeriod, dict[str, Any]]:
+        return self.build_feature_matrix(scope).to_features()
+
+    def build_feature_matrix(self, scope: Scope) -> FeatureMatrix:
+        fingerprint = self.get_fingerprint(scope.segmentation_scheme)
+        stored_matrix, stored = self.feature_store.find_stored(fingerprint, scope)
+        if stored_matrix is not None and stored.all():
+            return stored_matrix
+
+        # The features are computed for the offer segments and periods having at least one missing offer segment
+        # period, and only the missing ones are written
+        missing = ~stored.reshape(len(scope.offer_segments), len(scope.periods))
+        missing_segments = np.flatnonzero(missing.any(axis=1))
+        missing_periods = np.flatnonzero(missing.any(axis=0))
+        missing_scope = replace(scope,
+                                offer_segments=[scope.offer_segments[i] for i in missing_segments],
+                                periods=[scope.periods[j] for j in missing_periods])
+        computed_matrix = self.featurizer.build_feature_matrix(missing_scope)
+        # Positions of the computed offer segment periods in the scope, and those to write
+        positions = (missing_segments[:, None] * len(scope.periods) + missing_periods[None, :]).ravel()
+        written = ~stored[positions]
+        self.feature_store.write(fingerprint,
+                                 FeatureMatrix([missing_scope.offer_segment_periods[k] for k in np.flatnonzero(written)],
+                                               {name: values[written]
+                                                for name, values in computed_matrix.columns.items()}),
+                                 self.featurizer)
+        if stored_matrix is None:
+            return computed_matrix
+
+        columns = {}
+        for name, values in computed_matrix.columns.items():
+            stored_values = stored_matrix.columns.get(name)
+            column = np.empty(len(stored), dtype=values.dtype) if stored_values is None else \
+                stored_values.astype(np.result_type(stored_values, values))
+            column[positions[written]] = values[written]
+            columns[name] = column
+        return FeatureMatrix(scope.offer_segment_periods, columns)
@@ -1,9 +1,14 @@
+import hashlib
+import logging
 import math
-from abc import ABC
-from dataclasses import replace
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
 from numbers import Number
 from typing import Any
 
+import numpy as np
 import pandas as pd
 from pandas import DataFrame
 
@@ -12,11 +17,104 @@ from data_gold.domain import Scope, \
 from data_gold.repository import ObservationRepository, PriceRepository, SkuStatusRepository
 
 
+@dataclass(frozen=True)
+class FeatureMatrix:
+    # Named feature columns, one value per offer segment period of the row index: float columns for numeric
+    # features, object columns for categorical ones
+    offer_segment_periods: list[OfferSegmentPeriod]
+    columns: dict[str, np.ndarray]
+
+    @property
+    def feature_names(self) -> list[str]:
+        return list(self.columns)
+
+    @property
+    def categorical_feature_names(self) -> list[str]:
+        return [name for name, values in self.columns.items() if values.dtype == object]
+
+    def to_array(self, feature_names: list[str] = None) -> np.ndarray:
+        # (row x feature) array of the numeric features, in the given order
+        feature_names = self.feature_names if feature_names is None else feature_names
+        return np.column_stack([self.columns[name] for name in feature_names] +
+                               [np.empty((len(self.offer_segment_periods), 0))])
+
+    def to_features(self) -> dict[OfferSegmentPeriod, dict[str, Any]]:
+        names = self.feature_names
+        rows = zip(*[self.columns[name].tolist() for name in names]) if names else \
+            ([] for _ in self.offer_segment_periods)
+        return {offer_segment_period: dict(zip(names, row))
+                for offer_segment_period, row in zip(self.offer_segment_periods, rows)}
+
+    @staticmethod
+    def stack(matrices: list['FeatureMatrix']) -> 'FeatureMatrix':
+        # The columns are shared, not copied: every matrix must have the same row index, and its own feature names
+        offer_segment_periods = matrices[0].offer_segment_periods
+        columns = {}
+        for matrix in matrices:
+            if matrix.offer_segment_periods is not offer_segment_periods and \
+                    matrix.offer_segment_periods != offer_segment_periods:
+                raise ValueError("Feature matrices with different offer segment periods cannot be stacked")
+            duplicate_names = [name for name in matrix.columns if name in columns]
+            if duplicate_names:
+                raise ValueError(f"Features {duplicate_names} are built by several featurizers")
+            columns.update(matrix.columns)
+        return FeatureMatrix(offer_segment_periods, columns)
+
+
 class Featurizer(ABC):
 
     def build_features(self, scope: Scope) -> dict[OfferSegmentPeriod, dict[str, Any]]:
         pass
 
+    @abstractmethod
+    def config(self) -> dict[str, Any]:
+        # The class and parameters that determine the features, as JSON values: feature stores fingerprint it.
+        # Repositories, execution settings (e.g. n_jobs) and timings are not part of it.
+        pass
+
+    def build_feature_matrix(self, scope: Scope) -> FeatureMatrix:
+        # Columns over scope.offer_segment_periods. By default, converted from build_features, with 0 (or '' for
+        # categorical features) where an offer segment period has no value for a feature
+        features_by_offer_segment_period = self.build_features(scope)
+        names = dict.fromkeys(name for features in features_by_offer_segment_period.values() for name in features)
+        columns = {}
+        for name in names:
+            values = [features_by_offer_segment_period.get(offer_segment_period, {}).get(name)
+                      for offer_segment_period in scope.offer_segment_periods]
+            categorical = any(isinstance(value, str) for value in values)
+            missing = '' if categorical else 0
+            values = [missing if value is None else value for value in values]
+            columns[name] = np.array(values, dtype=object if categorical else float)
+        return FeatureMatrix(scope.offer_segment_periods, columns)
+
+
+# Value of the lag features without a value: lags before the horizon, and periods without prices
+MISSING_LAG = -1
+
+
+def _find_lagged_values(scope: Scope, lags: list[int], find_values) -> np.ndarray:
+    # (lag x offer segment x period) values of the horizon period lag periods before each period of the scope. The
+    # union of the lagged periods is queried once with find_values. A lagged period that is not in the horizon (before
+    # its start, or filtered out of it) is MISSING_LAG: it never wraps around to a later period.
+    horizon_periods = scope.segmentation_scheme.horizon.periods
+    position_by_index = {period.index: i for i, period in enumerate(horizon_periods)}
+    positions = np.array([[position_by_index.get(period.index - lag, -1) for period in scope.periods] for lag in lags],
+                         dtype=int).reshape(len(lags), len(scope.periods))
+    lagged = positions >= 0
+    needed_positions, columns = np.unique(positions[lagged], return_inverse=True)
+
+    result = np.full((len(lags), len(scope.offer_segments), len(scope.periods)), MISSING_LAG, dtype=float)
+    if len(needed_positions):
+        values = find_values(replace(scope, periods=[horizon_periods[i] for i in needed_positions.tolist()]))
+        lag_rows, period_columns = np.nonzero(lagged)
+        result[lag_rows, :, period_columns] = values[:, columns].T
+    return result
+
+
+def _find_mean_price(price_repository: PriceRepository, scope: Scope) -> np.ndarray:
+    mean_prices = price_repository.find_mean_price(scope)
+    return np.where(np.isnan(mean_prices), MISSING_LAG, mean_prices)
+
 
 class LagSalesFeaturizer(Featurizer):
 
@@ -25,25 +123,15 @@ class LagSalesFeaturizer(Featurizer):
         self.lag_periods = lag_periods
         self.prefix = "lag_sales"
 
+    def config(self) -> dict[str, Any]:
+        return {'class': type(self).__name__, 'lag_periods': self.lag_periods}
+
     def build_features(self, scope: Scope) -> dict[OfferSegmentPeriod, dict[str, Any]]:
-        adjusted_periods = []
-        for period in scope.periods:
-            adjusted_periods.append(scope.segmentation_scheme.horizon.periods[period.index-self.lag_periods])
-        lag_scope = replace(scope,periods=adjusted_periods)
-        observations = self.observation_repository.find(lag_scope)
-        lag_by_offer_segment_period = {}
-        for obs in observations:
-            original_period = scope.segmentation_scheme.horizon.periods[obs.offer_segment_period.period.index+self.lag_periods]
-            lag_by_offer_segment_period[replace(obs.offer_segment_period,period=original_period)] = obs.total_sales_qty
-        result = {}
-        for offer_segment_period in scope.offer_segment_periods:
-            features = {}
-            lag_value = lag_by_offer_segment_period.get(offer_segment_period)
-            if lag_value is None:
-                lag_value = -1
-            features[self.prefix] = lag_value
-            result[offer_segment_period] = features
-        return result
+        return self.build_feature_matrix(scope).to_features()
+
+    def build_feature_matrix(self, scope: Scope) -> FeatureMatrix:
+        totals = _find_lagged_values(scope, [self.lag_periods], self.observation_repository.find_total_sales_qty)
+        return FeatureMatrix(scope.offer_segment_periods, {self.prefix: totals[0].ravel()})
 
 
 class LagPriceFeaturizer(Featurizer):
@@ -53,26 +141,58 @@ class LagPriceFeaturizer(Featurizer):
         self.lag_periods = lag_periods
         self.prefix = "lag_price"
 
+    def config(self) -> dict[str, Any]:
+        return {'class': type(self).__name__, 'lag_periods': self.lag_periods}
+
     def build_features(self, scope: Scope) -> dict[OfferSegmentPeriod, dict[str, Any]]:
-        adjusted_periods = []
-        for period in scope.periods:
-            adjusted_periods.append(scope.segmentation_scheme.horizon.periods[period.index - self.lag_periods])
-        lag_scope = replace(scope, periods=adjusted_periods)
-        price_observations = self.price_repository.find(lag_scope)
-        lag_by_offer_segment_period = {}
-        for obs in price_observations:
-            original_period = scope.segmentation_scheme.horizon.periods[
-                obs.offer_segment_period.period.index + self.lag_periods]
-            lag_by_offer_segment_period[replace(obs.offer_segment_period, period=original_period)] = sum(k[1]*v for k,v in obs.price_probabilities.items())
-        result = {}
-        for offer_segment_period in scope.offer_segment_periods:
-            features = {}
-            lag_value = lag_by_offer_segment_period.get(offer_segment_period)
-            if lag_value is None:
-                lag_value = -1
-            features[self.prefix] = lag_value
-            result[offer_segment_period] = features
-        return result
+        return self.build_feature_matrix(scope).to_features()
+
+    def build_feature_matrix(self, scope: Scope) -> FeatureMatrix:
+        mean_prices = _find_lagged_values(scope, [self.lag_periods],
+                                          lambda lagged_scope: _find_mean_price(self.price_repository, lagged_scope))
+        return FeatureMatrix(scope.offer_segment_periods, {self.prefix: mean_prices[0].ravel()})
+
+
+class MultiLagFeaturizer(Featurizer):
+    # Several lags of one repository value: the union of the lagged periods is queried once, and each lag column is
+    # gathered from the resulting (offer segment x period) array
+    def __init__(self, lags: list[int], prefix: str):
+        self.lags = list(lags)
+        self.prefix = prefix
+
+    def _find_values(self, scope: Scope) -> np.ndarray:
+        pass
+
+    def config(self) -> dict[str, Any]:
+        return {'class': type(self).__name__, 'lags': self.lags}
+
+    def build_features(self, scope: Scope) -> dict[OfferSegmentPeriod, dict[str, Any]]:
+        return self.build_feature_matrix(scope).to_features()
+
+    def build_feature_matrix(self, scope: Scope) -> FeatureMatrix:
+        values = _find_lagged_values(scope, self.lags, self._find_values)
+        return FeatureMatrix(scope.offer_segment_periods,
+                             {f"{self.prefix}_{lag}": values[i].ravel() for i, lag in enumerate(self.lags)})
+
+
+class MultiLagSalesFeaturizer(MultiLagFeaturizer):
+
+    def __init__(self, lags: list[int], observation_repository: ObservationRepository):
+        super().__init__(lags, prefix="lag_sales")
+        self.observation_repository = observation_repository
+
+    def _find_values(self, scope: Scope) -> np.ndarray:
+        return self.observation_repository.find_total_sales_qty(scope)
+
+
+class MultiLagPriceFeaturizer(MultiLagFeaturizer):
+
+    def __init__(self, lags: list[int], price_repository: PriceRepository):
+        super().__init__(lags, prefix="lag_price")
+        self.price_repository = price_repository
+
+    def _find_values(self, scope: Scope) -> np.ndarray:
+        return _find_mean_price(self.price_repository, scope)
 
 
 class SkuStatusFeaturizer(Featurizer):
@@ -81,6 +201,9 @@ class SkuStatusFeaturizer(Featurizer):
         self.lag_periods = lag_periods
         self.prefix = ""
 
+    def config(self) -> dict[str, Any]:
+        return {'class': type(self).__name__, 'lag_periods': self.lag_periods}
+
     def build_features(self, scope: Scope) -> dict[OfferSegmentPeriod, dict[str, Any]]:
         adjusted_periods = []
         for period in scope.periods:
@@ -106,6 +229,9 @@ class LogFeaturizer(Featurizer):
         self.featurizer = featurizer
         self.min_value = 0.00001
 
+    def config(self) -> dict[str, Any]:
+        return {'class': type(self).__name__, 'featurizer': self.featurizer.config(), 'min_value': self.min_value}
+
     def build_features(self, scope: Scope) -> dict[OfferSegmentPeriod, dict[str, Any]]:
         features = self.featurizer.build_features(scope)
         result = {}
@@ -119,6 +245,12 @@ class LogFeaturizer(Featurizer):
             result[offer_segment_period] = transformed_features_dict
         return result
 
+    def build_feature_matrix(self, scope: Scope) -> FeatureMatrix:
+        matrix = self.featurizer.build_feature_matrix(scope)
+        columns = {name: values if values.dtype == object else np.log(np.maximum(self.min_value, values))
+                   for name, values in matrix.columns.items()}
+        return FeatureMatrix(matrix.offer_segment_periods, columns)
+
 
 class Normalizer(Featurizer):
 
@@ -127,6 +259,12 @@ class Normalizer(Featurizer):
         self.featurizer = featurizer
         self.observation_repository = observation_repository
 
+    def config(self) -> dict[str, Any]:
+        return {'class': type(self).__name__, 'featurizer': self.featurizer.config(),
+                'offer_segments': [[offer_segment.store_group_name, offer_segment.sku_group_name]
+                                   for offer_segment in self.scope.offer_segments],
+                'periods': [period.index for period in self.scope.periods]}
+
     def build_features(self, scope: Scope) -> dict[OfferSegmentPeriod, dict[str, Any]]:
         min_value_for_offer_segment = {}
         max_value_for_offer_segment = {}
@@ -163,15 +301,55 @@ class Normalizer(Featurizer):
 
 
 
+def _describe(featurizer: Featurizer) -> str:
+    lag_periods = getattr(featurizer, 'lag_periods', getattr(featurizer, 'lags', None))
+    return type(featurizer).__name__ if lag_periods is None else f"{type(featurizer).__name__}({lag_periods})"
+
+
 class CompositeFeaturizer(Featurizer):
 
-    def __init__(self, featurizers: list[Featurizer]):
+    def __init__(self, featurizers: list[Featurizer], n_jobs: int = 1, logger: logging.Logger = None):
         self.featurizers = featurizers
+        # Above 1, the featurizers run concurrently in a pool of n_jobs threads: their repository queries are mostly
+        # numpy work, which releases the GIL
+        self.n_jobs = n_jobs
+        # (featurizer, seconds) of the last build, in the order of the featurizers
+        self.timings = []
+        self._logger = logger or logging.getLogger(__name__)
+
+    def config(self) -> dict[str, Any]:
+        # The same features whatever the number of jobs
+        return {'class': type(self).__name__, 'featurizers': [featurizer.config() for featurizer in self.featurizers]}
+
+    def _run(self, build, scope: Scope) -> list:
+        def timed_build(featurizer: Featurizer):
+            start = time.perf_counter()
+            result = build(featurizer)
+            return result, time.perf_counter() - start
+
+        # Shared by every featurizer, so computed once before they start
+        n_offer_segment_periods = len(scope.offer_segment_periods)
+        if self.n_jobs > 1 and len(self.featurizers) > 1:
+            with ThreadPoolExecutor(max_workers=self.n_jobs) as executor:
+                results = list(executor.map(timed_build, self.featurizers))
+        else:
+            results = [timed_build(featurizer) for featurizer in self.featurizers]
+        self.timings = [(_describe(featurizer), seconds) for featurizer, (_, seconds) in zip(self.featurizers, results)]
+        self._logger.info(f"CompositeFeaturizer built {n_offer_segment_periods} offer segment periods with "
+                          f"{self.n_jobs} jobs: " +
+                          ", ".join(f"{name} in {seconds:.2f}s" for name, seconds in self.timings))
+        return [result for result, _ in results]
 
     def build_features(self, scope: Scope) -> dict[OfferSegmentPeriod, dict[str, Any]]:
         result = {}
-        for featurizer in self.featurizers:
-            features_by_offer_segment_period = featurizer.build_features(scope)
+        feature_names = set()
+        for features_by_offer_segment_period in self._run(lambda featurizer: featurizer.build_features(scope), scope):
+            # Like FeatureMatrix.stack, a feature name can only be built by one featurizer
+            names = {name for features in features_by_offer_segment_period.values() for name in features}
+            duplicate_names = sorted(names & feature_names)
+            if duplicate_names:
+                raise ValueError(f"Features {duplicate_names} are built by several featurizers")
+            feature_names |= names
             for offer_segment_period, features in features_by_offer_segment_period.items():
                 current = result.get(offer_segment_period)
                 if current is None:
@@ -181,25 +359,56 @@ class CompositeFeaturizer(Featurizer):
 
         return result
 
-class PrecomputeFeaturizer(Featurizer):
+    def build_feature_matrix(self, scope: Scope) -> FeatureMatrix:
+        return FeatureMatrix.stack(self._run(lambda featurizer: featurizer.build_feature_matrix(scope), scope))
 
-    def __init__(self, precomputed_feature_df : DataFrame):
+class PrecomputeFeaturizer(Featurizer):
+    # Features computed beforehand: read from a feature store under a fingerprint, where only the files and rows of
+    # the scope are loaded, or looked up in a DataFrame keyed by store_group_name, sku_group_name, start and end
+    def __init__(self, precomputed_feature_df: DataFrame = None, feature_store=None, fingerprint: str = None):
+        if precomputed_feature_df is None and (feature_store is None or fingerprint is None):
+            raise ValueError("PrecomputeFeaturizer needs a precomputed feature DataFrame, or a feature store and "
+                             "a fingerprint")
         self.precomputed_feature_df = precomputed_feature_df
-        self.precomputed_map = {}
-        feature_columns = [c for c in precomputed_feature_df.columns not in ['store_group_name','sku_group_name','start''end']]
-        for record in self.precomputed_feature_df.to_records():
-            features = {}
-            for feature_colunn in feature_columns:
-                features[feature_colunn] = record[feature_colunn]
-            self.precomputed_map[record.store_group_name,record.sku_group_name,record.start,record.end] = features
+        self.feature_store = feature_store
+        self.fingerprint = fingerprint
+        if precomputed_feature_df is not None:
+            key_columns = ['store_group_name', 'sku_group_name', 'start', 'end']
+            precomputed_feature_df = precomputed_feature_df.drop_duplicates(key_columns, keep='last')
+            self.precomputed_index = pd.MultiIndex.from_frame(precomputed_feature_df[key_columns].astype(str))
+            self.precomputed_columns = {c: precomputed_feature_df[c].to_numpy()
+                                        for c in precomputed_feature_df.columns if c not in key_columns}
+
+    def config(self) -> dict[str, Any]:
+        if self.feature_store is not None:
+            return {'class': type(self).__name__, 'fingerprint': self.fingerprint}
+        content_hash = pd.util.hash_pandas_object(self.precomputed_feature_df, index=False).to_numpy()
+        return {'class': type(self).__name__, 'columns': list(self.precomputed_feature_df.columns),
+                'content': hashlib.sha1(content_hash.tobytes()).hexdigest()}
+
+    def find_feature_matrix(self, scope: Scope) -> FeatureMatrix:
+        # None when some offer segment periods of the scope are not in the feature store
+        if self.feature_store is not None:
+            return self.feature_store.find(self.fingerprint, scope)
+        positions = self.precomputed_index.get_indexer(pd.MultiIndex.from_tuples(
+            [(osp.store_group_name, osp.sku_group_name, osp.period.start, osp.period.end)
+             for osp in scope.offer_segment_periods]))
+        columns = {}
+        for name, values in self.precomputed_columns.items():
+            # Offer segment periods without precomputed features get 0, or '' for categorical features
+            missing = '' if values.dtype == object else 0
+            columns[name] = np.where(positions >= 0, values[positions], missing) if len(values) else \
+                np.full(len(positions), missing, dtype=values.dtype)
+        return FeatureMatrix(scope.offer_segment_periods, columns)
 
     def build_features(self, scope: Scope) -> dict[OfferSegmentPeriod, dict[str, Any]]:
-        result = {}
-        for offer_segment_period in scope.offer_segment_periods:
-            features = self.precomputed_map.get(offer_segment_period,{})
-            result[offer_segment_period] = features
+        return self.build_feature_matrix(scope).to_features()
 
-        return result
+    def build_feature_matrix(self, scope: Scope) -> FeatureMatrix:
+        feature_matrix = self.find_feature_matrix(scope)
+        if feature_matrix is None:
+            raise KeyError(f"Features {self.fingerprint} are not stored for every offer segment period of the scope")
+        return feature_matrix
 
 
 class FeatureBuilder:
@@ -216,6 +425,12 @@ class FeatureBuilder:
     def sales_lag(self, lag: int) -> Featurizer:
         return LagSalesFeaturizer(lag_periods=lag,observation_repository=self.observation_repository)
 
+    def price_lags(self, lags: list[int]) -> Featurizer:
+        return MultiLagPriceFeaturizer(lags=lags, price_repository=self.price_repository)
+
+    def sales_lags(self, lags: list[int]) -> Featurizer:
+        return MultiLagSalesFeaturizer(lags=lags, observation_repository=self.observation_repository)
+
     def sku_status(self, lag : int) -> Featurizer:
         return SkuStatusFeaturizer(lag_periods=lag,sku_status_repository=self.sku_status_repository)
 
@@ -232,5 +447,8 @@ class FeatureBuilder:
     def precomputed_features_from_df(selfs, df : DataFrame):
         return PrecomputeFeaturizer(precomputed_feature_df=df)
 
-    def concat(self, featurizers: list[Featurizer]) -> Featurizer:
-        return CompositeFeaturizer(featurizers=featurizers)
+    def precomputed_features_from_store(self, feature_store, fingerprint: str) -> Featurizer:
+        return PrecomputeFeaturizer(feature_store=feature_store, fingerprint=fingerprint)
+
+    def concat(self, featurizers: list[Featurizer], n_jobs: int = 1) -> Featurizer:
+        return CompositeFeaturizer(featurizers=featurizers, n_jobs=n_jobs)
@@ -1,12 +1,12 @@
 from abc import ABC
-from copy import copy
 from dataclasses import replace
 
-from catboost import CatBoostRegressor
+import pandas as pd
+from catboost import CatBoostRegressor, Pool
 
 from data_gold.domain import Scope, OfferSegmentPeriod
 from data_gold.repository import ObservationRepository
-from model.featurizer import Featurizer
+from model.featurizer import Featurizer, FeatureMatrix
 
 
 class Forecaster(ABC):
@@ -53,61 +53,26 @@ class CatBoostForecaster(Forecaster):
     def __init__(self, featurizer: Featurizer, observation_repository: ObservationRepository):
         self.featurizer = featurizer
         self.observation_repository = observation_repository
-        self.parameters_mapping = None
-        self.empty_paraneters = None
+        self.feature_names = None
+        self.cat_features = None
+
+    def _to_model_input(self, feature_matrix: FeatureMatrix):
+        # A 2-D float array when every feature is numeric, otherwise a Pool over the columns, without row copies
+        if not self.cat_features:
+            return feature_matrix.to_array(self.feature_names)
+        data = pd.DataFrame({name: feature_matrix.columns[name] for name in self.feature_names}, copy=False)
+        return Pool(data, cat_features=self.cat_features)
 
     def train(self, training_scope: Scope):
-        features_for_offer_segment_periods = self.featurizer.build_features(scope=training_scope)
-        observations = self.observation_repository.find(training_scope)
-        self.parameters_mapping = {}
-        self.empty_paraneters = []
-        for offer_segment_period, features in features_for_offer_segment_periods.items():
-            for name, value in features.items():
-                index = self.parameters_mapping.get(name)
-                if index is None:
-                    index = len(self.parameters_mapping)
-                    categorical = False
-                    if isinstance(value, str):
-                        categorical = True
-                    self.parameters_mapping[name] = (index, categorical)
-                    if not categorical:
-                        self.empty_paraneters.append(0)
-                    else:
-                        self.empty_paraneters.append('')
-
-        feature_array_list = []
-        for obs in observations:
-            offer_segment_period = obs.offer_segment_period
-            features = features_for_offer_segment_periods[offer_segment_period]
-            features_array = copy(self.empty_paraneters)
-            for name, value in features.items():
-                if value is None:
-                    print(name,offer_segment_period)
-                features_array[self.parameters_mapping[name][0]] = value
-            feature_array_list.append(features_array)
-
-        cat_features = [v[0] for k,v in self.parameters_mapping.items() if v[1]]
-        self.model = CatBoostRegressor(cat_features=cat_features)
-        self.model.fit(feature_array_list,[obs.total_sales_qty for obs in observations])
+        # The feature rows and the observed totals both follow training_scope.offer_segment_periods
+        feature_matrix = self.featurizer.build_feature_matrix(scope=training_scope)
+        total_sales_qty = self.observation_repository.find_total_sales_qty(training_scope).ravel()
+        self.feature_names = feature_matrix.feature_names
+        self.cat_features = feature_matrix.categorical_feature_names
+        self.model = CatBoostRegressor(cat_features=self.cat_features or None)
+        self.model.fit(self._to_model_input(feature_matrix), total_sales_qty)
 
     def predict(self, prediction_scope: Scope) -> dict[OfferSegmentPeriod, float]:
-        features_for_offer_segment_periods = self.featurizer.build_features(scope=prediction_scope)
-        feature_array_list = []
-        for offer_segment_period in prediction_scope.offer_segment_periods:
-            features = features_for_offer_segment_periods[offer_segment_period]
-            features_array = copy(self.empty_paraneters)
-            for name, value in features.items():
-                features_array[self.parameters_mapping[name][0]] = value
-            feature_array_list.append(features_array)
-
-        predictions = self.model.predict(feature_array_list)
-        result = {}
-        for i, offer_segment_period in enumerate(prediction_scope.offer_segment_periods):
-            result[offer_segment_period] = predictions[i]
-
-        return result
-
-
-
-
-
+        feature_matrix = self.featurizer.build_feature_matrix(scope=prediction_scope)
+        predictions = self.model.predict(self._to_model_input(feature_matrix))
+        return dict(zip(prediction_scope.offer_segment_periods, predictions.tolist()))
@@ -1,12 +1,32 @@
 import os
 import os.path
+import tempfile
+from collections import defaultdict
 
+import numpy as np
 import pandas as pd
 import pandera as pa
 
+from retail.data.m5.sales_melt import melt_sales_chunks, read_melted_sales
 from retail.data_layer.interfaces import BronzeToSilver
 
 from retail.data_layer.schema import CalendarSchema, CatalogSchema, SalesSchema
+from retail.data_layer.validation import validate
+
+
+CALENDAR_COLUMNS = ['d', 'wm_yr_wk', 'month', 'year', 'date']
+CALENDAR_DTYPES = {'d': str, 'wm_yr_wk': str, 'date': str}
+
+CATALOG_COLUMNS = ['store_id', 'item_id', 'wm_yr_wk', 'sell_price']
+CATALOG_DTYPES = {'store_id': 'category', 'item_id': 'category', 'wm_yr_wk': 'category', 'sell_price': np.float32}
+
+SALES_KEY_COLUMNS = ['item_id', 'dept_id', 'cat_id', 'store_id']
+# Every column that is not a key is a daily d_XXXX sales column
+SALES_DTYPES = defaultdict(lambda: np.int16, {c: 'category' for c in SALES_KEY_COLUMNS})
+
+
+def _is_sales_column(column: str) -> bool:
+    return column in SALES_KEY_COLUMNS or column.startswith('d_')
 
 
 class M5DataLoader(BronzeToSilver):
@@ -14,79 +34,111 @@ class M5DataLoader(BronzeToSilver):
     def __init__(self,
                  sales_file="sales_train_evaluation.csv",
                  catalog_file="sell_prices.csv",
-                 calendar_file="calendar.csv"
+                 calendar_file="calendar.csv",
+                 chunk_size=1000,
+                 validation_mode: str = None
                  ):
+        # File names are relative to the toy data directory, absolute paths are read as is
         self._sales_file = sales_file
         self._catalog_file = catalog_file
         self._calendar_file = calendar_file
+        self._chunk_size = chunk_size
+        # None: the mode of the RETAIL_VALIDATION_MODE environment variable, at each load
+        self._validation_mode = validation_mode
+        # Bronze files parsed during the current session, by file name
+        self._bronze_dfs = {}
+        self._sales_key_df = None
 
     def _get_path_relative_to_this_file(self, relative_to_project: str) -> str:
         return os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../../../', relative_to_project)
 
-    def _load_df(self, file_name: str) -> pd.DataFrame:
-        return pd.read_csv(
-            os.path.join(self._get_path_relative_to_this_file('data'), "m5-forecasting-accuracy-toy", file_name))
+    def _get_bronze_path(self, file_name: str) -> str:
+        return os.path.join(self._get_path_relative_to_this_file('data'), "m5-forecasting-accuracy-toy", file_name)
+
+    def _load_df(self, file_name: str, usecols=None, dtype=None) -> pd.DataFrame:
+        df = self._bronze_dfs.get(file_name)
+        if df is None:
+            df = pd.read_csv(self._get_bronze_path(file_name), usecols=usecols, dtype=dtype)
+            self._bronze_dfs[file_name] = df
+        return df
+
+    def _load_calendar_df(self) -> pd.DataFrame:
+        return self._load_df(self._calendar_file, usecols=CALENDAR_COLUMNS, dtype=CALENDAR_DTYPES)
+
+    def _load_catalog_df(self) -> pd.DataFrame:
+        return self._load_df(self._catalog_file, usecols=CATALOG_COLUMNS, dtype=CATALOG_DTYPES)
+
+    def _load_sales_df(self) -> pd.DataFrame:
+        # The wide sales file is melted chunk by chunk into a parquet file, and only the long result is kept
+        sales_df = self._bronze_dfs.get(self._sales_file)
+        if sales_df is None:
+            calendar_df = self.get_calendar_df()
+            date_by_day_no = pd.to_datetime(calendar_df.set_index('day_no').date)
+            wide_chunks = pd.read_csv(self._get_bronze_path(self._sales_file),
+                                      usecols=_is_sales_column,
+                                      dtype=SALES_DTYPES,
+                                      chunksize=self._chunk_size)
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'sales.parquet')
+                self._sales_key_df = melt_sales_chunks(wide_chunks, SALES_KEY_COLUMNS, date_by_day_no, path,
+                                                       date_column='transaction_date')
+                sales_df = read_melted_sales(path)
+            self._bronze_dfs[self._sales_file] = sales_df
+        return sales_df
 
-    @pa.check_types
     def get_calendar_df(self) -> pa.typing.DataFrame[CalendarSchema]:
-        calendar_df = self._load_df(self._calendar_file)
+        calendar_df = self._load_calendar_df()
         calendar_df = calendar_df[['d', 'wm_yr_wk', 'month', 'year', 'date']]
         calendar_df = calendar_df.rename(columns={'d': 'day_no',
                                                   'wm_yr_wk': 'year_week'})
-        calendar_df.year_week = calendar_df.year_week.astype(str)
-        calendar_df.day_no = calendar_df.day_no.astype(str)
-        return calendar_df
+        return validate(calendar_df, CalendarSchema, self._validation_mode)
 
-    @pa.check_types
     def get_catalog_df(self) -> pa.typing.DataFrame[CatalogSchema]:
-        catalog_df = self._load_df(self._catalog_file)
+        catalog_df = self._load_catalog_df()
 
         catalog_df = catalog_df.rename(columns={'item_id': 'sku_id',
                                                 'wm_yr_wk': 'year_week',
                                                 'sell_price': 'price'})
-        catalog_df.year_week = catalog_df.year_week.astype(str)
 
         # Add sku fields (e.g. category, department) from the sales data
-        catalog_df = pd.merge(catalog_df, self._get_sku_fields_from_sales(), on=['sku_id'], how='left')
-        catalog_df["store_group_id"] = 'whole_banner'
+        sku_fields_df = self._get_sku_fields_from_sales().set_index('sku_id')
+        for column in ['cat_id', 'dept_id']:
+            catalog_df[column] = catalog_df.sku_id.map(sku_fields_df[column]).astype('category')
+        catalog_df["store_group_id"] = pd.Categorical.from_codes(np.zeros(len(catalog_df), dtype=np.int8),
+                                                                 categories=['whole_banner'])
 
-        return catalog_df
+        return validate(catalog_df, CatalogSchema, self._validation_mode)
 
-    @pa.check_types
     def get_sales_df(self) -> pa.typing.DataFrame[SalesSchema]:
-        sales_df = self._load_df(self._sales_file)
-        key_columns = ['id', 'item_id', 'dept_id', 'cat_id', 'store_id', 'state_id']
-        sales_df = sales_df.melt(id_vars=key_columns, var_name='day_no', value_name='sales_qty')
-
-        # add transaction_date from calendar
-        calendar_df = self.get_calendar_df()
-        sales_df = pd.merge(sales_df, calendar_df[['day_no', 'date']], on='day_no', how="left")
-
-        sales_df = sales_df[["item_id", "store_id", "day_no", "sales_qty", "date", "dept_id", "cat_id"]]
-        sales_df = sales_df.rename(columns={'item_id': 'sku_id',
-                                            'date': 'transaction_date'})
-        sales_df.sales_qty = sales_df.sales_qty.astype(float)
-        sales_df.transaction_date = pd.to_datetime(sales_df.transaction_date)
-        return sales_df
+        sales_df = self._load_sales_df()
+        sales_df = sales_df[["item_id", "store_id", "day_no", "sales_qty", "transaction_date", "dept_id", "cat_id"]]
+        sales_df = sales_df.rename(columns={'item_id': 'sku_id'})
+        return validate(sales_df, SalesSchema, self._validation_mode)
 
     def _get_sku_fields_from_sales(self) -> pd.DataFrame:
-        sales_df = self._load_df(self._sales_file)
-        sales_df = sales_df.rename(columns={'item_id': 'sku_id'})
-        sku_cols = ['sku_id', 'cat_id', 'dept_id']
-        return sales_df.groupby(sku_cols).size().reset_index()[sku_cols]
+        self._load_sales_df()
+        sku_df = self._sales_key_df[['item_id', 'cat_id', 'dept_id']].drop_duplicates()
+        return sku_df.rename(columns={'item_id': 'sku_id'})
 
     def get_silver_datasets(self) -> (pa.typing.DataFrame[SalesSchema],
                                       pa.typing.DataFrame[CatalogSchema],
                                       pa.typing.DataFrame[CalendarSchema],
                                       ):
-        return (
-            self.get_sales_df(),
-            self.get_catalog_df(),
-            self.get_calendar_df()
-        )
-
-        # TODO: need to save silver and gold data with 3 identifiers (sales, catalog, calendar)
-        # See if we have the merge dataset already
-        # demand_data_path = os.path.join(self._get_path_relative_to_this_file('data'), 'demand.csv')
-        # if os.path.exists(demand_data_path):
-        #    return pd.read_csv(demand_data_path)
+        try:
+            return (
+                self.get_sales_df(),
+                self.get_catalog_df(),
+                self.get_calendar_df()
+            )
+        finally:
+            # The silver datasets no longer need the raw files
+            self._bronze_dfs.clear()
+            self._sales_key_df = None
+
+    def get_source_key(self) -> str:
+        # The sales, catalog and calendar files, with their size and modification time
+        identifiers = []
+        for file_name in [self._sales_file, self._catalog_file, self._calendar_file]:
+            stat = os.stat(self._get_bronze_path(file_name))
+            identifiers.append(f"{file_name}:{stat.st_size}:{stat.st_mtime_ns}")
+        return '|'.join(identifiers)
@@ -0,0 +1,65 @@
+from typing import Iterable, List
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+def _dictionary_array(codes: np.ndarray, categories) -> pa.DictionaryArray:
+    return pa.DictionaryArray.from_arrays(pa.array(codes.astype(np.int32)), pa.array(categories, pa.string()))
+
+
+def melt_sales_chunks(wide_chunks: Iterable[pd.DataFrame],
+                      key_columns: List[str],
+                      date_by_day_no: pd.Series,
+                      path: str,
+                      day_no_column: str = 'day_no',
+                      date_column: str = 'date',
+                      value_column: str = 'sales_qty',
+                      ) -> pd.DataFrame:
+    # Rows come out series by series (every day of a wide row, then the next row) and
+    # d_XXXX columns are mapped to dates positionally, so memory is bounded by the chunk.
+    # Returns the key columns of every wide row. The days are read from every chunk, as chunks may come from files
+    # with different days (e.g. validation then evaluation).
+    writer = None
+    day_nos = None
+    day_positions = None
+    key_dfs = []
+    try:
+        for chunk in wide_chunks:
+            chunk_day_nos = [c for c in chunk.columns if c not in key_columns]
+            if chunk_day_nos != day_nos:
+                day_nos = chunk_day_nos
+                day_positions = date_by_day_no.index.get_indexer(day_nos)
+                if (day_positions < 0).any():
+                    raise ValueError(f"Days missing from the calendar: {np.array(day_nos)[day_positions < 0]}")
+            n_rows, n_days = len(chunk), len(day_nos)
+            series_codes = np.repeat(np.arange(n_rows), n_days)
+
+            columns = {}
+            for column in key_columns:
+                codes, uniques = pd.factorize(chunk[column])
+                columns[column] = _dictionary_array(codes[series_codes], uniques.astype(str))
+            columns[day_no_column] = _dictionary_array(np.tile(np.arange(n_days), n_rows), day_nos)
+            columns[date_column] = pa.array(np.tile(date_by_day_no.to_numpy()[day_positions], n_rows))
+            columns[value_column] = pa.array(chunk[day_nos].to_numpy(dtype=np.float32).ravel())
+            table = pa.table(columns)
+
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            key_dfs.append(chunk[key_columns].astype(str))
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return pd.concat(key_dfs, ignore_index=True).astype('category')
+
+
+def read_melted_sales(path: str, columns: List[str] = None) -> pd.DataFrame:
+    # One column at a time, so that only a single decoded arrow column is alive next to the result
+    parquet_file = pq.ParquetFile(path)
+    columns = columns or parquet_file.schema_arrow.names
+    return pd.DataFrame({column: parquet_file.read(columns=[column]).column(0).to_pandas() for column in columns},
+                        copy=False)
@@ -1,33 +1,109 @@
+import numpy as np
 import pandas as pd
 import pandera as pa
 from retail.data_layer.interfaces import SilverToGold
 from retail.data_layer.schema import SalesSchema, CatalogSchema, CalendarSchema, DemandModelInputSchema
 
 
+def _get_positions(values: pd.Series, index: pd.Index) -> np.ndarray:
+    # Position of each value in index, -1 when missing. Each distinct value is looked up once and the result is
+    # broadcast through the integer codes of the values.
+    codes, uniques = pd.factorize(values)
+    return np.append(index.get_indexer(uniques), -1)[codes]
+
+
 class GenericSilverToGold(SilverToGold):
     @staticmethod
     def _impute_no_sales_skus(
                               gold_df: pa.typing.DataFrame[DemandModelInputSchema],
                               calendar_df: pa.typing.DataFrame[CalendarSchema],
                              ):
-        yw_date_df = calendar_df.groupby(["year_week", "date"]).size().reset_index()[["year_week", "date"]]
-        df = pd.merge(gold_df, yw_date_df, on="year_week", how="right")
-        # Find dates that are missing from the sales data but present in the catalog
-        df = df[df.date_x != df.date_y]
-        df['sales_qty'] = 0
-        return pd.concat((gold_df, df))
+        # Each (store_id, sku_id) series is reindexed on every calendar day between its first and last day, with
+        # sales_qty=0 on the added days. Calendar columns come from the calendar, the other columns (price included)
+        # are carried forward from the previous day of the series. Everything is gathered through index arrays, so
+        # the cost is linear in the size of the output.
+        if gold_df.empty:
+            return gold_df
+        day_order = np.argsort(calendar_df.date.to_numpy(), kind='stable')
+        calendar_ranks = np.empty(len(day_order), dtype=np.int64)
+        calendar_ranks[day_order] = np.arange(len(day_order))
+        calendar_rows = _get_positions(gold_df.day_no, pd.Index(calendar_df.day_no))
+        if (calendar_rows < 0).any():
+            raise ValueError("Days missing from the calendar: "
+                             f"{pd.unique(gold_df.day_no.to_numpy()[calendar_rows < 0])}")
+        day_ranks = calendar_ranks[calendar_rows]
+
+        series_codes = gold_df.groupby(['store_id', 'sku_id'], observed=True, sort=False).ngroup().to_numpy()
+        rank_range = pd.Series(day_ranks).groupby(series_codes).agg(['min', 'max'])
+        first_ranks = rank_range['min'].to_numpy()
+        lengths = rank_range['max'].to_numpy() - first_ranks + 1
+        offsets = np.cumsum(lengths) - lengths
+        n_rows = lengths.sum()
+
+        # Row of gold_df on each day of the grid (-1 on the added days), and the last row of the series so far
+        positions = offsets[series_codes] + day_ranks - first_ranks[series_codes]
+        if np.bincount(positions, minlength=n_rows).max() > 1:
+            raise ValueError("A (store_id, sku_id) series has several rows on the same day")
+        source_rows = np.full(n_rows, -1, dtype=np.int64)
+        source_rows[positions] = np.arange(len(gold_df))
+        observed = source_rows >= 0
+        previous_rows = source_rows[np.maximum.accumulate(np.where(observed, np.arange(n_rows), 0))]
+        grid_series = np.repeat(np.arange(len(lengths)), lengths)
+        grid_calendar_rows = day_order[np.arange(n_rows) - offsets[grid_series] + first_ranks[grid_series]]
+
+        columns = {}
+        for column in gold_df.columns:
+            if column == 'sales_qty':
+                sales_qty = gold_df.sales_qty.to_numpy()
+                columns[column] = np.where(observed, sales_qty[previous_rows], 0).astype(sales_qty.dtype)
+            elif column == 'transaction_date':
+                dates = pd.to_datetime(calendar_df.date).to_numpy()
+                columns[column] = np.where(observed, gold_df.transaction_date.to_numpy()[previous_rows],
+                                           dates[grid_calendar_rows])
+            elif column in calendar_df.columns:
+                columns[column] = calendar_df[column].take(grid_calendar_rows).reset_index(drop=True)
+            else:
+                columns[column] = gold_df[column].take(previous_rows).reset_index(drop=True)
+        return pd.DataFrame(columns, copy=False)
+
+    @staticmethod
+    def _join(sales_df: pa.typing.DataFrame[SalesSchema],
+              catalog_df: pa.typing.DataFrame[CatalogSchema],
+              calendar_df: pa.typing.DataFrame[CalendarSchema],
+              ) -> pd.DataFrame:
+        # Inner join of the sales with the calendar on day_no, then with the catalog on (store_id, sku_id, year_week),
+        # without intermediate tables: the calendar row of each sale is found by position, its catalog row through a
+        # dense (store, sku, week) array of catalog rows, and every output column is gathered once
+        calendar_rows = _get_positions(sales_df.day_no, pd.Index(calendar_df.day_no))
+
+        store_codes, stores = pd.factorize(catalog_df.store_id)
+        sku_codes, skus = pd.factorize(catalog_df.sku_id)
+        week_codes, weeks = pd.factorize(catalog_df.year_week)
+        catalog_rows = np.full((len(stores), len(skus), len(weeks)), -1, dtype=np.int64)
+        catalog_rows[store_codes, sku_codes, week_codes] = np.arange(len(catalog_df))
+
+        calendar_weeks = _get_positions(calendar_df.year_week, pd.Index(weeks))
+        sales_stores = _get_positions(sales_df.store_id, pd.Index(stores))
+        sales_skus = _get_positions(sales_df.sku_id, pd.Index(skus))
+        sales_weeks = np.append(calendar_weeks, -1)[calendar_rows]
+        sales_rows = np.flatnonzero((sales_stores >= 0) & (sales_skus >= 0) & (sales_weeks >= 0))
+        catalog_rows = catalog_rows[sales_stores[sales_rows], sales_skus[sales_rows], sales_weeks[sales_rows]]
+        matched = catalog_rows >= 0
+        sales_rows, catalog_rows = sales_rows[matched], catalog_rows[matched]
+        calendar_rows = calendar_rows[sales_rows]
+
+        columns = {column: sales_df[column].take(sales_rows).reset_index(drop=True) for column in sales_df.columns}
+        for column in calendar_df.columns.difference(sales_df.columns):
+            columns[column] = calendar_df[column].take(calendar_rows).reset_index(drop=True)
+        for column in catalog_df.columns.difference(list(columns)):
+            columns[column] = catalog_df[column].take(catalog_rows).reset_index(drop=True)
+        return pd.DataFrame(columns, copy=False)
 
     def get_gold_dataset(self,
                          sales_df: pa.typing.DataFrame[SalesSchema],
                          catalog_df: pa.typing.DataFrame[CatalogSchema],
                          calendar_df: pa.typing.DataFrame[CalendarSchema],
                          ) -> pa.typing.DataFrame[DemandModelInputSchema]:
-
-        merge_cols = (calendar_df.columns.difference(sales_df.columns))
-        merge_on = ['day_no']
-        model_df = pd.merge(sales_df, calendar_df[merge_cols.tolist() + merge_on], on=merge_on)
-        merge_cols = (catalog_df.columns.difference(model_df.columns))
-        merge_on = ['store_id', 'sku_id', 'year_week']
-        model_df = pd.merge(model_df, catalog_df[merge_cols.tolist() + merge_on], on=merge_on)
+        model_df = self._join(sales_df, catalog_df, calendar_df)
         model_df = self._impute_no_sales_skus(model_df, calendar_df)
         return model_df
@@ -0,0 +1,108 @@
+import json
+import logging
+import os
+import shutil
+import time
+from typing import List, Tuple
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+
+PARTITION_COLUMNS = ['store_id', 'cat_id']
+ROW_GROUP_COLUMN = 'year_week'
+# Written last: a store without it is incomplete and is never read
+METADATA_FILE = '_gold_store.json'
+# The partition directory of rows without a key, as pyarrow names it
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+
+class PartitionedGoldStore:
+    # The gold dataset as parquet files in store_id=<store>/cat_id=<category> directories, with one row group per
+    # year_week in each file. A read with (column, operator, value) filters, like DemandScope.get_filters, only opens
+    # the files of the selected partitions, and only decodes the row groups whose date statistics match.
+    def __init__(self,
+                 directory: str,
+                 partition_columns: List[str] = PARTITION_COLUMNS,
+                 row_group_column: str = ROW_GROUP_COLUMN,
+                 logger: logging.Logger = None):
+        self._directory = directory
+        self._partition_columns = list(partition_columns)
+        self._row_group_column = row_group_column
+        self._logger = logger or logging.getLogger(__name__)
+
+    def _get_metadata_path(self) -> str:
+        return os.path.join(self._directory, METADATA_FILE)
+
+    def _get_partition_path(self, partition_values: Tuple) -> str:
+        directories = [f"{column}={NULL_PARTITION if pd.isna(value) else quote(str(value), safe='')}"
+                       for column, value in zip(self._partition_columns, partition_values)]
+        return os.path.join(self._directory, *directories, 'part-0.parquet')
+
+    def exists(self, source_key: str) -> bool:
+        # Whether the store was written from these sources: without a source key, nothing tells that it is up to date
+        if source_key is None or not os.path.exists(self._get_metadata_path()):
+            return False
+        with open(self._get_metadata_path()) as f:
+            metadata = json.load(f)
+        return metadata['source_key'] == source_key
+
+    def write(self, gold_df: pd.DataFrame, source_key: str = None):
+        start = time.perf_counter()
+        if os.path.exists(self._directory):
+            shutil.rmtree(self._directory)
+        os.makedirs(self._directory)
+
+        data_columns = [column for column in gold_df.columns if column not in self._partition_columns]
+        partitions = gold_df.groupby(self._partition_columns, observed=True, dropna=False, sort=True).indices
+        for partition_values, rows in partitions.items():
+            partition_values = partition_values if isinstance(partition_values, tuple) else (partition_values,)
+            # Rows are ordered by row group key, stably, so that every row group is a contiguous range of rows
+            week_codes, _ = pd.factorize(gold_df[self._row_group_column].take(rows), sort=True)
+            order = np.argsort(week_codes, kind='stable')
+            week_codes = week_codes[order]
+            boundaries = np.flatnonzero(np.r_[True, week_codes[1:] != week_codes[:-1], True])
+
+            table = pa.Table.from_pandas(gold_df[data_columns].take(rows[order]), preserve_index=False)
+            path = self._get_partition_path(partition_values)
+            os.makedirs(os.path.dirname(path))
+            with pq.ParquetWriter(path, table.schema) as writer:
+                for begin, end in zip(boundaries[:-1], boundaries[1:]):
+                    writer.write_table(table.slice(begin, end - begin))
+
+        # Parquet files and partition directories do not keep the order of the categories, it is restored on read
+        categories = {column: {'categories': gold_df[column].cat.categories.tolist(),
+                               'ordered': bool(gold_df[column].cat.ordered)}
+                      for column in gold_df.columns if isinstance(gold_df[column].dtype, pd.CategoricalDtype)}
+        with open(self._get_metadata_path(), 'w') as f:
+            json.dump({'source_key': source_key, 'columns': list(gold_df.columns), 'n_rows': int(gold_df.shape[0]),
+                       'categories': categories}, f)
+        self._logger.info(f"PartitionedGoldStore wrote {gold_df.shape[0]} rows in {len(partitions)} partitions "
+                          f"in {time.perf_counter() - start:.2f}s")
+
+    def read(self, filters: List[Tuple] = None, columns: List[str] = None) -> pd.DataFrame:
+        if not os.path.exists(self._get_metadata_path()):
+            raise FileNotFoundError(f"No gold store in {self._directory}")
+        start = time.perf_counter()
+        with open(self._get_metadata_path()) as f:
+            metadata = json.load(f)
+        columns = columns or metadata['columns']
+        # Partition values are read as dictionaries, so that they come back as categorical columns
+        partitioning = ds.HivePartitioning.discover(infer_dictionary=True)
+        table = pq.read_table(self._directory,
+                              columns=columns,
+                              filters=filters or None,
+                              partitioning=partitioning)
+        df = table.to_pandas()[columns]
+        for column, dtype in metadata.get('categories', {}).items():
+            if column in df.columns:
+                # Unlike astype, which sees unordered categories in another order as the same dtype
+                values = df[column].astype('category')
+                df[column] = values.cat.set_categories(dtype['categories'], ordered=dtype['ordered'])
+        self._logger.info(f"PartitionedGoldStore read {df.shape[0]} rows with filters {filters} "
+                          f"in {time.perf_counter() - start:.2f}s")
+        return df
@@ -10,6 +10,11 @@ class BronzeToSilver:
                                        ):
         pass
 
+    def get_source_key(self) -> str:
+        # Identifies the bronze sources, so that datasets derived from them can be stored and found again. None when
+        # the sources cannot be identified: stored datasets are then always rebuilt.
+        return None
+
 
 class SilverToGold:
     def get_gold_dataset(self,
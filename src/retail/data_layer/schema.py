@@ -1,6 +1,6 @@
 import numpy as np
 import pandera as pa
-from pandera.typing import Series
+from pandera.typing import Series, Category
 
 # Silver data layer
 
@@ -12,33 +12,33 @@ class CalendarSchema(pa.DataFrameModel):
 
 
 class CatalogSchema(pa.DataFrameModel):
-    sku_id: Series[str]
-    store_id: Series[str]
-    store_group_id: Series[str]
-    dept_id: Series[str]
-    cat_id: Series[str]
-    price: Series[float] = pa.Field(ge=0)
-    year_week: Series[str]
+    sku_id: Series[Category]
+    store_id: Series[Category]
+    store_group_id: Series[Category]
+    dept_id: Series[Category]
+    cat_id: Series[Category]
+    price: Series[np.float32] = pa.Field(ge=0)
+    year_week: Series[Category]
 
 
 class SalesSchema(pa.DataFrameModel):
-    sku_id: Series[str]
-    store_id: Series[str]
+    sku_id: Series[Category]
+    store_id: Series[Category]
     transaction_date: Series[np.datetime64]
-    day_no: Series[str]
-    sales_qty: Series[float] = pa.Field(nullable=True)
+    day_no: Series[Category]
+    sales_qty: Series[np.float32] = pa.Field(nullable=True)
 
 
 # Gold data layer
 
 class DemandModelInputSchema(pa.DataFrameModel):
-    price: Series[float]
-    sales_qty: Series[float]
-    sku_id: Series[str]
-    store_id: Series[str]
-    store_group_id: Series[str]
-    dept_id: pa.Column(str)
-    cat_id: pa.Column(str)
+    price: Series[np.float32]
+    sales_qty: Series[np.float32]
+    sku_id: Series[Category]
+    store_id: Series[Category]
+    store_group_id: Series[Category]
+    dept_id: Series[Category]
+    cat_id: Series[Category]
     transaction_date: Series[np.datetime64]
     year: Series[int]
     month: Series[int]
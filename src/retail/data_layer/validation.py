@@ -0,0 +1,49 @@
+import logging
+import os
+import time
+from typing import Type
+
+import numpy as np
+import pandas as pd
+import pandera as pa
+
+
+# full: every row, sampled: dtypes and a random sample of rows, schema: columns and dtypes only, off: nothing
+VALIDATION_MODES = ('full', 'sampled', 'schema', 'off')
+VALIDATION_MODE_VARIABLE = 'RETAIL_VALIDATION_MODE'
+VALIDATION_SAMPLE_SIZE_VARIABLE = 'RETAIL_VALIDATION_SAMPLE_SIZE'
+DEFAULT_SAMPLE_SIZE = 10000
+
+_logger = logging.getLogger(__name__)
+
+
+def get_validation_mode(validation_mode: str = None) -> str:
+    validation_mode = validation_mode or os.environ.get(VALIDATION_MODE_VARIABLE, 'full')
+    if validation_mode not in VALIDATION_MODES:
+        raise ValueError(f"Unknown validation mode {validation_mode}, expected one of {VALIDATION_MODES}")
+    return validation_mode
+
+
+def validate(df: pd.DataFrame,
+             schema: Type[pa.DataFrameModel],
+             validation_mode: str = None,
+             sample_size: int = None,
+             logger: logging.Logger = None) -> pd.DataFrame:
+    validation_mode = get_validation_mode(validation_mode)
+    if validation_mode == 'off':
+        return df
+    logger = logger or _logger
+    start = time.perf_counter()
+    if validation_mode == 'full':
+        schema.validate(df)
+    elif validation_mode == 'sampled':
+        sample_size = sample_size or int(os.environ.get(VALIDATION_SAMPLE_SIZE_VARIABLE, DEFAULT_SAMPLE_SIZE))
+        # Rows are drawn without shuffling the whole frame, which would cost as much as a full scan
+        rows = np.random.default_rng(0).choice(len(df), size=min(sample_size, len(df)), replace=False)
+        schema.validate(df.take(np.sort(rows)))
+    else:
+        # Column presence and dtypes do not depend on the rows
+        schema.validate(df.iloc[:0])
+    logger.info(f"Validated {len(df)} rows against {schema.__name__} ({validation_mode}) "
+                f"in {time.perf_counter() - start:.3f}s")
+    return df
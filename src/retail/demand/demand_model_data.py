@@ -1,18 +1,40 @@
 from dataclasses import dataclass
 import pandera as pa
 
+from retail.data_layer.gold_store import PartitionedGoldStore
 from retail.data_layer.interfaces import BronzeToSilver, SilverToGold
 from retail.data_layer.schema import SalesSchema, CatalogSchema, CalendarSchema, DemandModelInputSchema
+from retail.transformer.demand_scope import DemandScope
 
 
 class DemandModelDataLoader:
     def __init__(self,
                  bronze_to_silver: BronzeToSilver,
-                 silver_to_gold: SilverToGold):
+                 silver_to_gold: SilverToGold,
+                 gold_store: PartitionedGoldStore = None):
         self._bronze_to_silver = bronze_to_silver
         self._silver_to_gold = silver_to_gold
+        # Optional on-disk copy of the gold dataset: it is written on the first load, and read instead of the bronze
+        # files while these are unchanged
+        self._gold_store = gold_store
 
-    def get_demand_model_data(self):
-        sales_df, catalog_df, calendar_df = self._bronze_to_silver.get_silver_datasets()
-        gold_df = self._silver_to_gold.get_gold_dataset(sales_df, catalog_df, calendar_df)
+    def get_demand_model_data(self,
+                              demand_scope: DemandScope = None,
+                              with_dates: bool = True):
+        # With a scope, only its rows are returned (with or without its date range, like its fit_transform or its
+        # transform): from a gold store, the other partitions and weeks are not even read
+        filters = demand_scope.get_filters(with_dates) if demand_scope is not None else None
+        if self._gold_store is not None:
+            source_key = self._bronze_to_silver.get_source_key()
+            if not self._gold_store.exists(source_key):
+                self._gold_store.write(self._get_gold_dataset(), source_key)
+            return self._gold_store.read(filters)
+
+        gold_df = self._get_gold_dataset()
+        if demand_scope is not None:
+            gold_df = demand_scope.fit_transform(gold_df) if with_dates else demand_scope.transform(gold_df)
         return gold_df
+
+    def _get_gold_dataset(self):
+        sales_df, catalog_df, calendar_df = self._bronze_to_silver.get_silver_datasets()
+        return self._silver_to_gold.get_gold_dataset(sales_df, catalog_df, calendar_df)
@@ -1,10 +1,20 @@
 import logging
 from typing import List
 
+import numpy as np
 import pandas as pd
 
 from retail.demand.interfaces import DemandPredictor
 from retail.domain import Feature, Transformer, TransformerFeatureSubset
+from retail.transformer.interfaces import Scope
+
+
+def _get_float_dtype(dtypes: pd.Series) -> np.dtype:
+    # The smallest float dtype that holds every column. Extension dtypes (e.g. nullable Int64 or Float32) are not
+    # numpy dtypes that np.result_type can combine: those subsets are converted to float64, with NaN for their NA.
+    if all(isinstance(dtype, np.dtype) for dtype in dtypes):
+        return np.result_type(*dtypes, np.float32)
+    return np.dtype(np.float64)
 
 
 class GenericDemandPredictor(DemandPredictor):
@@ -21,28 +31,53 @@ class GenericDemandPredictor(DemandPredictor):
         self._target_transformer_list = target_transformer_list
         self._logger = logger or logging.getLogger(__name__)
 
-    def fit_transform(self, sales_df: pd.DataFrame):
-        self._logger.info(f"Preprocessing the data (fit_transform, for training). Data shape: {sales_df.shape}")
+    def _run_transformers(self, sales_df: pd.DataFrame, fit: bool) -> pd.DataFrame:
+        # Consecutive scopes only combine their row masks, which are applied at once before the next transformer.
+        # The rows are then copied once, and the pipeline owns that copy: transformers add and replace its columns in
+        # place. Until a mask is applied, they work on a shallow copy, so that the caller's frame is left untouched.
+        sales_df = sales_df.copy(deep=False)
+        mask = None
         for transformer in self._transformer_list:
+            if isinstance(transformer, Scope):
+                transformer_mask = transformer.fit_mask(sales_df) if fit else transformer.mask(sales_df)
+                mask = transformer_mask if mask is None else mask & transformer_mask
+                continue
+            sales_df = self._apply_mask(sales_df, mask)
+            mask = None
             if isinstance(transformer, TransformerFeatureSubset):
-                sales_df.loc[:, transformer.feature_subset] = transformer.transformer.fit_transform(
-                    sales_df[transformer.feature_subset])
-            else:
+                # The subset goes through the transformer as a single float buffer, and comes back column by column
+                subset = transformer.feature_subset
+                values = sales_df[subset].to_numpy(dtype=_get_float_dtype(sales_df[subset].dtypes), na_value=np.nan)
+                if fit:
+                    values = transformer.transformer.fit_transform(values)
+                else:
+                    values = transformer.transformer.transform(values)
+                for i, column in enumerate(subset):
+                    sales_df[column] = values[:, i]
+            elif fit:
                 sales_df = transformer.fit_transform(sales_df)
+            else:
+                sales_df = transformer.transform(sales_df)
+        return self._apply_mask(sales_df, mask)
+
+    def _apply_mask(self, sales_df: pd.DataFrame, mask: np.ndarray) -> pd.DataFrame:
+        if mask is None or mask.all():
+            return sales_df
+        self._logger.info(f"Scopes removed {sales_df.shape[0] - mask.sum()} rows. Number of remaining rows: {mask.sum()}")
+        return sales_df.take(np.flatnonzero(mask))
+
+    def fit_transform(self, sales_df: pd.DataFrame):
+        self._logger.info(f"Preprocessing the data (fit_transform, for training). Data shape: {sales_df.shape}")
+        sales_df = self._run_transformers(sales_df, fit=True)
         for transformer in self._target_transformer_list:
-            sales_df.loc[:, "sales_qty"] = transformer.fit_transform(sales_df["sales_qty"])
+            sales_df["sales_qty"] = transformer.fit_transform(sales_df["sales_qty"])
 
         self._logger.info(f"Data shape after preprocessing: {sales_df.shape}")
         return sales_df
 
     def transform(self, sales_df: pd.DataFrame):
         self._logger.info(f"Preprocessing the data (transform, for predicting). Data shape: {sales_df.shape}")
-        for transformer in self._transformer_list:
-            if isinstance(transformer, TransformerFeatureSubset):
-                sales_df.loc[:, transformer.feature_subset] = transformer.transformer.transform(
-                    sales_df[transformer.feature_subset])
-            else:
-                sales_df = transformer.transform(sales_df)
+        sales_df = self._run_transformers(sales_df, fit=False)
         self._logger.info(f"Data shape after preprocessing: {sales_df.shape}")
         return sales_df
 
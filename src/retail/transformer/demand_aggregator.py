@@ -1,6 +1,10 @@
 import logging
-from typing import List
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List
 
+import numpy as np
 import pandas as pd
 
 from retail.domain import Feature
@@ -14,14 +18,210 @@ AggregationLevel = {
 }
 
 
+# Reductions that the sorted fast path computes like pandas: NaN values are skipped, an empty sum is 0 and the first
+# value of a group is its first non null value
+SORTED_REDUCTIONS = ('sum', 'mean', 'first', 'min', 'max')
+
+
+def _get_sorted_codes(values: pd.Series) -> (np.ndarray, int):
+    # Codes that sort like groupby sorts its keys (categories in their order), -1 for missing keys
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy().astype(np.int64), len(values.cat.categories)
+    codes, uniques = pd.factorize(values, sort=True)
+    return codes.astype(np.int64), len(uniques)
+
+
+def _can_reduce_sorted(df: pd.DataFrame, aggregation_f_dict: Dict) -> bool:
+    for column, aggregation_f in aggregation_f_dict.items():
+        if not isinstance(aggregation_f, str) or aggregation_f not in SORTED_REDUCTIONS:
+            return False
+        dtype = df[column].dtype
+        if aggregation_f in ('sum', 'mean') and not (dtype.kind in 'iuf' and isinstance(dtype, np.dtype)):
+            return False
+        if aggregation_f in ('min', 'max') and not (dtype.kind in 'iufM' and isinstance(dtype, np.dtype)):
+            return False
+    return True
+
+
+def _reduce_sorted(df: pd.DataFrame, aggregation_level: List[str], aggregation_f_dict: Dict) -> pd.DataFrame:
+    # Same result as groupby(aggregation_level, observed=True).agg(aggregation_f_dict).reset_index(): the rows are
+    # sorted once on an integer key, and every reduction runs on the group boundaries with ufunc.reduceat
+    keys = [_get_sorted_codes(df[column]) for column in aggregation_level]
+    missing = np.zeros(len(df), dtype=bool)
+    for codes, _ in keys:
+        missing |= codes < 0
+    rows = np.flatnonzero(~missing) if missing.any() else None
+    if rows is not None:
+        keys = [(codes[rows], n) for codes, n in keys]
+    if np.prod([float(n) for _, n in keys]) < 2 ** 62:
+        key = np.zeros(len(df) if rows is None else len(rows), dtype=np.int64)
+        for codes, n in keys:
+            key *= n
+            key += codes
+        order = np.argsort(key, kind='stable')
+        group_changes = np.diff(key[order]) != 0
+    else:
+        order = np.lexsort([codes for codes, _ in reversed(keys)])
+        group_changes = np.zeros(max(len(order) - 1, 0), dtype=bool)
+        for codes, _ in keys:
+            group_changes |= np.diff(codes[order]) != 0
+    if rows is not None:
+        order = rows[order]
+    if len(order) == 0:
+        return df.iloc[:0].groupby(aggregation_level, observed=True).agg(aggregation_f_dict).reset_index()
+    starts = np.flatnonzero(np.r_[True, group_changes])
+
+    first_rows = order[starts]
+    # Every group has a single row at the finest levels: the reductions are then the values themselves
+    singletons = len(starts) == len(order)
+    columns = {column: df[column].take(first_rows).reset_index(drop=True) for column in aggregation_level}
+    for column, aggregation_f in aggregation_f_dict.items():
+        series = df[column]
+        if aggregation_f == 'first':
+            firsts = series.take(first_rows).reset_index(drop=True)
+            if not singletons and firsts.isna().any():
+                # Only then can the first non null value of a group be on a later row
+                observed = series.notna().to_numpy()[order]
+                positions = np.minimum.reduceat(np.where(observed, np.arange(len(order)), len(order)), starts)
+                rows = np.where(positions < len(order), order[np.minimum(positions, len(order) - 1)], -1)
+                firsts = pd.Series(series.array.take(rows, allow_fill=True))
+            columns[column] = firsts
+            continue
+
+        values = series.to_numpy()[order]
+        is_float = values.dtype.kind == 'f'
+        if aggregation_f in ('sum', 'mean'):
+            observed = ~np.isnan(values) if is_float else np.ones(len(values), dtype=bool)
+            filled = np.where(observed, values, 0) if is_float else values
+            if singletons:
+                sums, counts = filled, observed
+            else:
+                sums = np.add.reduceat(filled, starts, dtype=np.float64 if is_float else
+                                       np.uint64 if values.dtype.kind == 'u' else np.int64)
+                counts = np.add.reduceat(observed, starts, dtype=np.int64)
+            if aggregation_f == 'sum':
+                # Like groupby, integers are summed in int64 (uint64 if unsigned) and the sums are only cast back to
+                # the dtype of the values when they all fit in it
+                fits = is_float or len(sums) == 0 or \
+                    (sums.min() >= np.iinfo(values.dtype).min and sums.max() <= np.iinfo(values.dtype).max)
+                columns[column] = sums.astype(values.dtype) if fits else sums
+            else:
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    means = sums / counts
+                columns[column] = means.astype(values.dtype if is_float else np.float64)
+        elif singletons:
+            columns[column] = values
+        elif is_float:
+            reduction = np.fmin if aggregation_f == 'min' else np.fmax
+            columns[column] = reduction.reduceat(values, starts)
+        elif values.dtype.kind == 'M':
+            # NaT is the smallest datetime64: it is replaced by the largest for the minimum, and kept for the maximum
+            integers = values.view(np.int64)
+            if aggregation_f == 'min':
+                integers = np.where(np.isnat(values), np.iinfo(np.int64).max, integers)
+                reduced = np.minimum.reduceat(integers, starts)
+                reduced[reduced == np.iinfo(np.int64).max] = np.iinfo(np.int64).min
+            else:
+                reduced = np.maximum.reduceat(integers, starts)
+            columns[column] = reduced.view(values.dtype)
+        else:
+            reduction = np.minimum if aggregation_f == 'min' else np.maximum
+            columns[column] = reduction.reduceat(values, starts)
+    return pd.DataFrame(columns)
+
+
+def _aggregate(df: pd.DataFrame, aggregation_level: List[str], aggregation_f_dict: Dict) -> pd.DataFrame:
+    if _can_reduce_sorted(df, aggregation_f_dict):
+        return _reduce_sorted(df, aggregation_level, aggregation_f_dict)
+    return df.groupby(aggregation_level, observed=True).agg(aggregation_f_dict).reset_index()
+
+
+def _share_columns(df: pd.DataFrame, rows: np.ndarray) -> (List[SharedMemory], Dict):
+    # Copies the given rows of every column into shared memory blocks, as numpy values or integer codes. Returns the
+    # blocks, and what a worker needs to rebuild the columns: block name, dtype, length, kind and categories.
+    blocks = []
+    descriptors = {}
+    for column in df.columns:
+        series = df[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            values, kind, parameter = series.cat.codes.to_numpy(), 'category', series.dtype
+        elif series.dtype == object or not isinstance(series.dtype, np.dtype):
+            codes, uniques = pd.factorize(series, use_na_sentinel=False)
+            values, kind, parameter = codes, 'codes', uniques
+        else:
+            values, kind, parameter = series.to_numpy(), 'values', None
+        block = SharedMemory(create=True, size=max(values.dtype.itemsize * len(rows), 1))
+        blocks.append(block)
+        np.ndarray((len(rows),), dtype=values.dtype, buffer=block.buf)[:] = values[rows]
+        descriptors[column] = (block.name, values.dtype.str, len(rows), kind, parameter)
+    return blocks, descriptors
+
+
+def _aggregate_partition(descriptors: Dict,
+                         start: int,
+                         end: int,
+                         aggregation_level: List[str],
+                         aggregation_f_dict: Dict) -> pd.DataFrame:
+    columns = {}
+    for column, (name, dtype, length, kind, parameter) in descriptors.items():
+        block = SharedMemory(name=name)
+        try:
+            values = np.ndarray((length,), dtype=np.dtype(dtype), buffer=block.buf)[start:end].copy()
+        finally:
+            block.close()
+        if kind == 'category':
+            columns[column] = pd.Categorical.from_codes(values, dtype=parameter)
+        elif kind == 'codes':
+            columns[column] = parameter.take(values)
+        else:
+            columns[column] = values
+    return _aggregate(pd.DataFrame(columns), aggregation_level, aggregation_f_dict)
+
+
 class DemandAggregator(Aggregator):
     def __init__(self,
                  aggregation_level: AggregationLevel,
                  feature_list: List[Feature],
-                 logger: logging.Logger = None):
+                 logger: logging.Logger = None,
+                 n_jobs: int = 1):
         self._aggregation_level = aggregation_level
         self._feature_list = feature_list
         self._logger = logger or logging.getLogger(__name__)
+        # Above 1, the rows are partitioned on the leading aggregation key (the store) and the partitions are
+        # aggregated by a pool of n_jobs processes
+        self._n_jobs = n_jobs
+
+    def _aggregate_partitions(self, df: pd.DataFrame, feature_aggregation_f_dict: Dict) -> pd.DataFrame:
+        # The rows are sorted by partition key in the order of the groupby keys, copied once into shared memory, and
+        # each worker reads the range of rows of its partitions: the concatenated results are in the serial order
+        partition_values = df[self._aggregation_level[0]]
+        if isinstance(partition_values.dtype, pd.CategoricalDtype):
+            partition_codes = partition_values.cat.codes.to_numpy()
+            n_partitions = len(partition_values.cat.categories)
+        else:
+            partition_codes, uniques = pd.factorize(partition_values, sort=True)
+            n_partitions = len(uniques)
+        # Rows without a partition key are dropped, like groupby does
+        rows = np.flatnonzero(partition_codes >= 0)
+        rows = rows[np.argsort(partition_codes[rows], kind='stable')]
+        ends = np.cumsum(np.bincount(partition_codes[rows], minlength=n_partitions))
+        starts = ends - np.bincount(partition_codes[rows], minlength=n_partitions)
+
+        columns = list(dict.fromkeys(self._aggregation_level + list(feature_aggregation_f_dict)))
+        blocks, descriptors = _share_columns(df[columns], rows)
+        try:
+            with ProcessPoolExecutor(max_workers=self._n_jobs) as executor:
+                futures = [executor.submit(_aggregate_partition, descriptors, start, end, self._aggregation_level,
+                                           feature_aggregation_f_dict)
+                           for start, end in zip(starts.tolist(), ends.tolist()) if end > start]
+                results = [future.result() for future in futures]
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+        if not results:
+            return _aggregate(df, self._aggregation_level, feature_aggregation_f_dict)
+        return pd.concat(results, ignore_index=True)
 
     def fit_transform(self, df: pd.DataFrame) -> pd.DataFrame:
         original_n_rows = df.shape[0]
@@ -31,9 +231,19 @@ class DemandAggregator(Aggregator):
              if f.name not in self._aggregation_level
              ]
         )
-        df = df.groupby(self._aggregation_level).agg(feature_aggregation_f_dict).reset_index()
+        n_jobs = self._n_jobs
+        if n_jobs > 1:
+            try:
+                pickle.dumps(feature_aggregation_f_dict)
+            except (pickle.PicklingError, AttributeError, TypeError):
+                self._logger.warning("Aggregator functions cannot be sent to worker processes, aggregating serially")
+                n_jobs = 1
+        if n_jobs > 1:
+            df = self._aggregate_partitions(df, feature_aggregation_f_dict)
+        else:
+            df = _aggregate(df, self._aggregation_level, feature_aggregation_f_dict)
         self._logger.info(f"Aggregator aggregated {original_n_rows} rows into {df.shape[0]}")
         return df
 
     def transform(self, df: pd.DataFrame) -> pd.DataFrame:
-        return df
\ No newline at end of file
+        return df
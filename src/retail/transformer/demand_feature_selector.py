@@ -25,7 +25,8 @@ class DemandFeatureSelector(FeatureSelector):
                   df: pd.DataFrame,
                   ) -> pd.DataFrame:
         original_n_features = df.shape[1]
-        df = df[[f.name for f in self._feature_list]]
+        # A projection on the columns of df, without copying them
+        df = pd.DataFrame({f.name: df[f.name] for f in self._feature_list}, copy=False)
         self._logger.info(
             f"DemandFeatureSelector removed {original_n_features - df.shape[1]} features, keeping {df.shape[1]}")
         return df
@@ -1,12 +1,73 @@
 import logging
-from typing import List
+from typing import List, Tuple
 
+import numpy as np
 import pandas as pd
 
 from retail.domain import Feature
 from retail.transformer.interfaces import Scope
 
 
+PARTITION_COLUMNS = ['store_id', 'cat_id', 'dept_id']
+
+
+def _get_codes(values: pd.Series) -> (np.ndarray, pd.Index):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), values.cat.categories
+    codes, uniques = pd.factorize(values)
+    return codes, pd.Index(uniques)
+
+
+def _isin(values: pd.Series, value_list: List, rows: np.ndarray = None) -> np.ndarray:
+    # Over the codes of categorical columns: the list is matched against the categories only
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.codes.to_numpy()
+        is_listed = np.append(values.cat.categories.isin(value_list), False)
+        return is_listed[codes if rows is None else codes[rows]]
+    if rows is not None:
+        values = values.iloc[rows]
+    return values.isin(value_list).to_numpy()
+
+
+class DemandPartitionIndex:
+    # Rows of a frame grouped by (store_id, cat_id, dept_id) partition, so that a scope on these columns finds its
+    # rows without scanning the others. It is only valid for the frame it was built from, and the frames with the same
+    # rows: the row index of the frame is kept as their token. Pandas indexes are immutable, so shallow copies and
+    # frames with added columns share it, while reordered or filtered frames get a new one.
+    def __init__(self, df: pd.DataFrame):
+        self._n_rows = df.shape[0]
+        self._row_index = df.index
+        key = np.zeros(self._n_rows, dtype=np.int64)
+        partition_values = []
+        for column in PARTITION_COLUMNS:
+            codes, uniques = _get_codes(df[column])
+            key = key * (len(uniques) + 1) + codes + 1
+            partition_values.append((codes, uniques))
+        self._rows = np.argsort(key, kind='stable')
+        sorted_key = key[self._rows]
+        starts = np.flatnonzero(np.r_[True, sorted_key[1:] != sorted_key[:-1]]) if self._n_rows else \
+            np.empty(0, dtype=int)
+        first_rows = self._rows[starts]
+        self._partitions = pd.DataFrame({column: uniques.take(codes[first_rows], allow_fill=True, fill_value=np.nan)
+                                         for column, (codes, uniques) in zip(PARTITION_COLUMNS, partition_values)})
+        self._starts = starts
+        self._ends = np.r_[starts[1:], self._n_rows]
+
+    def __len__(self):
+        return self._n_rows
+
+    def is_built_on(self, df: pd.DataFrame) -> bool:
+        return df.index is self._row_index and df.shape[0] == self._n_rows
+
+    def find_rows(self, value_lists: dict) -> np.ndarray:
+        # Sorted positions of the rows whose partition columns are in the given lists
+        selected = np.ones(len(self._partitions), dtype=bool)
+        for column, value_list in value_lists.items():
+            selected &= self._partitions[column].isin(value_list).to_numpy()
+        rows = [self._rows[start:end] for start, end in zip(self._starts[selected], self._ends[selected])]
+        return np.sort(np.concatenate(rows + [np.empty(0, dtype=self._rows.dtype)]))
+
+
 class DemandScope(Scope):
     def __init__(self,
                  start_date: str = None,
@@ -15,6 +76,7 @@ class DemandScope(Scope):
                  cat_id_list: List[str] = None,
                  sku_id_list: List[str] = None,
                  dept_id_list: List[str] = None,
+                 partition_index: DemandPartitionIndex = None,
                  logger: logging.Logger = None
                  ):
         self._start_date = start_date
@@ -23,32 +85,90 @@ class DemandScope(Scope):
         self._cat_id_list = cat_id_list
         self._sku_id_list = sku_id_list
         self._dept_id_list = dept_id_list
+        # Optional index of the frame to scope: only the rows of the selected partitions are then read. Other frames,
+        # like validation data, are scanned.
+        self._partition_index = partition_index
         self._logger = logger or logging.getLogger(__name__)
 
     def fit_transform(self,
                       df: pd.DataFrame,
                       ) -> pd.DataFrame:
-        original_n_rows = df.shape[0]
-        if self._start_date:
-            df = df[df["transaction_date"] >= self._start_date]
-        if self._end_date:
-            df = df[df["transaction_date"] < self._end_date]
-        df = self.transform(df)
-        return df
+        return self._filter(df, self.fit_mask(df))
 
     def transform(self,
                   df: pd.DataFrame,
                   ) -> pd.DataFrame:
+        return self._filter(df, self.mask(df))
+
+    def fit_mask(self,
+                 df: pd.DataFrame,
+                 ) -> np.ndarray:
+        return self._get_mask(df, with_dates=True)
+
+    def mask(self,
+             df: pd.DataFrame,
+             ) -> np.ndarray:
+        return self._get_mask(df, with_dates=False)
+
+    def get_filters(self,
+                    with_dates: bool = True,
+                    ) -> List[Tuple]:
+        # The predicates of fit_mask (with_dates) or mask as (column, operator, value) parquet filters, for readers
+        # that push them down
+        filters = [(column, 'in', list(value_list)) for column, value_list in self._get_value_lists().items()]
+        if with_dates and self._start_date:
+            filters.append(("transaction_date", '>=', pd.Timestamp(self._start_date)))
+        if with_dates and self._end_date:
+            filters.append(("transaction_date", '<', pd.Timestamp(self._end_date)))
+        return filters
+
+    def _get_value_lists(self) -> dict:
+        return {column: value_list for column, value_list in [('store_id', self._store_id_list),
+                                                               ('cat_id', self._cat_id_list),
+                                                               ('sku_id', self._sku_id_list),
+                                                               ('dept_id', self._dept_id_list)]
+                if value_list}
+
+    def _get_mask(self,
+                  df: pd.DataFrame,
+                  with_dates: bool,
+                  ) -> np.ndarray:
+        # Every predicate is evaluated on the candidate rows (all rows, or those of the selected partitions) and
+        # combined into a single mask
+        value_lists = self._get_value_lists()
+        rows = None
+        partition_value_lists = {column: value_list for column, value_list in value_lists.items()
+                                 if column in PARTITION_COLUMNS}
+        if self._partition_index is not None and partition_value_lists and self._partition_index.is_built_on(df):
+            rows = self._partition_index.find_rows(partition_value_lists)
+            value_lists = {column: value_list for column, value_list in value_lists.items()
+                           if column not in PARTITION_COLUMNS}
+
+        keep = np.ones(df.shape[0] if rows is None else len(rows), dtype=bool)
+        for column, value_list in value_lists.items():
+            keep &= _isin(df[column], value_list, rows)
+        if with_dates and (self._start_date or self._end_date):
+            dates = df["transaction_date"].to_numpy()
+            if rows is not None:
+                dates = dates[rows]
+            if self._start_date:
+                keep &= dates >= pd.Timestamp(self._start_date).to_datetime64()
+            if self._end_date:
+                keep &= dates < pd.Timestamp(self._end_date).to_datetime64()
+
+        if rows is None:
+            return keep
+        mask = np.zeros(df.shape[0], dtype=bool)
+        mask[rows[keep]] = True
+        return mask
+
+    def _filter(self,
+                df: pd.DataFrame,
+                mask: np.ndarray,
+                ) -> pd.DataFrame:
         original_n_rows = df.shape[0]
-        if self._store_id_list:
-            df = df[df["store_id"].isin(self._store_id_list)]
-        if self._cat_id_list:
-            df = df[df["cat_id"].isin(self._cat_id_list)]
-        if self._sku_id_list:
-            df = df[df["sku_id"].isin(self._sku_id_list)]
-        if self._dept_id_list:
-            df = df[df["dept_id"].isin(self._dept_id_list)]
+        if not mask.all():
+            df = df.take(np.flatnonzero(mask))
         self._logger.info(
             f"DemandScope removed {original_n_rows - df.shape[0]} Rows. Number of remaining rows: {df.shape[0]}")
         return df
-
@@ -1,3 +1,5 @@
+import numpy as np
+
 from retail.domain import Dataset, Transformer
 
 
@@ -24,6 +26,14 @@ class Scope(Transformer):
     def transform(self, dataset: Dataset) -> Dataset:
         pass
 
+    # Boolean masks of the rows that fit_transform and transform keep, so that consecutive scopes can be combined and
+    # applied at once
+    def fit_mask(self, dataset: Dataset) -> np.ndarray:
+        pass
+
+    def mask(self, dataset: Dataset) -> np.ndarray:
+        pass
+
 
 class Aggregator(Transformer):
     def fit_transform(self, dataset: Dataset) -> Dataset:
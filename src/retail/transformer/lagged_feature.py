@@ -1,25 +1,60 @@
 import logging
 from typing import List
 
+import numpy as np
 import pandas as pd
 
 from retail.transformer.interfaces import Featurizer
+from retail.transformer.series_window import sort_series, get_positions, shift, rolling, unsort
 
 
 class LaggedFeature(Featurizer):
+    # Lags and trailing rolling statistics of a feature, within each (store_id, sku_id) series ordered by date.
+    # The rolling windows end on the previous row, so no feature sees the value of its own row.
     def __init__(self,
                  feature_name: str,
-                 transformed_feature_name: str,
-                 lag: int,
+                 transformed_feature_name: str = None,
+                 lag: int = None,
+                 lags: List[int] = None,
+                 rolling_windows: List[int] = None,
+                 rolling_functions: List[str] = ('mean', 'std'),
+                 group_columns: List[str] = ('store_id', 'sku_id'),
+                 order_column: str = 'transaction_date',
                  logger: logging.Logger = None):
         self._feature_name = feature_name
-        self._transformed_feature_name = transformed_feature_name
-        self._lag = lag
+        self._lags = list(lags or []) + ([lag] if lag is not None else [])
+        self._transformed_feature_names = {lag: transformed_feature_name} if transformed_feature_name else {}
+        self._rolling_windows = list(rolling_windows or [])
+        self._rolling_functions = list(rolling_functions)
+        self._group_columns = list(group_columns)
+        self._order_column = order_column
         self._logger = logger or logging.getLogger(__name__)
 
+    def _get_lag_name(self, lag: int) -> str:
+        return self._transformed_feature_names.get(lag, f"{self._feature_name}_lag_{lag}")
+
+    def _get_rolling_name(self, function: str, window: int) -> str:
+        return f"{self._feature_name}_rolling_{function}_{window}"
+
     def fit_transform(self, df: pd.DataFrame) -> pd.DataFrame:
         return self.transform(df)
 
     def transform(self, df: pd.DataFrame) -> pd.DataFrame:
-        df[self._transformed_feature_name] = df[self._feature_name].shift(self._lag) #FIXME: not so fast :-)
+        # Rows are sorted once by (series, date): each series is then a contiguous run of the sorted values, and every
+        # lag or window is a shift of the whole array masked by the position of the row in its series
+        order, starts = sort_series(df, self._group_columns, self._order_column)
+        positions = get_positions(starts, len(order))
+        values = df[self._feature_name].to_numpy()[order]
+        dtype = values.dtype if np.issubdtype(values.dtype, np.floating) else np.float64
+
+        columns = {}
+        for lag in self._lags:
+            columns[self._get_lag_name(lag)] = shift(values, positions, lag).astype(dtype)
+        statistics = rolling(values, positions, self._rolling_windows, self._rolling_functions)
+        for (function, window), sorted_values in statistics.items():
+            columns[self._get_rolling_name(function, window)] = sorted_values.astype(dtype)
+
+        for name, sorted_values in columns.items():
+            df[name] = unsort(sorted_values, order)
+        self._logger.info(f"LaggedFeature added {list(columns)}")
         return df
@@ -0,0 +1,54 @@
+import logging
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from retail.transformer.interfaces import Featurizer
+from retail.transformer.series_window import sort_series, get_positions, shift, rolling, ewm_mean, unsort
+
+
+class RollingFeature(Featurizer):
+    # Rolling sums, means and standard deviations, and exponentially weighted means, of several features within each
+    # (store_id, sku_id) series ordered by date. Every statistic stops lag rows before its own row (the previous row
+    # by default), so that sales_qty can be summarized without leaking the target.
+    def __init__(self,
+                 feature_names: List[str] = ('sales_qty', 'price'),
+                 windows: List[int] = (7, 28),
+                 functions: List[str] = ('mean', 'sum', 'std'),
+                 ewm_spans: List[int] = (),
+                 lag: int = 1,
+                 group_columns: List[str] = ('store_id', 'sku_id'),
+                 order_column: str = 'transaction_date',
+                 logger: logging.Logger = None):
+        self._feature_names = list(feature_names)
+        self._windows = list(windows)
+        self._functions = list(functions)
+        self._ewm_spans = list(ewm_spans)
+        self._lag = lag
+        self._group_columns = list(group_columns)
+        self._order_column = order_column
+        self._logger = logger or logging.getLogger(__name__)
+
+    def fit_transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        return self.transform(df)
+
+    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        order, starts = sort_series(df, self._group_columns, self._order_column)
+        positions = get_positions(starts, len(order))
+
+        columns = {}
+        for feature_name in self._feature_names:
+            values = df[feature_name].to_numpy()[order]
+            dtype = values.dtype if np.issubdtype(values.dtype, np.floating) else np.float64
+            statistics = rolling(values, positions, self._windows, self._functions, lag=self._lag)
+            for (function, window), sorted_values in statistics.items():
+                columns[f"{feature_name}_rolling_{function}_{window}"] = sorted_values.astype(dtype)
+            for span in self._ewm_spans:
+                means = ewm_mean(values, starts, alpha=2 / (span + 1))
+                columns[f"{feature_name}_ewm_{span}"] = shift(means, positions, self._lag).astype(dtype)
+
+        for name, sorted_values in columns.items():
+            df[name] = unsort(sorted_values, order)
+        self._logger.info(f"RollingFeature added {list(columns)}")
+        return df
@@ -0,0 +1,121 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+ROLLING_FUNCTIONS = ('mean', 'sum', 'std')
+
+
+def _get_codes(values) -> Tuple[np.ndarray, int]:
+    # Dense codes that sort like the values (missing values last), and their number
+    codes, uniques = pd.factorize(values)
+    ranks = np.empty(len(uniques) + 1, dtype=np.int64)
+    ranks[np.argsort(np.asarray(uniques), kind='stable')] = np.arange(len(uniques))
+    ranks[-1] = len(uniques)
+    return ranks[codes], len(uniques) + 1
+
+
+def sort_series(df: pd.DataFrame, group_columns: List[str], order_column: str) -> Tuple[np.ndarray, np.ndarray]:
+    # Order of the rows by (series, order_column), and the first sorted row of each series: every series is then a
+    # contiguous run of any column taken in that order. The keys are folded into a single integer when it fits, which
+    # sorts several times faster than a lexsort.
+    series_keys = [_get_codes(df[column]) for column in group_columns]
+    order_codes, n_order_codes = _get_codes(df[order_column])
+    if np.prod([float(n) for _, n in series_keys]) * n_order_codes < 2 ** 62:
+        key = np.zeros(len(df), dtype=np.int64)
+        for codes, n in series_keys + [(order_codes, n_order_codes)]:
+            key = key * n + codes
+        order = np.argsort(key, kind='stable')
+        series_changes = np.diff(key[order] // n_order_codes) != 0
+    else:
+        order = np.lexsort([order_codes] + [codes for codes, _ in reversed(series_keys)])
+        series_changes = np.zeros(max(len(df) - 1, 0), dtype=bool)
+        for codes, _ in series_keys:
+            series_changes |= np.diff(codes[order]) != 0
+    starts = np.flatnonzero(np.r_[True, series_changes]) if len(order) else np.empty(0, dtype=int)
+    return order, starts
+
+
+def get_positions(starts: np.ndarray, n_rows: int) -> np.ndarray:
+    # Position of each sorted row in its series
+    return np.arange(n_rows) - np.repeat(starts, np.diff(np.r_[starts, n_rows]))
+
+
+def shift(values: np.ndarray, positions: np.ndarray, lag: int) -> np.ndarray:
+    shifted = np.full(len(values), np.nan, dtype=np.result_type(values.dtype, np.float32))
+    # A lag longer than all the rows leaves every value missing
+    shifted[lag:] = values[:max(len(values) - lag, 0)]
+    shifted[positions < lag] = np.nan
+    return shifted
+
+
+def rolling(values: np.ndarray, positions: np.ndarray, windows: List[int], functions: List[str],
+            lag: int = 1) -> Dict[Tuple[str, int], np.ndarray]:
+    # Statistics of the window rows i-lag-w+1..i-lag of each series, from differences of cumulative sums. NaN values
+    # are left out of the counts, and a window is NaN until it has w observed values.
+    unknown_functions = set(functions) - set(ROLLING_FUNCTIONS)
+    if unknown_functions:
+        raise ValueError(f"Unknown rolling functions {unknown_functions}, expected some of {ROLLING_FUNCTIONS}")
+    observed = ~np.isnan(values.astype(np.float64))
+    filled = np.where(observed, values, 0).astype(np.float64)
+    # The values are centred on the mean of their series: the cumulative sums then stay close to 0 over the whole
+    # frame, instead of growing with it and losing the precision of every window difference
+    starts = np.flatnonzero(positions == 0)
+    lengths = np.diff(np.r_[starts, len(values)])
+    if len(starts):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            series_means = np.add.reduceat(filled, starts) / np.add.reduceat(observed, starts)
+        offsets = np.repeat(np.nan_to_num(series_means), lengths)
+    else:
+        offsets = np.zeros(0)
+    centred = np.where(observed, filled - offsets, 0)
+    cumulative_counts = np.r_[0, np.cumsum(observed)]
+    cumulative_sums = np.r_[0, np.cumsum(centred)]
+    cumulative_squares = np.r_[0, np.cumsum(centred * centred)] if 'std' in functions else None
+    ends = np.maximum(np.arange(len(values)) + 1 - lag, 0)
+
+    result = {}
+    for window in windows:
+        begins = np.maximum(ends - window, 0)
+        counts = cumulative_counts[ends] - cumulative_counts[begins]
+        centred_sums = cumulative_sums[ends] - cumulative_sums[begins]
+        # Complete windows are within the series of their row, and share its offset
+        complete = (positions >= window + lag - 1) & (counts == window)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            centred_means = centred_sums / counts
+            if 'sum' in functions:
+                result['sum', window] = np.where(complete, centred_sums + counts * offsets, np.nan)
+            if 'mean' in functions:
+                result['mean', window] = np.where(complete, centred_means + offsets, np.nan)
+            if 'std' in functions:
+                squares = cumulative_squares[ends] - cumulative_squares[begins]
+                variances = np.maximum(squares - centred_sums * centred_means, 0) / (counts - 1)
+                result['std', window] = np.where(complete & (counts > 1), np.sqrt(variances), np.nan)
+    return result
+
+
+def ewm_mean(values: np.ndarray, starts: np.ndarray, alpha: float) -> np.ndarray:
+    # Exponentially weighted mean of each series up to each row (pandas adjust=False, ignore_na=True). Series are
+    # advanced one step at a time, all together: longest series first, so that the running ones are a prefix.
+    n_rows = len(values)
+    lengths = np.diff(np.r_[starts, n_rows])
+    by_length = np.argsort(-lengths, kind='stable')
+    starts, lengths = starts[by_length], lengths[by_length]
+    values = values.astype(np.float64)
+    means = np.full(n_rows, np.nan)
+    state = np.full(len(starts), np.nan)
+    for step in range(lengths[0] if len(lengths) else 0):
+        n_running = np.searchsorted(-lengths, -step, side='left')
+        rows = starts[:n_running] + step
+        x, previous = values[rows], state[:n_running]
+        state[:n_running] = np.where(np.isnan(previous), x,
+                                     np.where(np.isnan(x), previous, alpha * x + (1 - alpha) * previous))
+        means[rows] = state[:n_running]
+    return means
+
+
+def unsort(sorted_values: np.ndarray, order: np.ndarray) -> np.ndarray:
+    values = np.empty_like(sorted_values)
+    values[order] = sorted_values
+    return values
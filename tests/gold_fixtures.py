@@ -0,0 +1,79 @@
+import zlib
+
+import numpy as np
+
+from data_gold.domain import Observation, OfferSegmentPeriod, PriceDistribution, Period, Horizon, Scope, \
+    SegmentationScheme, SkuGroup, SkuSegmentation, StoreGroup, StoreSegmentation
+from data_gold.repository import ObservationRepository, PriceRepository
+
+
+# Segmentation schemes of one store or sku per group, and repositories whose values are computed from the offer
+# segment periods they are asked for: the tests of the gold layer and of the featurizers compare against them
+
+
+def get_segmentation_scheme(store_group_names=('CA_1', 'TX_1'),
+                            sku_group_names=('FOODS_1', 'HOBBIES_1', 'HOUSEHOLD_1'),
+                            period_indexes=range(8)) -> SegmentationScheme:
+    # The horizon may be filtered: the index of a period is then not its position in horizon.periods
+    periods = [Period(index=i, start=f"2016-{i // 28 + 1:02d}-{i % 28 + 1:02d}",
+                      end=f"2016-{i // 28 + 1:02d}-{i % 28 + 2:02d}") for i in period_indexes]
+    store_groups = {name: StoreGroup(name, [name]) for name in store_group_names}
+    sku_groups = {name: SkuGroup(name, [name]) for name in sku_group_names}
+    return SegmentationScheme(
+        store_segmentation=StoreSegmentation(store_groups, {name: name for name in store_groups}),
+        sku_segmentation=SkuSegmentation(sku_groups, {name: name for name in sku_groups}),
+        horizon=Horizon(periods=periods,
+                        date_to_period={period.start: period for period in periods},
+                        period_to_dates={period: [period.start] for period in periods},
+                        period_attributes={period: {} for period in periods}))
+
+
+def _get_segment_code(offer_segment_period: OfferSegmentPeriod) -> int:
+    key = f"{offer_segment_period.store_group_name}|{offer_segment_period.sku_group_name}"
+    return zlib.crc32(key.encode()) % 100
+
+
+def get_total_sales_qty(offer_segment_period: OfferSegmentPeriod, version: int = 0) -> float:
+    # Below 1000 for version 0
+    return 1000 * version + 10 * _get_segment_code(offer_segment_period) + offer_segment_period.period.index
+
+
+def get_mean_price(offer_segment_period: OfferSegmentPeriod) -> float:
+    # No price in the first period
+    if offer_segment_period.period.index == 0:
+        return np.nan
+    return 1 + _get_segment_code(offer_segment_period) / 10 + offer_segment_period.period.index / 100
+
+
+def get_expected_values(scope: Scope, get_value, lag: int = 0, missing_value: float = np.nan) -> np.ndarray:
+    # Values of the horizon period lag periods before each offer segment period of the scope, by offer segment then
+    # period, and missing_value where that period is not in the horizon
+    period_by_index = {period.index: period for period in scope.segmentation_scheme.horizon.periods}
+    values = []
+    for osp in scope.offer_segment_periods:
+        lagged_period = period_by_index.get(osp.period.index - lag)
+        values.append(missing_value if lagged_period is None else
+                      get_value(OfferSegmentPeriod(osp.store_group_name, osp.sku_group_name, lagged_period)))
+    return np.array(values, dtype=float)
+
+
+class KeyObservationRepository(ObservationRepository):
+    # Counts the queries and the offer segment periods they ask for; version changes every total
+    def __init__(self):
+        self.n_queries = 0
+        self.n_cells = 0
+        self.version = 0
+
+    def find(self, scope: Scope) -> list[Observation]:
+        self.n_queries += 1
+        self.n_cells += len(scope.offer_segment_periods)
+        return [Observation(offer_segment_period=osp, total_sales_qty=get_total_sales_qty(osp, self.version))
+                for osp in scope.offer_segment_periods]
+
+
+class KeyPriceRepository(PriceRepository):
+    def find(self, scope: Scope) -> list[PriceDistribution]:
+        return [PriceDistribution(offer_segment_period=osp,
+                                  price_probabilities={} if np.isnan(get_mean_price(osp)) else
+                                  {get_mean_price(osp): 1.0})
+                for osp in scope.offer_segment_periods]
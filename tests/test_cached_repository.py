@@ -0,0 +1,123 @@
+import threading
+import unittest
+
+import numpy as np
+
+from data_gold.cached_repository import CachedObservationRepository
+from data_gold.domain import Observation, OfferSegment, Scope
+from gold_fixtures import get_segmentation_scheme, get_total_sales_qty, get_expected_values, \
+    KeyObservationRepository
+
+
+def _get_expected_totals(repository: KeyObservationRepository, scope: Scope) -> np.ndarray:
+    totals = get_expected_values(scope, lambda osp: get_total_sales_qty(osp, repository.version))
+    return totals.reshape(len(scope.offer_segments), len(scope.periods))
+
+
+class CachedObservationRepositoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.segmentation_scheme = get_segmentation_scheme()
+        self.periods = self.segmentation_scheme.horizon.periods
+        self.offer_segments = self.segmentation_scheme.offer_segments
+        self.repository = KeyObservationRepository()
+        self.cached_repository = CachedObservationRepository(self.repository)
+
+    def _get_scope(self, offer_segments, periods) -> Scope:
+        return Scope(self.segmentation_scheme, offer_segments, periods)
+
+    def test_cells_are_queried_once(self):
+        scope = self._get_scope(self.offer_segments, self.periods[2:6])
+        np.testing.assert_array_equal(self.cached_repository.find_total_sales_qty(scope),
+                                      _get_expected_totals(self.repository, scope))
+        self.assertEqual(self.repository.n_cells, 6 * 4)
+        self.assertEqual((self.cached_repository.hits, self.cached_repository.misses), (0, 24))
+
+        # A shifted scope, as a lag featurizer asks for: only the new period is aggregated
+        shifted_scope = self._get_scope(self.offer_segments, self.periods[1:5])
+        np.testing.assert_array_equal(self.cached_repository.find_total_sales_qty(shifted_scope),
+                                      _get_expected_totals(self.repository, shifted_scope))
+        self.assertEqual(self.repository.n_cells, 6 * 5)
+        self.assertEqual((self.cached_repository.hits, self.cached_repository.misses), (18, 30))
+
+        # A fully cached scope, with segments and periods in another order
+        scope = self._get_scope(self.offer_segments[::-1][:4], self.periods[4:0:-1])
+        observations = self.cached_repository.find(scope)
+        self.assertEqual(self.repository.n_queries, 2)
+        self.assertEqual([observation.offer_segment_period for observation in observations],
+                         scope.offer_segment_periods)
+        np.testing.assert_array_equal([observation.total_sales_qty for observation in observations],
+                                      _get_expected_totals(self.repository, scope).ravel())
+
+    def test_invalidate_and_clear(self):
+        scope = self._get_scope(self.offer_segments, self.periods)
+        self.cached_repository.find_total_sales_qty(scope)
+        self.repository.version = 1
+
+        # Invalidated periods are aggregated again, the others are still served from the cache
+        self.cached_repository.invalidate(self.periods[6:])
+        totals = self.cached_repository.find_total_sales_qty(scope)
+        self.assertEqual(self.repository.n_cells, 6 * 8 + 6 * 2)
+        np.testing.assert_array_equal(totals[:, 6:], _get_expected_totals(self.repository, scope)[:, 6:])
+        self.assertTrue((totals[:, :6] < 1000).all())
+
+        self.cached_repository.clear()
+        np.testing.assert_array_equal(self.cached_repository.find_total_sales_qty(scope),
+                                      _get_expected_totals(self.repository, scope))
+        self.assertEqual(self.repository.n_cells, 6 * 8 * 2 + 6 * 2)
+
+    def test_least_recently_used_periods_are_evicted(self):
+        cached_repository = CachedObservationRepository(self.repository, max_periods=4)
+        cached_repository.find_total_sales_qty(self._get_scope(self.offer_segments, self.periods[:4]))
+        cached_repository.find_total_sales_qty(self._get_scope(self.offer_segments, self.periods[0:1]))
+        cached_repository.find_total_sales_qty(self._get_scope(self.offer_segments, self.periods[4:6]))
+        n_cells = self.repository.n_cells
+        # Periods 1 and 2 were evicted, period 0 was used more recently
+        cached_repository.find_total_sales_qty(self._get_scope(self.offer_segments, [self.periods[0]]))
+        self.assertEqual(self.repository.n_cells, n_cells)
+        cached_repository.find_total_sales_qty(self._get_scope(self.offer_segments, [self.periods[1]]))
+        self.assertEqual(self.repository.n_cells, n_cells + 6)
+
+    def test_segments_outside_of_the_scheme_are_not_cached(self):
+        scope = self._get_scope([OfferSegment('WI_1', 'FOODS_1')], self.periods[:2])
+        self.cached_repository.find_total_sales_qty(scope)
+        self.cached_repository.find_total_sales_qty(scope)
+        self.assertEqual(self.repository.n_queries, 2)
+        self.assertEqual(self.cached_repository.hits, 0)
+
+    def test_invalidate_dates(self):
+        scope = self._get_scope(self.offer_segments, self.periods)
+        self.cached_repository.find_total_sales_qty(scope)
+        self.cached_repository.invalidate_dates([self.periods[3].start, '2020-01-01'])
+        self.cached_repository.find_total_sales_qty(scope)
+        self.assertEqual(self.repository.n_cells, 6 * 8 + 6)
+
+    def test_queries_run_outside_of_the_lock(self):
+        # Each query waits for the other one: it only returns if both run at the same time
+        barrier = threading.Barrier(2, timeout=5)
+
+        class WaitingObservationRepository(KeyObservationRepository):
+            def find(self, scope: Scope) -> list[Observation]:
+                barrier.wait()
+                return super().find(scope)
+
+        repository = WaitingObservationRepository()
+        cached_repository = CachedObservationRepository(repository)
+        scopes = [self._get_scope(self.offer_segments[:3], self.periods), self._get_scope(self.offer_segments[3:],
+                                                                                          self.periods)]
+        results = [None, None]
+
+        def find(i):
+            results[i] = cached_repository.find_total_sales_qty(scopes[i])
+
+        threads = [threading.Thread(target=find, args=(i,)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for scope, totals in zip(scopes, results):
+            np.testing.assert_array_equal(totals, _get_expected_totals(repository, scope))
+        self.assertEqual(cached_repository.misses, 6 * 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
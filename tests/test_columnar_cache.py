@@ -0,0 +1,91 @@
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from xm5.columnar_cache import read_csv_cached, _is_valid, SELL_PRICES_DTYPES
+
+
+class ColumnarCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.source = Path(self.directory.name) / 'sell_prices.csv'
+        self.cache_directory = Path(self.directory.name) / 'cache'
+        self._write_prices(sell_price=1.5)
+
+    def _write_prices(self, sell_price: float):
+        pd.DataFrame({'store_id': ['CA_1', 'CA_1', 'TX_1'],
+                      'item_id': ['FOODS_1_001', 'FOODS_1_002', 'FOODS_1_001'],
+                      'wm_yr_wk': [11101, 11101, 11102],
+                      'sell_price': [sell_price, 2.25, 3.0]}).to_csv(self.source, index=False)
+
+    def _read(self) -> tuple[pd.DataFrame, int]:
+        # The frame, and whether the csv file was parsed
+        with mock.patch('xm5.columnar_cache.pd.read_csv', wraps=pd.read_csv) as read_csv:
+            df = read_csv_cached(self.source, self.cache_directory, SELL_PRICES_DTYPES)
+        return df, read_csv.call_count
+
+    def _touch(self, mtime_offset_ns: int = 10 ** 9):
+        stat = self.source.stat()
+        os.utime(self.source, ns=(stat.st_atime_ns, stat.st_mtime_ns + mtime_offset_ns))
+
+    def test_build_then_reuse(self):
+        built_df, n_reads = self._read()
+        self.assertEqual(n_reads, 1)
+        self.assertTrue((self.cache_directory / 'sell_prices.arrow').exists())
+        pd.testing.assert_frame_equal(built_df, pd.read_csv(self.source, dtype=SELL_PRICES_DTYPES))
+
+        cached_df, n_reads = self._read()
+        self.assertEqual(n_reads, 0)
+        pd.testing.assert_frame_equal(cached_df, built_df)
+
+    def test_touched_file_is_reused(self):
+        built_df, _ = self._read()
+        self._touch()
+        metadata_path = self.cache_directory / 'sell_prices.json'
+        self.assertTrue(_is_valid(self.source, metadata_path))
+        # The new modification time is recorded, so later runs do not hash the file again
+        with open(metadata_path) as f:
+            self.assertEqual(json.load(f)['mtime_ns'], self.source.stat().st_mtime_ns)
+        with mock.patch('xm5.columnar_cache._file_hash') as file_hash:
+            cached_df, n_reads = self._read()
+        file_hash.assert_not_called()
+        self.assertEqual(n_reads, 0)
+        pd.testing.assert_frame_equal(cached_df, built_df)
+
+    def test_changed_content_is_rebuilt(self):
+        self._read()
+        # Same size: only the hash tells the content changed
+        size = self.source.stat().st_size
+        self._write_prices(sell_price=1.7)
+        self.assertEqual(self.source.stat().st_size, size)
+        self._touch()
+        self.assertFalse(_is_valid(self.source, self.cache_directory / 'sell_prices.json'))
+        df, n_reads = self._read()
+        self.assertEqual(n_reads, 1)
+        np.testing.assert_array_equal(df.sell_price, np.array([1.7, 2.25, 3.0], dtype=np.float32))
+
+        # Another size
+        self._write_prices(sell_price=1.75)
+        df, n_reads = self._read()
+        self.assertEqual(n_reads, 1)
+        self.assertEqual(df.sell_price[0], np.float32(1.75))
+        _, n_reads = self._read()
+        self.assertEqual(n_reads, 0)
+
+    def test_missing_cache_is_rebuilt(self):
+        self._read()
+        (self.cache_directory / 'sell_prices.arrow').unlink()
+        _, n_reads = self._read()
+        self.assertEqual(n_reads, 1)
+        self.assertFalse(_is_valid(self.source, self.cache_directory / 'calendar.json'))
+
+
+if __name__ == '__main__':
+    unittest.main()
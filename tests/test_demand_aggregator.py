@@ -0,0 +1,113 @@
+from multiprocessing.shared_memory import SharedMemory
+from unittest import TestCase, mock
+
+import numpy as np
+import pandas as pd
+
+from retail.domain import Feature
+from retail.transformer import demand_aggregator
+from retail.transformer.demand_aggregator import DemandAggregator
+
+
+def _get_transactions_df(n_rows: int = 2000) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    price = rng.random(n_rows).astype(np.float32)
+    price[rng.random(n_rows) < 0.1] = np.nan
+    transaction_date = pd.Series(pd.Timestamp('2016-01-01') + pd.to_timedelta(rng.integers(0, 60, n_rows), 'D'))
+    transaction_date[rng.random(n_rows) < 0.05] = pd.NaT
+    store_id = pd.Series(rng.choice(['CA_1', 'TX_1', 'WI_1'], n_rows), dtype='category')
+    # Missing keys are dropped by groupby
+    store_id[rng.random(n_rows) < 0.02] = np.nan
+    return pd.DataFrame({
+        'store_id': store_id,
+        'sku_id': rng.choice([f"SKU_{i}" for i in range(30)], n_rows),
+        'year_week': rng.integers(11101, 11110, n_rows).astype(str),
+        'sales_qty': rng.integers(0, 100, n_rows).astype(np.int16),
+        'units': rng.integers(0, 1000, n_rows).astype(np.int32),
+        'returns': rng.integers(0, 5, n_rows).astype(np.uint8),
+        'price': price,
+        'cost': rng.random(n_rows),
+        'transaction_date': transaction_date,
+    })
+
+
+class DemandAggregatorTestCase(TestCase):
+
+    def _assert_matches_groupby(self, df: pd.DataFrame, aggregation_level, feature_list):
+        aggregated_df = DemandAggregator(aggregation_level, feature_list).fit_transform(df)
+        f_dict = {f.name: f.aggregation_f for f in feature_list if f.name not in aggregation_level}
+        expected_df = df.groupby(aggregation_level, observed=True).agg(f_dict).reset_index()
+        pd.testing.assert_frame_equal(aggregated_df, expected_df, check_exact=False, rtol=1e-5)
+
+    def test_reductions_match_groupby(self):
+        df = _get_transactions_df()
+        feature_list = [
+            Feature('sales_qty', False, 'sum'),
+            Feature('units', False, 'sum'),
+            Feature('returns', False, 'max'),
+            Feature('price', False, 'mean'),
+            Feature('cost', False, 'min'),
+            Feature('transaction_date', False, 'min'),
+            Feature('year_week', False, 'first'),
+        ]
+        for aggregation_level in [['store_id', 'sku_id'], ['store_id', 'sku_id', 'year_week'], ['sku_id']]:
+            self._assert_matches_groupby(df, aggregation_level, feature_list)
+
+    def test_integer_sums_keep_their_dtype_when_they_fit(self):
+        df = _get_transactions_df()
+        feature_list = [Feature('sales_qty', False, 'sum'), Feature('units', False, 'sum'),
+                        Feature('returns', False, 'sum'), Feature('price', False, 'sum')]
+        aggregated_df = DemandAggregator(['store_id', 'sku_id', 'year_week'], feature_list).fit_transform(df)
+        self.assertEqual(aggregated_df.sales_qty.dtype, np.int16)
+        self.assertEqual(aggregated_df.units.dtype, np.int32)
+        self.assertEqual(aggregated_df.returns.dtype, np.uint8)
+        self.assertEqual(aggregated_df.price.dtype, np.float32)
+        for aggregation_level in [['store_id', 'sku_id', 'year_week'], ['store_id', 'sku_id'], ['store_id']]:
+            self._assert_matches_groupby(df, aggregation_level, feature_list)
+
+    def test_integer_sums_do_not_overflow(self):
+        df = pd.DataFrame({'store_id': ['CA_1'] * 400 + ['TX_1'] * 2,
+                           'sales_qty': np.full(402, 200, dtype=np.int16),
+                           'returns': np.full(402, 200, dtype=np.uint8)})
+        feature_list = [Feature('sales_qty', False, 'sum'), Feature('returns', False, 'sum')]
+        aggregated_df = DemandAggregator(['store_id'], feature_list).fit_transform(df)
+        # Sums that do not fit in the dtype of the values are int64, like groupby
+        self.assertEqual(aggregated_df.sales_qty.tolist(), [80000, 400])
+        self.assertEqual(aggregated_df.returns.tolist(), [80000, 400])
+        self.assertEqual(aggregated_df.sales_qty.dtype, np.int64)
+        self._assert_matches_groupby(df, ['store_id'], feature_list)
+
+    def test_process_pool_matches_serial(self):
+        df = _get_transactions_df()
+        df['sku_id'] = df['sku_id'].astype(object)
+        feature_list = [Feature('sales_qty', False, 'sum'), Feature('price', False, 'mean'),
+                        Feature('transaction_date', False, 'max'), Feature('year_week', False, 'first'),
+                        # Reductions of the groupby fallback
+                        Feature('cost', False, 'median'), Feature('units', False, 'std')]
+        shared_blocks = []
+
+        def share_columns(*args):
+            blocks, descriptors = _share_columns(*args)
+            shared_blocks.extend(block.name for block in blocks)
+            return blocks, descriptors
+
+        _share_columns = demand_aggregator._share_columns
+        # Categorical (store), object (sku) and string (year week) keys
+        for aggregation_level in [['store_id', 'sku_id'], ['sku_id', 'year_week'], ['store_id', 'sku_id', 'year_week']]:
+            expected_df = DemandAggregator(aggregation_level, feature_list).fit_transform(df)
+            with mock.patch.object(demand_aggregator, '_share_columns', share_columns):
+                aggregated_df = DemandAggregator(aggregation_level, feature_list, n_jobs=2).fit_transform(df)
+            pd.testing.assert_frame_equal(aggregated_df, expected_df)
+
+        self.assertTrue(shared_blocks)
+        for name in shared_blocks:
+            with self.assertRaises(FileNotFoundError):
+                SharedMemory(name=name)
+
+    def test_singleton_groups_and_other_reductions(self):
+        df = _get_transactions_df().drop_duplicates(['store_id', 'sku_id', 'transaction_date'])
+        self._assert_matches_groupby(df, ['store_id', 'sku_id', 'transaction_date'],
+                                     [Feature('sales_qty', False, 'sum'), Feature('price', False, 'mean'),
+                                      Feature('cost', False, 'max'), Feature('year_week', False, 'first')])
+        self._assert_matches_groupby(df, ['store_id', 'sku_id'],
+                                     [Feature('price', False, 'median'), Feature('sales_qty', False, 'std')])
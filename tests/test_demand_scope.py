@@ -0,0 +1,58 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from retail.transformer.demand_scope import DemandScope, DemandPartitionIndex
+
+
+def _get_demand_df(n_rows: int = 500, seed: int = 0) -> pd.DataFrame:
+    random_state = np.random.RandomState(seed)
+    cat_ids = random_state.choice(['FOODS', 'HOBBIES', 'HOUSEHOLD'], n_rows)
+    return pd.DataFrame({
+        'store_id': pd.Categorical(random_state.choice(['CA_1', 'TX_1', 'WI_1'], n_rows)),
+        'cat_id': pd.Categorical(cat_ids),
+        'dept_id': pd.Categorical([f"{cat_id}_{i}" for cat_id, i in zip(cat_ids, random_state.randint(1, 3, n_rows))]),
+        'sku_id': random_state.choice([f"SKU_{i}" for i in range(20)], n_rows),
+        'transaction_date': pd.Timestamp('2016-01-01') + pd.to_timedelta(random_state.randint(0, 60, n_rows), 'D'),
+    })
+
+
+class DemandScopeTestCase(unittest.TestCase):
+    def test_partition_index_matches_scan(self):
+        df = _get_demand_df()
+        partition_index = DemandPartitionIndex(df)
+        for kwargs in [dict(cat_id_list=['HOBBIES']),
+                       dict(store_id_list=['CA_1', 'WI_1'], dept_id_list=['FOODS_1', 'HOUSEHOLD_2']),
+                       dict(store_id_list=['TX_1'], sku_id_list=['SKU_3', 'SKU_7'],
+                            start_date='2016-01-15', end_date='2016-02-10'),
+                       dict(cat_id_list=['UNKNOWN'])]:
+            scan = DemandScope(**kwargs)
+            indexed = DemandScope(partition_index=partition_index, **kwargs)
+            np.testing.assert_array_equal(indexed.fit_mask(df), scan.fit_mask(df))
+            np.testing.assert_array_equal(indexed.mask(df), scan.mask(df))
+            # The pipeline scopes a shallow copy of the indexed frame
+            np.testing.assert_array_equal(indexed.fit_mask(df.copy(deep=False)), scan.fit_mask(df))
+
+    def test_other_frames_are_scanned(self):
+        df = _get_demand_df()
+        partition_index = DemandPartitionIndex(df)
+        scope = DemandScope(cat_id_list=['HOBBIES'], store_id_list=['CA_1'], partition_index=partition_index)
+        scan = DemandScope(cat_id_list=['HOBBIES'], store_id_list=['CA_1'])
+        # Reordered, same length but other rows, and filtered frames, like the validation frames of a fitted scope
+        for other_df in [df.sample(frac=1.0, random_state=1),
+                         df.sample(frac=1.0, random_state=1).reset_index(drop=True),
+                         _get_demand_df(seed=1),
+                         df.iloc[100:]]:
+            self.assertFalse(partition_index.is_built_on(other_df))
+            np.testing.assert_array_equal(scope.fit_mask(other_df), scan.fit_mask(other_df))
+            pd.testing.assert_frame_equal(scope.transform(other_df), scan.transform(other_df))
+        # Frames sharing the rows of the indexed one, like the shallow copy the predictor adds features to
+        featured_df = df.copy(deep=False)
+        featured_df['sales_qty'] = 1
+        for same_df in [featured_df, df[['store_id', 'cat_id', 'dept_id']]]:
+            self.assertTrue(partition_index.is_built_on(same_df))
+            np.testing.assert_array_equal(scope.mask(same_df), scan.mask(df))
+
+if __name__ == '__main__':
+    unittest.main()
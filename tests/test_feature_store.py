@@ -0,0 +1,162 @@
+import dataclasses
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pyarrow.dataset as ds
+
+from data_gold.domain import Scope, SegmentationScheme, SkuGroup, StoreGroup
+from gold_fixtures import get_segmentation_scheme, KeyObservationRepository, KeyPriceRepository
+from model.feature_store import FeatureStore, StoredFeaturizer
+from model.featurizer import CompositeFeaturizer, MultiLagSalesFeaturizer, MultiLagPriceFeaturizer, \
+    PrecomputeFeaturizer
+
+
+class FeatureStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.feature_store = FeatureStore(os.path.join(self.directory.name, 'features'))
+        self.segmentation_scheme = get_segmentation_scheme(store_group_names=['CA_1', 'TX_1', 'WI_1'],
+                                                           sku_group_names=['FOODS_1', 'HOBBIES_1'],
+                                                           period_indexes=range(10))
+        self.periods = self.segmentation_scheme.horizon.periods
+        self.offer_segments = self.segmentation_scheme.offer_segments
+        self.observation_repository = KeyObservationRepository()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _get_featurizer(self, n_jobs: int = 1, lags=(1, 2)) -> CompositeFeaturizer:
+        return CompositeFeaturizer([MultiLagSalesFeaturizer(list(lags), self.observation_repository),
+                                    MultiLagPriceFeaturizer([1], KeyPriceRepository())], n_jobs=n_jobs)
+
+    def _build_expected_matrix(self, scope: Scope):
+        # Without the store, nor the counted repository
+        return CompositeFeaturizer([MultiLagSalesFeaturizer([1, 2], KeyObservationRepository()),
+                                    MultiLagPriceFeaturizer([1], KeyPriceRepository())]).build_feature_matrix(scope)
+
+    def _count_stored_rows(self, fingerprint: str) -> tuple[int, int]:
+        # (rows, distinct offer segment periods)
+        table = ds.dataset(os.path.join(self.feature_store.directory, fingerprint), format='parquet',
+                           partitioning='hive').to_table(columns=['store_group_name', 'sku_group_name',
+                                                                  'period_index'])
+        keys = set(zip(*[table[name].to_pylist() for name in table.column_names]))
+        return table.num_rows, len(keys)
+
+    def assert_matrix_equal(self, matrix, expected_matrix):
+        self.assertEqual(matrix.offer_segment_periods, expected_matrix.offer_segment_periods)
+        self.assertEqual(matrix.feature_names, expected_matrix.feature_names)
+        for name in expected_matrix.feature_names:
+            np.testing.assert_array_equal(matrix.columns[name], expected_matrix.columns[name])
+
+    def test_round_trip(self):
+        scope = Scope(self.segmentation_scheme, self.offer_segments, self.periods[3:8])
+        expected_matrix = self._build_expected_matrix(scope)
+        self.assert_matrix_equal(StoredFeaturizer(self._get_featurizer(), self.feature_store, 'data-1')
+                                 .build_feature_matrix(scope), expected_matrix)
+
+        # Another run reads the stored features, for the scope or a part of it in another order
+        n_cells = self.observation_repository.n_cells
+        stored_featurizer = StoredFeaturizer(self._get_featurizer(), self.feature_store, 'data-1')
+        self.assert_matrix_equal(stored_featurizer.build_feature_matrix(scope), expected_matrix)
+        other_scope = Scope(self.segmentation_scheme, self.offer_segments[::-2], self.periods[6:3:-1])
+        self.assert_matrix_equal(stored_featurizer.build_feature_matrix(other_scope),
+                                 self._build_expected_matrix(other_scope))
+        self.assertEqual(self.observation_repository.n_cells, n_cells)
+
+        fingerprint = stored_featurizer.get_fingerprint(self.segmentation_scheme)
+        precomputed_featurizer = PrecomputeFeaturizer(feature_store=self.feature_store, fingerprint=fingerprint)
+        self.assert_matrix_equal(precomputed_featurizer.build_feature_matrix(scope), expected_matrix)
+        with self.assertRaises(KeyError):
+            precomputed_featurizer.build_feature_matrix(Scope(self.segmentation_scheme, self.offer_segments,
+                                                              self.periods))
+
+    def test_fingerprint_is_the_config_and_data(self):
+        featurizer = self._get_featurizer(n_jobs=1)
+        scheme = self.segmentation_scheme
+        fingerprint = self.feature_store.fingerprint(featurizer, 'data-1', scheme)
+        # Execution settings and timings are not part of the configuration
+        self.assertEqual(self.feature_store.fingerprint(self._get_featurizer(n_jobs=3), 'data-1', scheme),
+                         fingerprint)
+        featurizer.build_feature_matrix(Scope(scheme, self.offer_segments, self.periods[2:]))
+        self.assertTrue(featurizer.timings)
+        self.assertEqual(self.feature_store.fingerprint(featurizer, 'data-1', scheme), fingerprint)
+
+        self.assertNotEqual(self.feature_store.fingerprint(self._get_featurizer(lags=(1, 3)), 'data-1', scheme),
+                            fingerprint)
+        self.assertNotEqual(self.feature_store.fingerprint(featurizer, 'data-2', scheme), fingerprint)
+
+        # A data key function is evaluated at each build
+        data_keys = ['data-1']
+        stored_featurizer = StoredFeaturizer(featurizer, self.feature_store, data_key=lambda: data_keys[-1])
+        self.assertEqual(stored_featurizer.get_fingerprint(scheme), fingerprint)
+        self.assertEqual(stored_featurizer.config(), featurizer.config())
+        data_keys.append('data-2')
+        self.assertNotEqual(stored_featurizer.get_fingerprint(scheme), fingerprint)
+
+    def test_fingerprint_is_the_segmentation_scheme(self):
+        featurizer = self._get_featurizer()
+        fingerprint = self.feature_store.fingerprint(featurizer, 'data-1', self.segmentation_scheme)
+        # An equal scheme built again has the same fingerprint
+        self.assertEqual(self.feature_store.fingerprint(featurizer, 'data-1', get_segmentation_scheme(
+            store_group_names=['CA_1', 'TX_1', 'WI_1'], sku_group_names=['FOODS_1', 'HOBBIES_1'],
+            period_indexes=range(10))), fingerprint)
+
+        # The same group names over other stores or skus
+        for scheme in [self._rename_groups(self.segmentation_scheme, stores={'CA_1': 'CA_2'}),
+                       self._rename_groups(self.segmentation_scheme, skus={'FOODS_1': 'FOODS_2'})]:
+            self.assertEqual(scheme.offer_segments, self.offer_segments)
+            self.assertNotEqual(self.feature_store.fingerprint(featurizer, 'data-1', scheme), fingerprint)
+
+        # Other periods, or the same period indexes over other dates
+        other_periods = get_segmentation_scheme(store_group_names=['CA_1', 'TX_1', 'WI_1'],
+                                                sku_group_names=['FOODS_1', 'HOBBIES_1'], period_indexes=range(1, 10))
+        self.assertNotEqual(self.feature_store.fingerprint(featurizer, 'data-1', other_periods), fingerprint)
+        horizon = self.segmentation_scheme.horizon
+        shifted_periods = [dataclasses.replace(period, end=period.start) for period in horizon.periods]
+        shifted_scheme = dataclasses.replace(self.segmentation_scheme,
+                                             horizon=dataclasses.replace(horizon, periods=shifted_periods))
+        self.assertNotEqual(self.feature_store.fingerprint(featurizer, 'data-1', shifted_scheme), fingerprint)
+
+    @staticmethod
+    def _rename_groups(scheme: SegmentationScheme, stores=None, skus=None) -> SegmentationScheme:
+        # Replaces the members of the groups, keeping their names
+        stores, skus = stores or {}, skus or {}
+        store_segmentation = scheme.store_segmentation
+        sku_segmentation = scheme.sku_segmentation
+        store_groups = {name: StoreGroup(name, [stores.get(store, store) for store in group.stores])
+                        for name, group in store_segmentation.store_groups.items()}
+        sku_groups = {name: SkuGroup(name, [skus.get(sku, sku) for sku in group.skus])
+                      for name, group in sku_segmentation.sku_groups.items()}
+        return dataclasses.replace(
+            scheme,
+            store_segmentation=dataclasses.replace(store_segmentation, store_groups=store_groups),
+            sku_segmentation=dataclasses.replace(sku_segmentation, sku_groups=sku_groups))
+
+    def test_partial_scope_computes_missing_offer_segment_periods(self):
+        stored_featurizer = StoredFeaturizer(self._get_featurizer(), self.feature_store, 'data-1')
+        stored_featurizer.build_feature_matrix(Scope(self.segmentation_scheme, self.offer_segments[:4],
+                                                     self.periods[2:6]))
+        n_cells = self.observation_repository.n_cells
+
+        # Overlaps the stored offer segment periods on 2 offer segments and 3 periods
+        scope = Scope(self.segmentation_scheme, self.offer_segments[2:], self.periods[3:9])
+        self.assert_matrix_equal(stored_featurizer.build_feature_matrix(scope),
+                                 self._build_expected_matrix(scope))
+        n_rows, n_offer_segment_periods = self._count_stored_rows(
+            stored_featurizer.get_fingerprint(self.segmentation_scheme))
+        self.assertEqual(n_rows, n_offer_segment_periods)
+        self.assertEqual(n_rows, 4 * 4 + 4 * 6 - 2 * 3)
+        # The lags of the offer segments and periods with a missing offer segment period were computed, not others
+        self.assertEqual(self.observation_repository.n_cells - n_cells, 4 * len(range(3 - 2, 9 - 1)))
+
+    def test_precompute_featurizer_needs_features(self):
+        with self.assertRaises(ValueError):
+            PrecomputeFeaturizer()
+        with self.assertRaises(ValueError):
+            PrecomputeFeaturizer(feature_store=self.feature_store)
+
+
+if __name__ == '__main__':
+    unittest.main()
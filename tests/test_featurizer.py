@@ -0,0 +1,108 @@
+import unittest
+
+import numpy as np
+
+from data_gold.domain import Scope
+from gold_fixtures import get_segmentation_scheme, get_total_sales_qty, get_mean_price, get_expected_values, \
+    KeyObservationRepository, KeyPriceRepository
+from model.featurizer import FeatureMatrix, LagSalesFeaturizer, LagPriceFeaturizer, MultiLagSalesFeaturizer, \
+    MultiLagPriceFeaturizer, CompositeFeaturizer, LogFeaturizer, Featurizer
+
+
+class LagFeaturizerTestCase(unittest.TestCase):
+    def setUp(self):
+        # Periods 3 and 4 are filtered out of the horizon
+        self.segmentation_scheme = get_segmentation_scheme(period_indexes=[0, 1, 2, 5, 6, 7, 8, 9])
+        self.scope = Scope(self.segmentation_scheme, self.segmentation_scheme.offer_segments,
+                           self.segmentation_scheme.horizon.periods[1:])
+
+    def test_sales_lags(self):
+        observation_repository = KeyObservationRepository()
+        lags = [1, 2, 4, 12]
+        matrix = MultiLagSalesFeaturizer(lags, observation_repository).build_feature_matrix(self.scope)
+        # One query for every lag
+        self.assertEqual(observation_repository.n_queries, 1)
+        self.assertEqual(matrix.feature_names, [f"lag_sales_{lag}" for lag in lags])
+        for lag in lags:
+            expected = get_expected_values(self.scope, get_total_sales_qty, lag, missing_value=-1)
+            np.testing.assert_array_equal(matrix.columns[f"lag_sales_{lag}"], expected)
+            single_lag_matrix = LagSalesFeaturizer(lag, observation_repository).build_feature_matrix(self.scope)
+            np.testing.assert_array_equal(single_lag_matrix.columns["lag_sales"], expected)
+        # Lags before the start of the horizon are missing, they do not wrap around to its last periods
+        self.assertTrue((matrix.columns["lag_sales_12"] == -1).all())
+
+    def test_log_of_missing_lags(self):
+        # Missing lags are -1, like missing prices: both paths of the log give log(min_value)
+        featurizer = LogFeaturizer(MultiLagSalesFeaturizer([1, 12], KeyObservationRepository()))
+        matrix = featurizer.build_feature_matrix(self.scope)
+        features = featurizer.build_features(self.scope)
+        for name in matrix.feature_names:
+            np.testing.assert_allclose(matrix.columns[name], [features[osp][name]
+                                                              for osp in self.scope.offer_segment_periods])
+        self.assertTrue((matrix.columns["lag_sales_12"] == np.log(featurizer.min_value)).all())
+
+    def test_price_lags(self):
+        lags = [1, 3]
+        matrix = MultiLagPriceFeaturizer(lags, KeyPriceRepository()).build_feature_matrix(self.scope)
+        for lag in lags:
+            expected = get_expected_values(self.scope, lambda osp: np.nan_to_num(get_mean_price(osp), nan=-1), lag,
+                                           missing_value=-1)
+            np.testing.assert_allclose(matrix.columns[f"lag_price_{lag}"], expected)
+            single_lag_matrix = LagPriceFeaturizer(lag, KeyPriceRepository()).build_feature_matrix(self.scope)
+            np.testing.assert_allclose(single_lag_matrix.columns["lag_price"], expected)
+
+
+class FeatureMatrixTestCase(unittest.TestCase):
+    def setUp(self):
+        self.segmentation_scheme = get_segmentation_scheme(period_indexes=range(6))
+        self.scope = Scope(self.segmentation_scheme, self.segmentation_scheme.offer_segments,
+                           self.segmentation_scheme.horizon.periods[2:])
+
+    def test_stack(self):
+        observation_repository = KeyObservationRepository()
+        featurizers = [MultiLagSalesFeaturizer([1, 2], observation_repository),
+                       MultiLagPriceFeaturizer([1], KeyPriceRepository())]
+        matrix = CompositeFeaturizer(featurizers).build_feature_matrix(self.scope)
+        self.assertEqual(matrix.feature_names, ['lag_sales_1', 'lag_sales_2', 'lag_price_1'])
+        self.assertEqual(matrix.offer_segment_periods, self.scope.offer_segment_periods)
+        features = CompositeFeaturizer(featurizers).build_features(self.scope)
+        for offer_segment_period, row in zip(matrix.offer_segment_periods, matrix.to_array()):
+            np.testing.assert_allclose(row, list(features[offer_segment_period].values()))
+
+    def test_timings_are_logged(self):
+        featurizers = [MultiLagSalesFeaturizer([1, 2], KeyObservationRepository()),
+                       MultiLagPriceFeaturizer([1], KeyPriceRepository())]
+        featurizer = CompositeFeaturizer(featurizers, n_jobs=2)
+        with self.assertLogs('model.featurizer', level='INFO') as logs:
+            featurizer.build_feature_matrix(self.scope)
+        self.assertEqual([name for name, _ in featurizer.timings],
+                         ['MultiLagSalesFeaturizer([1, 2])', 'MultiLagPriceFeaturizer([1])'])
+        self.assertIn('MultiLagSalesFeaturizer([1, 2]) in ', logs.output[0])
+
+    def test_stack_rejects_duplicate_feature_names(self):
+        observation_repository = KeyObservationRepository()
+        featurizers = [LagSalesFeaturizer(1, observation_repository), LagSalesFeaturizer(2, observation_repository)]
+        with self.assertRaises(ValueError):
+            CompositeFeaturizer(featurizers).build_feature_matrix(self.scope)
+        with self.assertRaises(ValueError):
+            CompositeFeaturizer(featurizers).build_features(self.scope)
+
+    def test_stack_rejects_other_rows(self):
+        other_scope = Scope(self.segmentation_scheme, self.segmentation_scheme.offer_segments[:2], self.scope.periods)
+        featurizer = MultiLagSalesFeaturizer([1], KeyObservationRepository())
+        with self.assertRaises(ValueError):
+            FeatureMatrix.stack([featurizer.build_feature_matrix(self.scope),
+                                 MultiLagPriceFeaturizer([1], KeyPriceRepository()).build_feature_matrix(other_scope)])
+
+    def test_featurizers_declare_their_config(self):
+        # Feature stores fingerprint the config: a featurizer without one cannot be created
+        class UnconfiguredFeaturizer(Featurizer):
+            def build_features(self, scope: Scope):
+                return {}
+
+        with self.assertRaises(TypeError):
+            UnconfiguredFeaturizer()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import logging
+import unittest
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MinMaxScaler, StandardScaler
+
+from retail.demand.generic_demand_predictor import GenericDemandPredictor
+from retail.domain import TransformerFeatureSubset
+from retail.transformer.demand_scope import DemandScope
+from retail.transformer.interfaces import Feature, Scope
+
+
+def _get_sales_df(n_rows: int = 2000, seed: int = 0) -> pd.DataFrame:
+    random_state = np.random.RandomState(seed)
+    promo = pd.array(random_state.randint(0, 3, n_rows), dtype='Int64')
+    promo[random_state.rand(n_rows) < 0.1] = pd.NA
+    return pd.DataFrame({
+        'store_id': pd.Categorical(random_state.choice(['CA_1', 'TX_1', 'WI_1'], n_rows)),
+        'cat_id': pd.Categorical(random_state.choice(['FOODS', 'HOBBIES', 'HOUSEHOLD'], n_rows)),
+        'sku_id': random_state.choice([f"SKU_{i}" for i in range(20)], n_rows),
+        'transaction_date': pd.Timestamp('2016-01-01') + pd.to_timedelta(random_state.randint(0, 60, n_rows), 'D'),
+        'sales_qty': random_state.poisson(3, n_rows).astype(np.float32),
+        'price': random_state.uniform(1, 10, n_rows).astype(np.float32),
+        # Extension dtypes, with missing values
+        'promo': promo,
+        'discount': pd.array(random_state.uniform(0, 0.5, n_rows), dtype='Float32'),
+    }, index=pd.RangeIndex(100, 100 + n_rows))
+
+
+class RevenueFeature(Feature):
+    # Adds a column to the frame it is given, as features do
+    def fit_transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        return self.transform(df)
+
+    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        df['revenue'] = df.sales_qty * df.price
+        return df
+
+
+def _get_transformer_list():
+    return [DemandScope(cat_id_list=['FOODS', 'HOBBIES']),
+            DemandScope(store_id_list=['CA_1', 'TX_1'], start_date='2016-01-10', end_date='2016-02-20'),
+            TransformerFeatureSubset(MinMaxScaler(), ['sales_qty', 'price']),
+            RevenueFeature(),
+            DemandScope(sku_id_list=[f"SKU_{i}" for i in range(0, 20, 2)]),
+            TransformerFeatureSubset(StandardScaler(), ['promo', 'discount']),
+            DemandScope(cat_id_list=['FOODS'])]
+
+
+def _run_sequentially(transformer_list, sales_df: pd.DataFrame, fit: bool) -> pd.DataFrame:
+    # Each transformer on the output of the previous one, on a copy of the frame
+    sales_df = sales_df.copy()
+    for transformer in transformer_list:
+        if isinstance(transformer, TransformerFeatureSubset):
+            subset = transformer.feature_subset
+            values = sales_df[subset].astype(float)
+            if fit:
+                sales_df[subset] = transformer.transformer.fit_transform(values)
+            else:
+                sales_df[subset] = transformer.transformer.transform(values)
+        elif fit:
+            sales_df = transformer.fit_transform(sales_df)
+        else:
+            sales_df = transformer.transform(sales_df)
+    return sales_df
+
+
+class GenericDemandPredictorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.sales_df = _get_sales_df()
+        self.logger = logging.getLogger('test_generic_demand_predictor')
+
+    def _get_predictor(self, transformer_list) -> GenericDemandPredictor:
+        return GenericDemandPredictor(feature_list=[], demand_predictor=None, transformer_list=transformer_list,
+                                      target_transformer_list=[], logger=self.logger)
+
+    def assert_frame_close(self, df, expected_df):
+        # The pipeline gives float subsets the smallest dtype that holds them
+        pd.testing.assert_frame_equal(df, expected_df, check_dtype=False, rtol=1e-5)
+
+    def test_matches_sequential_transformers(self):
+        predictor = self._get_predictor(_get_transformer_list())
+        expected_transformer_list = _get_transformer_list()
+        fit_df = predictor.fit_transform(self.sales_df)
+        self.assert_frame_close(fit_df, _run_sequentially(expected_transformer_list, self.sales_df, fit=True))
+        # Transformed with what was fitted; scopes do not filter dates
+        validation_df = _get_sales_df(seed=1)
+        transformed_df = predictor.transform(validation_df)
+        self.assertGreater(len(transformed_df), len(fit_df))
+        self.assert_frame_close(transformed_df, _run_sequentially(expected_transformer_list, validation_df, fit=False))
+
+    def test_fit_transform_parity(self):
+        predictor = self._get_predictor(_get_transformer_list())
+        fit_df = predictor.fit_transform(self.sales_df)
+        # The rows fit_transform kept go through transform unchanged by the scopes, and get the fitted values
+        in_dates = self.sales_df.transaction_date.between('2016-01-10', '2016-02-20', inclusive='left')
+        pd.testing.assert_frame_equal(predictor.transform(self.sales_df[in_dates]), fit_df)
+
+    def test_consecutive_scopes_are_applied_at_once(self):
+        predictor = self._get_predictor(_get_transformer_list())
+        with self.assertLogs(self.logger, level='INFO') as logs:
+            predictor.fit_transform(self.sales_df)
+        removals = [line for line in logs.output if 'Scopes removed' in line]
+        # The two first scopes, the one before the standard scaler, and the last one
+        self.assertEqual(len(removals), 3)
+
+        # A scope whose mask keeps every row does not copy the frame
+        predictor = self._get_predictor([DemandScope(cat_id_list=['FOODS', 'HOBBIES', 'HOUSEHOLD'])])
+        sales_df = predictor.fit_transform(self.sales_df)
+        self.assertIs(sales_df.index, self.sales_df.index)
+
+        # Masks are combined with and, whatever their order
+        scopes = [DemandScope(cat_id_list=['FOODS']), DemandScope(store_id_list=['WI_1'])]
+        for transformer_list in [scopes, scopes[::-1]]:
+            expected_df = self.sales_df[(self.sales_df.cat_id == 'FOODS') & (self.sales_df.store_id == 'WI_1')]
+            pd.testing.assert_frame_equal(self._get_predictor(transformer_list).fit_transform(self.sales_df),
+                                          expected_df)
+
+    def test_caller_frame_is_left_unmodified(self):
+        expected_df = self.sales_df.copy()
+        for transformer_list in [_get_transformer_list(),
+                                 # Transformers before any scope work on the caller's rows
+                                 [TransformerFeatureSubset(MinMaxScaler(), ['sales_qty', 'price']), RevenueFeature(),
+                                  TransformerFeatureSubset(StandardScaler(), ['promo', 'discount'])]]:
+            predictor = self._get_predictor(transformer_list)
+            predictor.fit_transform(self.sales_df)
+            predictor.transform(self.sales_df)
+            pd.testing.assert_frame_equal(self.sales_df, expected_df)
+
+    def test_extension_dtypes(self):
+        predictor = self._get_predictor([TransformerFeatureSubset(StandardScaler(), ['promo', 'discount', 'price'])])
+        sales_df = predictor.fit_transform(self.sales_df)
+        for column in ['promo', 'discount', 'price']:
+            self.assertEqual(sales_df[column].dtype, np.float64)
+        # Missing values stay missing, and are ignored by the fit
+        np.testing.assert_array_equal(sales_df.promo.isna(), self.sales_df.promo.isna())
+        self.assertAlmostEqual(sales_df.promo.mean(), 0)
+
+        # Subsets of numpy dtypes keep the smallest float dtype that holds them
+        predictor = self._get_predictor([TransformerFeatureSubset(MinMaxScaler(), ['sales_qty', 'price'])])
+        sales_df = predictor.fit_transform(self.sales_df)
+        self.assertEqual(sales_df.sales_qty.dtype, np.float32)
+
+
+if __name__ == '__main__':
+    unittest.main()
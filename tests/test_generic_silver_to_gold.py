@@ -0,0 +1,91 @@
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from retail.data.m5.loader import M5DataLoader
+from retail.data_layer.generic_silver_to_gold import GenericSilverToGold
+
+
+def _merge(sales_df: pd.DataFrame, catalog_df: pd.DataFrame, calendar_df: pd.DataFrame) -> pd.DataFrame:
+    # The join as it was done with pd.merge
+    merge_cols = (calendar_df.columns.difference(sales_df.columns))
+    merge_on = ['day_no']
+    model_df = pd.merge(sales_df, calendar_df[merge_cols.tolist() + merge_on], on=merge_on)
+    merge_cols = (catalog_df.columns.difference(model_df.columns))
+    merge_on = ['store_id', 'sku_id', 'year_week']
+    return pd.merge(model_df, catalog_df[merge_cols.tolist() + merge_on], on=merge_on)
+
+
+def _get_unmatched_silver_datasets(n_rows: int = 500, seed: int = 0):
+    # Sales on days missing from the calendar, and of stores, skus and weeks missing from the catalog
+    rng = np.random.default_rng(seed)
+    calendar_df = pd.DataFrame({'day_no': [f"d_{i}" for i in range(1, 29)], 'year': 2016, 'month': 1,
+                                'year_week': [f"2016-{i // 7:02d}" for i in range(28)]})
+    days = rng.integers(1, 32, n_rows)
+    sales_df = pd.DataFrame({'sku_id': pd.Categorical(rng.choice(['A', 'B', 'C', 'D'], n_rows)),
+                             'store_id': pd.Categorical(rng.choice(['CA_1', 'TX_1', 'WI_1'], n_rows)),
+                             'transaction_date': pd.Timestamp('2016-01-01') + pd.to_timedelta(days - 1, 'D'),
+                             'day_no': pd.Categorical([f"d_{day}" for day in days]),
+                             'sales_qty': rng.random(n_rows).astype(np.float32)})
+    keys = [(store_id, sku_id, year_week) for store_id in ['CA_1', 'TX_1', 'NY_1'] for sku_id in ['A', 'B', 'C', 'E']
+            for year_week in ['2016-00', '2016-01', '2016-02', '2016-03'] if rng.random() > 0.2]
+    catalog_df = pd.DataFrame(keys, columns=['store_id', 'sku_id', 'year_week']).astype('category')
+    catalog_df['store_group_id'] = pd.Categorical(catalog_df.store_id.str[:2])
+    catalog_df['dept_id'] = pd.Categorical(catalog_df.sku_id.astype(str) + '_1')
+    catalog_df['cat_id'] = pd.Categorical(['FOODS'] * len(catalog_df))
+    catalog_df['price'] = rng.random(len(catalog_df)).astype(np.float32)
+    return sales_df, catalog_df, calendar_df
+
+
+class GenericSilverToGoldTestCase(TestCase):
+
+    def setUp(self):
+        self.sales_df, self.catalog_df, self.calendar_df = M5DataLoader(validation_mode='off').get_silver_datasets()
+        joined_df = GenericSilverToGold._join(self.sales_df, self.catalog_df, self.calendar_df)
+        # Random days are removed from the series, but not their first and last days
+        dates = joined_df.groupby(['store_id', 'sku_id'], observed=True).transaction_date
+        is_bound = (joined_df.transaction_date == dates.transform('min')) | \
+                   (joined_df.transaction_date == dates.transform('max'))
+        keep = np.random.default_rng(0).random(len(joined_df)) > 0.3
+        self.gold_df = joined_df[keep | is_bound.to_numpy()].reset_index(drop=True)
+
+    def assert_join_matches_merge(self, sales_df, catalog_df, calendar_df):
+        joined_df = GenericSilverToGold._join(sales_df, catalog_df, calendar_df)
+        # Same rows in the same order. pd.merge makes the keys objects when their categories differ between the
+        # frames, where the join keeps the dtypes of the sales
+        pd.testing.assert_frame_equal(joined_df, _merge(sales_df, catalog_df, calendar_df), check_dtype=False,
+                                      check_categorical=False)
+        pd.testing.assert_series_equal(joined_df.dtypes[sales_df.columns], sales_df.dtypes)
+        return joined_df
+
+    def test_join_matches_merge(self):
+        self.assertGreater(len(self.assert_join_matches_merge(self.sales_df, self.catalog_df, self.calendar_df)), 0)
+
+    def test_join_drops_unmatched_sales(self):
+        sales_df, catalog_df, calendar_df = _get_unmatched_silver_datasets()
+        joined_df = self.assert_join_matches_merge(sales_df, catalog_df, calendar_df)
+        self.assertGreater(len(joined_df), 0)
+        self.assertLess(len(joined_df), len(sales_df))
+
+    def test_impute_matches_per_series_reindex(self):
+        imputed_df = GenericSilverToGold._impute_no_sales_skus(self.gold_df, self.calendar_df)
+
+        calendar_df = self.calendar_df.set_index(pd.to_datetime(self.calendar_df.date))
+        expected_dfs = []
+        for _, series_df in self.gold_df.groupby(['store_id', 'sku_id'], observed=True, sort=False):
+            series_df = series_df.set_index('transaction_date')
+            series_df = series_df.reindex(pd.date_range(series_df.index.min(), series_df.index.max()))
+            series_df['sales_qty'] = series_df.sales_qty.fillna(0)
+            for column in ['day_no', 'date', 'month', 'year', 'year_week']:
+                series_df[column] = calendar_df.loc[series_df.index, column].to_numpy()
+            expected_dfs.append(series_df.ffill().rename_axis('transaction_date').reset_index())
+        expected_df = pd.concat(expected_dfs, ignore_index=True)[list(imputed_df.columns)]
+
+        self.assertGreater(len(imputed_df), len(self.gold_df))
+        pd.testing.assert_frame_equal(imputed_df.astype(str), expected_df.astype(str))
+
+    def test_impute_rejects_duplicate_days(self):
+        gold_df = pd.concat([self.gold_df, self.gold_df.iloc[:1]], ignore_index=True)
+        with self.assertRaises(ValueError):
+            GenericSilverToGold._impute_no_sales_skus(gold_df, self.calendar_df)
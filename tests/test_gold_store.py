@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from retail.data_layer.gold_store import PartitionedGoldStore
+
+
+def _get_gold_df() -> pd.DataFrame:
+    random_state = np.random.RandomState(0)
+    n_rows = 300
+    dates = pd.Timestamp('2016-01-04') + pd.to_timedelta(random_state.randint(0, 35, n_rows), 'D')
+    return pd.DataFrame({
+        # Categories in neither alphabetical nor appearance order
+        'store_id': pd.Categorical(random_state.choice(['CA_1', 'TX_1', 'WI_1'], n_rows),
+                                   categories=['WI_1', 'CA_1', 'TX_1']),
+        'cat_id': pd.Categorical(random_state.choice(['FOODS', 'HOBBIES'], n_rows), categories=['HOBBIES', 'FOODS']),
+        'sku_id': pd.Categorical(random_state.choice(['SKU_2', 'SKU_1', 'SKU_3'], n_rows),
+                                 categories=['SKU_3', 'SKU_1', 'SKU_2'], ordered=True),
+        'transaction_date': dates,
+        'year_week': dates.strftime('%G-%V'),
+        'sales_qty': random_state.randint(0, 10, n_rows).astype(np.int32),
+    })
+
+
+class PartitionedGoldStoreTestCase(unittest.TestCase):
+    def test_round_trip_keeps_categories(self):
+        gold_df = _get_gold_df()
+        with tempfile.TemporaryDirectory() as directory:
+            store = PartitionedGoldStore(os.path.join(directory, 'gold'))
+            store.write(gold_df, source_key='sources-1')
+            df = store.read()
+
+        self.assertEqual(list(df.columns), list(gold_df.columns))
+        for column in ['store_id', 'cat_id', 'sku_id']:
+            self.assertEqual(df[column].dtype, gold_df[column].dtype)
+            self.assertEqual(df[column].cat.categories.tolist(), gold_df[column].cat.categories.tolist())
+        key = ['store_id', 'cat_id', 'transaction_date', 'sku_id', 'sales_qty']
+        expected_df = gold_df.sort_values(key).reset_index(drop=True)
+        pd.testing.assert_frame_equal(df.sort_values(key).reset_index(drop=True), expected_df)
+
+    def test_read_with_filters(self):
+        gold_df = _get_gold_df()
+        with tempfile.TemporaryDirectory() as directory:
+            store = PartitionedGoldStore(os.path.join(directory, 'gold'))
+            store.write(gold_df, source_key='sources-1')
+            df = store.read([('cat_id', 'in', ['HOBBIES']),
+                             ('transaction_date', '>=', pd.Timestamp('2016-01-20'))])
+
+        expected_df = gold_df[(gold_df['cat_id'] == 'HOBBIES') & (gold_df['transaction_date'] >= '2016-01-20')]
+        self.assertEqual(df.shape[0], expected_df.shape[0])
+        self.assertEqual(df['store_id'].cat.categories.tolist(), ['WI_1', 'CA_1', 'TX_1'])
+        self.assertTrue((df['cat_id'] == 'HOBBIES').all())
+
+    def test_exists_needs_the_same_source_key(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = PartitionedGoldStore(os.path.join(directory, 'gold'))
+            self.assertFalse(store.exists('sources-1'))
+            store.write(_get_gold_df(), source_key='sources-1')
+            self.assertTrue(store.exists('sources-1'))
+            self.assertFalse(store.exists('sources-2'))
+            # Without a source key, the store cannot be known to be up to date
+            self.assertFalse(store.exists(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
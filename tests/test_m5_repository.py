@@ -0,0 +1,283 @@
+import dataclasses
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from data_gold.cached_repository import CachedObservationRepository
+from data_gold.domain import Scope, SegmentationScheme
+from data_gold.in_memory_repository import BasicPriceRepository, BasicObservationRepository
+from model.feature_store import FeatureStore, StoredFeaturizer
+from model.featurizer import MultiLagSalesFeaturizer
+from xm5.columnar_cache import ID_COLUMNS
+from xm5.rm5_repository import M5Data, M5SkuDetailsRepository, M5PriceHistoryRepository, M5TransactionRepository, \
+    M5StoreDetailsRepository
+from xm5.utilities import build_sku_segmentation, build_store_segmentation, build_week_horizon
+
+
+M5_TOY_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'm5-forecasting-accuracy-toy')
+
+
+# (item_id, dept_id, cat_id, store_id) of the series of _get_overlapping_data
+SERIES = [('FOODS_1_001', 'FOODS_1', 'FOODS', 'CA_1'),
+          ('HOBBIES_1_001', 'HOBBIES_1', 'HOBBIES', 'TX_1'),
+          ('FOODS_1_002', 'FOODS_1', 'FOODS', 'TX_1')]
+
+
+def _get_sales_qty(offset: int, series: int, day: int) -> int:
+    return offset + 10 * series + day
+
+
+def _get_sales_df(days: range, offset: int, series_order: list[int]) -> pd.DataFrame:
+    rows = [{'id': f"{SERIES[i][0]}_{SERIES[i][3]}_evaluation", 'item_id': SERIES[i][0], 'dept_id': SERIES[i][1],
+             'cat_id': SERIES[i][2], 'store_id': SERIES[i][3], 'state_id': SERIES[i][3][:2],
+             **{f"d_{day}": _get_sales_qty(offset, i, day) for day in days}} for i in series_order]
+    return pd.DataFrame(rows)
+
+
+def _get_overlapping_data() -> M5Data:
+    # Days 1 to 5 in the validation file, and 3 to 7 in the evaluation file, with other sales and another series order
+    calendar_df = pd.read_csv(os.path.join(M5_TOY_DIRECTORY, 'calendar.csv'))
+    return M5Data(calendar_df=calendar_df,
+                  sales_train_validation=_get_sales_df(range(1, 6), 100, [0, 1, 2]),
+                  sales_train_evaluation=_get_sales_df(range(3, 8), 200, [2, 0, 1]),
+                  sell_prices=pd.DataFrame(columns=['store_id', 'item_id', 'wm_yr_wk', 'sell_price']),
+                  source_key='overlapping')
+
+
+class M5PriceHistoryRepositoryTestCase(TestCase):
+
+    def test_append_prices_matches_full_rebuild(self):
+        m5_data = M5Data.load_from_files(M5_TOY_DIRECTORY)
+        sku_details = M5SkuDetailsRepository(m5_data).find_all()
+        full_history_repository = M5PriceHistoryRepository(m5_data, sku_details)
+        full_price_repository = BasicPriceRepository(full_history_repository, sku_details)
+
+        # The last 10 weeks are appended one at a time, then the whole history of an (item, store) pair
+        sell_prices = m5_data.sell_prices
+        weeks = np.sort(sell_prices.wm_yr_wk.unique())
+        late_item, late_store = sell_prices.item_id.iloc[0], sell_prices.store_id.iloc[0]
+        is_late_pair = (sell_prices.item_id == late_item) & (sell_prices.store_id == late_store)
+        is_known = (sell_prices.wm_yr_wk < weeks[-10]) & ~is_late_pair
+        partial_data = dataclasses.replace(m5_data, sell_prices=sell_prices[is_known])
+        history_repository = M5PriceHistoryRepository(partial_data, sku_details)
+        price_repository = BasicPriceRepository(history_repository, sku_details)
+        for week in weeks[-10:]:
+            appended = history_repository.append_prices(sell_prices[(sell_prices.wm_yr_wk == week) & ~is_late_pair])
+            price_repository.update_price_histories(appended)
+        appended = history_repository.append_prices(sell_prices[is_late_pair])
+        price_repository.update_price_histories(appended)
+
+        self.assertEqual(len(history_repository.find_all()), len(full_history_repository.find_all()))
+        for full_history in full_history_repository.find_all():
+            history = history_repository.find_by_sku_and_store_number(full_history.sku_number,
+                                                                      full_history.store_number)
+            np.testing.assert_array_equal(history.change_dates, full_history.change_dates)
+            np.testing.assert_array_equal(history.prices, full_history.prices)
+
+        np.testing.assert_array_equal(price_repository.price_change_dates, full_price_repository.price_change_dates)
+        skus = [price_repository.sku_positions[sku] for sku in full_price_repository.sku_positions]
+        stores = [price_repository.store_positions[store] for store in full_price_repository.store_positions]
+        np.testing.assert_array_equal(price_repository.price_cube[np.ix_(skus, stores)],
+                                      full_price_repository.price_cube)
+
+    def test_append_prices_before_last_week(self):
+        m5_data = M5Data.load_from_files(M5_TOY_DIRECTORY)
+        sku_details = M5SkuDetailsRepository(m5_data).find_all()
+        history_repository = M5PriceHistoryRepository(m5_data, sku_details)
+        with self.assertRaises(ValueError):
+            history_repository.append_prices(m5_data.sell_prices.iloc[:1])
+
+
+class M5TransactionRepositoryTestCase(TestCase):
+
+    def setUp(self):
+        self.m5_data = _get_overlapping_data()
+        self.dates = self.m5_data.calendar_df.date.tolist()[:7]
+
+    def test_days_are_kept_once(self):
+        repository = M5TransactionRepository(self.m5_data)
+        np.testing.assert_array_equal(repository.transaction_dates, self.dates)
+        self.assertEqual(repository.sales_qty.shape, (len(SERIES), 7))
+        # Days of both files are read from the evaluation file, the others from the file that has them
+        for i, (item_id, _, _, store_id) in enumerate(SERIES):
+            transactions = repository.find_by_sku_store_and_date([(item_id, store_id, date) for date in self.dates])
+            np.testing.assert_array_equal(transactions.sales_qty,
+                                          [_get_sales_qty(100 if day < 3 else 200, i, day) for day in range(1, 8)])
+        self.assertEqual(repository.source_by_transaction_date,
+                         {date: 'validation' if day <= 5 else 'evaluation'
+                          for day, date in enumerate(self.dates, start=1)})
+
+        # Sums over a category count each day once
+        transactions = repository.find_by_category('cat', 'FOODS', self.dates[0], self.dates[-1])
+        self.assertEqual(len(transactions), 2 * 7)
+        self.assertEqual(transactions.sales_qty.sum(),
+                         sum(_get_sales_qty(100 if day < 3 else 200, i, day) for i in [0, 2] for day in range(1, 8)))
+
+    def test_validation_only(self):
+        repository = M5TransactionRepository(self.m5_data, validation_only=True)
+        np.testing.assert_array_equal(repository.transaction_dates, self.dates[:5])
+        self.assertEqual(set(repository.source_by_transaction_date.values()), {'validation'})
+        self.assertEqual(len(repository.find_by_category('cat', 'FOODS', self.dates[0], self.dates[-1])), 2 * 5)
+        transactions = repository.find_by_sku_store_and_date([('FOODS_1_001', 'CA_1', date) for date in self.dates])
+        np.testing.assert_array_equal(transactions.transaction_date, self.dates[:5])
+        self.assertNotEqual(repository.data_key, M5TransactionRepository(self.m5_data).data_key)
+
+    def test_append_days_invalidates_cached_totals(self):
+        m5_data = M5Data.load_from_files(M5_TOY_DIRECTORY)
+        sku_details = M5SkuDetailsRepository(m5_data).find_all()
+        segmentation_scheme = SegmentationScheme(
+            store_segmentation=build_store_segmentation(M5StoreDetailsRepository(m5_data).find_all()),
+            sku_segmentation=build_sku_segmentation(sku_details),
+            horizon=build_week_horizon(m5_data.calendar_df, start='2016-03-01', end='2016-05-23'))
+        scope = Scope(segmentation_scheme, segmentation_scheme.offer_segments, segmentation_scheme.horizon.periods)
+        full_repository = BasicObservationRepository(M5TransactionRepository(m5_data), sku_details)
+
+        # The last 17 days, starting in the middle of a week, are appended after the totals are cached
+        sales_df = m5_data.sales_train_evaluation
+        appended_days = [c for c in sales_df.columns if c not in ID_COLUMNS][-17:]
+        partial_data = dataclasses.replace(m5_data, sales_train_evaluation=sales_df.drop(columns=appended_days),
+                                           sales_train_validation=sales_df.drop(columns=appended_days))
+        transaction_repository = M5TransactionRepository(partial_data)
+        cached_repository = CachedObservationRepository(BasicObservationRepository(transaction_repository,
+                                                                                   sku_details))
+        transaction_repository.append_listeners.append(cached_repository.invalidate_dates)
+        partial_totals = cached_repository.find_total_sales_qty(scope)
+        self.assertFalse(np.array_equal(partial_totals, full_repository.find_total_sales_qty(scope)))
+
+        transaction_repository.append_days(sales_df[['item_id', 'dept_id', 'cat_id', 'store_id'] + appended_days])
+        np.testing.assert_array_equal(cached_repository.find_total_sales_qty(scope),
+                                      full_repository.find_total_sales_qty(scope))
+        # Only the weeks of the appended days were aggregated again
+        appended_weeks = {segmentation_scheme.horizon.date_to_period[date]
+                          for date in m5_data.calendar_df.set_index('d').loc[appended_days, 'date']}
+        n_appended_weeks = len(appended_weeks & set(scope.periods))
+        self.assertEqual(cached_repository.hits, len(scope.offer_segments) * (len(scope.periods) - n_appended_weeks))
+
+
+def _melt_transactions(m5_data: M5Data) -> pd.DataFrame:
+    # One row per (sku, store, date), from the evaluation file when both files have it, as the melted table the
+    # queries used to merge with
+    date_by_day_no = m5_data.calendar_df.set_index('d')['date']
+    melted_dfs = [sales_df.melt(id_vars=ID_COLUMNS, var_name='d', value_name='sales_qty')
+                  for sales_df in [m5_data.sales_train_evaluation, m5_data.sales_train_validation]]
+    transactions_df = pd.concat(melted_dfs, ignore_index=True).drop_duplicates(['item_id', 'store_id', 'd'])
+    return pd.DataFrame({'transaction_date': date_by_day_no[transactions_df.d].to_numpy(),
+                         'store_number': transactions_df.store_id.to_numpy(),
+                         'sku_number': transactions_df.item_id.to_numpy(),
+                         'sales_qty': transactions_df.sales_qty.to_numpy(dtype=np.float32),
+                         'cat': transactions_df.cat_id.to_numpy(),
+                         'dept': transactions_df.dept_id.to_numpy()})
+
+
+class M5TransactionQueryTestCase(TestCase):
+
+    def setUp(self):
+        self.m5_data = M5Data.load_from_files(M5_TOY_DIRECTORY)
+        self.repository = M5TransactionRepository(self.m5_data)
+        self.transactions_df = _melt_transactions(self.m5_data)
+
+    def assert_transactions_equal(self, transactions, expected_df: pd.DataFrame, sort: bool = False):
+        transactions_df = pd.DataFrame({'transaction_date': transactions.transaction_date,
+                                        'store_number': transactions.store_number,
+                                        'sku_number': transactions.sku_number,
+                                        'sales_qty': transactions.sales_qty})
+        expected_df = expected_df[list(transactions_df.columns)]
+        if sort:
+            keys = ['store_number', 'sku_number', 'transaction_date']
+            transactions_df = transactions_df.sort_values(keys)
+            expected_df = expected_df.sort_values(keys)
+        pd.testing.assert_frame_equal(transactions_df.reset_index(drop=True), expected_df.reset_index(drop=True))
+
+    def test_find_by_sku_store_and_date_matches_merge(self):
+        rng = np.random.default_rng(0)
+        known = self.transactions_df.iloc[rng.choice(len(self.transactions_df), 500)]
+        sku_store_dates = list(zip(known.sku_number, known.store_number, known.transaction_date))
+        # Unknown skus, stores and dates are not found; duplicates are found each time
+        sku_store_dates += [('FOODS_9_999', 'CA_1', '2016-01-01'), ('FOODS_1_001', 'WI_9', '2016-01-01'),
+                            ('FOODS_1_001', 'CA_1', '2030-01-01')] + sku_store_dates[:20]
+        rng.shuffle(sku_store_dates)
+        query_df = pd.DataFrame(sku_store_dates, columns=['sku_number', 'store_number', 'transaction_date'])
+        expected_df = pd.merge(query_df, self.transactions_df, on=['sku_number', 'store_number', 'transaction_date'])
+        self.assertEqual(len(expected_df), 520)
+        self.assert_transactions_equal(self.repository.find_by_sku_store_and_date(sku_store_dates), expected_df)
+
+        self.assertEqual(len(self.repository.find_by_sku_store_and_date([])), 0)
+
+    def test_find_by_category_matches_filter(self):
+        for label_type, label, start_date, end_date in [('cat', 'FOODS', '2015-02-03', '2015-03-14'),
+                                                        ('dept', 'HOBBIES_1', '2011-01-01', '2011-02-05'),
+                                                        ('cat', 'HOBBIES', '2016-05-20', '2030-01-01'),
+                                                        ('cat', 'HOUSEHOLD', '2015-02-03', '2015-03-14')]:
+            transactions_df = self.transactions_df
+            # Both bounds are included
+            expected_df = transactions_df[(transactions_df[label_type] == label) &
+                                          (transactions_df.transaction_date >= start_date) &
+                                          (transactions_df.transaction_date <= end_date)]
+            transactions = self.repository.find_by_category(label_type, label, start_date, end_date)
+            self.assert_transactions_equal(transactions, expected_df, sort=True)
+        self.assertGreater(len(self.repository.find_by_category('cat', 'FOODS', '2016-05-22', '2016-05-22')), 0)
+
+    def test_appended_days_are_found(self):
+        sales_df = self.m5_data.sales_train_evaluation
+        appended_days = [c for c in sales_df.columns if c not in ID_COLUMNS][-10:]
+        partial_data = dataclasses.replace(self.m5_data, sales_train_evaluation=sales_df.drop(columns=appended_days),
+                                           sales_train_validation=sales_df.drop(columns=appended_days))
+        repository = M5TransactionRepository(partial_data)
+        repository.append_days(sales_df[['item_id', 'dept_id', 'cat_id', 'store_id'] + appended_days])
+
+        transactions_df = self.transactions_df
+        sku_store_dates = list(zip(transactions_df.sku_number, transactions_df.store_number,
+                                   transactions_df.transaction_date))
+        self.assert_transactions_equal(repository.find_by_sku_store_and_date(sku_store_dates), transactions_df)
+        expected_df = transactions_df[(transactions_df.cat == 'FOODS') &
+                                      (transactions_df.transaction_date >= '2016-05-01')]
+        self.assert_transactions_equal(repository.find_by_category('cat', 'FOODS', '2016-05-01', '2016-06-30'),
+                                       expected_df, sort=True)
+
+
+class M5DataKeyTestCase(TestCase):
+
+    def test_data_changes_change_the_fingerprint(self):
+        with tempfile.TemporaryDirectory() as directory:
+            data_directory = os.path.join(directory, 'm5')
+            shutil.copytree(M5_TOY_DIRECTORY, data_directory)
+            m5_data = M5Data.load_from_files(data_directory)
+            sku_details = M5SkuDetailsRepository(m5_data).find_all()
+            segmentation_scheme = SegmentationScheme(
+                store_segmentation=build_store_segmentation(M5StoreDetailsRepository(m5_data).find_all()),
+                sku_segmentation=build_sku_segmentation(sku_details),
+                horizon=build_week_horizon(m5_data.calendar_df, start='2016-03-01', end='2016-05-23'))
+            transaction_repository = M5TransactionRepository(m5_data)
+            sell_prices = m5_data.sell_prices
+            is_last_week = sell_prices.wm_yr_wk == sell_prices.wm_yr_wk.max()
+            price_history_repository = M5PriceHistoryRepository(
+                dataclasses.replace(m5_data, sell_prices=sell_prices[~is_last_week]), sku_details)
+            featurizer = StoredFeaturizer(
+                MultiLagSalesFeaturizer([1], BasicObservationRepository(transaction_repository, sku_details)),
+                FeatureStore(os.path.join(directory, 'features')),
+                data_key=lambda: f"{transaction_repository.data_key}|{price_history_repository.data_key}")
+            fingerprints = [featurizer.get_fingerprint(segmentation_scheme)]
+            self.assertEqual(M5Data.load_from_files(data_directory).source_key, m5_data.source_key)
+
+            # Appended days and prices
+            sales_df = m5_data.sales_train_evaluation
+            transaction_repository.append_days(sales_df[['item_id', 'dept_id', 'cat_id', 'store_id']].assign(
+                d_1942=1, d_1943=0))
+            fingerprints.append(featurizer.get_fingerprint(segmentation_scheme))
+            price_history_repository.append_prices(sell_prices[is_last_week])
+            fingerprints.append(featurizer.get_fingerprint(segmentation_scheme))
+
+            # Modified source files
+            sales_path = os.path.join(data_directory, 'sales_train_evaluation.csv')
+            sales_df.iloc[:-1].to_csv(sales_path, index=False)
+            modified_data = M5Data.load_from_files(data_directory)
+            self.assertNotEqual(modified_data.source_key, m5_data.source_key)
+            transaction_repository = M5TransactionRepository(modified_data)
+            price_history_repository = M5PriceHistoryRepository(modified_data, sku_details)
+            fingerprints.append(featurizer.get_fingerprint(segmentation_scheme))
+
+        self.assertEqual(len(set(fingerprints)), len(fingerprints))
@@ -0,0 +1,28 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from retail.data.m5.sales_melt import melt_sales_chunks, read_melted_sales
+
+
+class SalesMeltTestCase(TestCase):
+
+    def test_chunks_with_different_days(self):
+        date_by_day_no = pd.Series(pd.date_range('2016-01-01', periods=4).strftime('%Y-%m-%d'),
+                                   index=['d_1', 'd_2', 'd_3', 'd_4'])
+        validation_df = pd.DataFrame({'item_id': ['A'], 'd_1': [1], 'd_2': [2]})
+        evaluation_df = pd.DataFrame({'item_id': ['B'], 'd_1': [3], 'd_2': [4], 'd_3': [5], 'd_4': [6]})
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'sales.parquet')
+            key_df = melt_sales_chunks([validation_df, evaluation_df], ['item_id'], date_by_day_no, path)
+            sales_df = read_melted_sales(path)
+
+        self.assertEqual(key_df.item_id.astype(str).tolist(), ['A', 'B'])
+        self.assertEqual(sales_df.item_id.astype(str).tolist(), ['A', 'A', 'B', 'B', 'B', 'B'])
+        self.assertEqual(sales_df.day_no.astype(str).tolist(), ['d_1', 'd_2', 'd_1', 'd_2', 'd_3', 'd_4'])
+        self.assertEqual(sales_df.date.tolist(), ['2016-01-01', '2016-01-02'] + date_by_day_no.tolist())
+        np.testing.assert_array_equal(sales_df.sales_qty.to_numpy(), [1, 2, 3, 4, 5, 6])
@@ -0,0 +1,87 @@
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from retail.transformer.lagged_feature import LaggedFeature
+from retail.transformer.rolling_feature import RollingFeature
+
+
+def _get_sales_df(lengths) -> pd.DataFrame:
+    # One series per length, with missing values, in shuffled row order
+    rng = np.random.default_rng(0)
+    dfs = []
+    for i, length in enumerate(lengths):
+        sales_qty = rng.poisson(3, length).astype(np.float32)
+        sales_qty[rng.random(length) < 0.1] = np.nan
+        dfs.append(pd.DataFrame({'store_id': f"S{i % 2}",
+                                 'sku_id': f"K{i}",
+                                 'transaction_date': pd.date_range('2016-01-01', periods=length),
+                                 'sales_qty': sales_qty}))
+    df = pd.concat(dfs, ignore_index=True)
+    df = df.take(rng.permutation(len(df))).reset_index(drop=True)
+    return df.astype({'store_id': 'category', 'sku_id': 'category'})
+
+
+class SeriesWindowTestCase(TestCase):
+
+    def setUp(self):
+        self.df = _get_sales_df([1, 3, 10, 40, 100])
+        self.sorted_df = self.df.sort_values(['store_id', 'sku_id', 'transaction_date'])
+        self.groups = self.sorted_df.groupby(['store_id', 'sku_id'], observed=True).sales_qty
+
+    def _assert_matches(self, df: pd.DataFrame, column: str, expected: pd.Series):
+        np.testing.assert_allclose(df[column].to_numpy(dtype=np.float64),
+                                   expected.reindex(df.index).to_numpy(dtype=np.float64), rtol=1e-5, atol=1e-6)
+
+    def test_lags_match_pandas_shift(self):
+        lags = [1, 2, 7, 12, 200]
+        df = LaggedFeature('sales_qty', lags=lags).transform(self.df.copy())
+        for lag in lags:
+            self._assert_matches(df, f"sales_qty_lag_{lag}", self.groups.shift(lag))
+
+    def test_lagged_rolling_matches_pandas_rolling(self):
+        windows = [2, 7, 12]
+        df = LaggedFeature('sales_qty', rolling_windows=windows, rolling_functions=['mean', 'std']).transform(
+            self.df.copy())
+        shifted = self.groups.shift(1)
+        for window in windows:
+            rolling = shifted.groupby([self.sorted_df.store_id, self.sorted_df.sku_id], observed=True).rolling(
+                window, min_periods=window)
+            self._assert_matches(df, f"sales_qty_rolling_mean_{window}", rolling.mean().droplevel([0, 1]))
+            self._assert_matches(df, f"sales_qty_rolling_std_{window}", rolling.std().droplevel([0, 1]))
+
+    def test_rolling_feature_matches_pandas(self):
+        lag = 12
+        df = RollingFeature(feature_names=['sales_qty'], windows=[3, 28], functions=['sum'], ewm_spans=[5],
+                            lag=lag).transform(self.df.copy())
+        keys = [self.sorted_df.store_id, self.sorted_df.sku_id]
+        shifted = self.groups.shift(lag)
+        for window in [3, 28]:
+            rolling = shifted.groupby(keys, observed=True).rolling(window, min_periods=window)
+            self._assert_matches(df, f"sales_qty_rolling_sum_{window}", rolling.sum().droplevel([0, 1]))
+        ewm = self.groups.transform(lambda s: s.ewm(span=5, adjust=False, ignore_na=True).mean())
+        self._assert_matches(df, 'sales_qty_ewm_5', ewm.groupby(keys, observed=True).shift(lag))
+
+    def test_lag_longer_than_every_series(self):
+        df = _get_sales_df([1, 2])
+        df = RollingFeature(feature_names=['sales_qty'], windows=[7], functions=['mean'], ewm_spans=[3],
+                            lag=12).transform(LaggedFeature('sales_qty', lag=12).transform(df))
+        for column in ['sales_qty_lag_12', 'sales_qty_rolling_mean_7', 'sales_qty_ewm_3']:
+            self.assertTrue(df[column].isna().all())
+
+    def test_rolling_precision_does_not_depend_on_the_frame_size(self):
+        # Many constant series of large prices: every window has a std of 0, and the sum of its values
+        n_series, length = 2000, 500
+        prices = np.repeat(np.random.default_rng(0).uniform(1, 1000, n_series), length).astype(np.float32)
+        df = pd.DataFrame({'store_id': 'S0',
+                           'sku_id': np.repeat([f"K{i}" for i in range(n_series)], length),
+                           'transaction_date': np.tile(pd.date_range('2016-01-01', periods=length), n_series),
+                           'price': prices}).astype({'store_id': 'category', 'sku_id': 'category'})
+        df = RollingFeature(feature_names=['price'], windows=[7], functions=['std', 'sum'], lag=1).transform(df)
+        std = df['price_rolling_std_7'].to_numpy()
+        self.assertEqual(np.nanmax(std), 0)
+        self.assertEqual(np.count_nonzero(np.isnan(std)), n_series * 7)
+        complete = ~np.isnan(std)
+        np.testing.assert_allclose(df['price_rolling_sum_7'].to_numpy()[complete],
+                                   7 * prices[complete].astype(np.float64), rtol=1e-6)
@@ -0,0 +1,94 @@
+import os
+import unittest
+from unittest import mock
+
+import pandas as pd
+import pandera as pa
+from pandera.errors import SchemaError
+from pandera.typing import Series
+
+from retail.data_layer.validation import validate, get_validation_mode, VALIDATION_MODE_VARIABLE, \
+    VALIDATION_SAMPLE_SIZE_VARIABLE
+
+
+class QuantitySchema(pa.DataFrameModel):
+    sku_id: Series[str]
+    sales_qty: Series[float] = pa.Field(ge=0)
+
+
+def _get_sales_df(n_rows: int = 1000) -> pd.DataFrame:
+    return pd.DataFrame({'sku_id': [f"SKU_{i % 20}" for i in range(n_rows)],
+                         'sales_qty': [float(i % 7) for i in range(n_rows)]})
+
+
+class ValidationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.sales_df = _get_sales_df()
+        # A single invalid row, that few samples contain
+        self.invalid_df = self.sales_df.copy()
+        self.invalid_df.loc[517, 'sales_qty'] = -1.
+        # Invalid whatever the rows
+        self.wrong_dtype_df = self.sales_df.astype({'sales_qty': int})
+        # The environment of the test runner does not choose the mode
+        patcher = mock.patch.dict(os.environ)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        os.environ.pop(VALIDATION_MODE_VARIABLE, None)
+        os.environ.pop(VALIDATION_SAMPLE_SIZE_VARIABLE, None)
+
+    def test_valid_frames_are_returned(self):
+        for validation_mode in ['full', 'sampled', 'schema', 'off']:
+            self.assertIs(validate(self.sales_df, QuantitySchema, validation_mode), self.sales_df)
+
+    def test_full_validates_every_row(self):
+        self.assertEqual(get_validation_mode(), 'full')
+        with self.assertRaises(SchemaError):
+            validate(self.invalid_df, QuantitySchema)
+        with self.assertRaises(SchemaError):
+            validate(self.wrong_dtype_df, QuantitySchema, 'full')
+
+    def test_sampled_validates_dtypes_and_sampled_rows(self):
+        with self.assertRaises(SchemaError):
+            validate(self.wrong_dtype_df, QuantitySchema, 'sampled', sample_size=10)
+        validate(self.invalid_df, QuantitySchema, 'sampled', sample_size=10)
+        # A sample as large as the frame is every row
+        with self.assertRaises(SchemaError):
+            validate(self.invalid_df, QuantitySchema, 'sampled', sample_size=len(self.invalid_df))
+        os.environ[VALIDATION_SAMPLE_SIZE_VARIABLE] = str(2 * len(self.invalid_df))
+        with self.assertRaises(SchemaError):
+            validate(self.invalid_df, QuantitySchema, 'sampled')
+
+    def test_schema_validates_columns_and_dtypes(self):
+        validate(self.invalid_df, QuantitySchema, 'schema')
+        with self.assertRaises(SchemaError):
+            validate(self.wrong_dtype_df, QuantitySchema, 'schema')
+        with self.assertRaises(SchemaError):
+            validate(self.sales_df.drop(columns='sku_id'), QuantitySchema, 'schema')
+
+    def test_off_validates_nothing(self):
+        validate(self.wrong_dtype_df.drop(columns='sku_id'), QuantitySchema, 'off')
+
+    def test_environment_variable_overrides_the_default(self):
+        os.environ[VALIDATION_MODE_VARIABLE] = 'schema'
+        self.assertEqual(get_validation_mode(), 'schema')
+        validate(self.invalid_df, QuantitySchema)
+        with self.assertRaises(SchemaError):
+            validate(self.wrong_dtype_df, QuantitySchema)
+        # An explicit mode is not overridden
+        with self.assertRaises(SchemaError):
+            validate(self.invalid_df, QuantitySchema, 'full')
+        os.environ[VALIDATION_MODE_VARIABLE] = 'off'
+        validate(self.wrong_dtype_df, QuantitySchema)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            validate(self.sales_df, QuantitySchema, 'partial')
+        os.environ[VALIDATION_MODE_VARIABLE] = 'partial'
+        with self.assertRaises(ValueError):
+            get_validation_mode()
+        with self.assertRaises(ValueError):
+            validate(self.sales_df, QuantitySchema)
+
+
+if __name__ == '__main__':
+    unittest.main()
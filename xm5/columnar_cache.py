@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from pandas import DataFrame
+
+
+ID_COLUMNS = ['id', 'item_id', 'dept_id', 'cat_id', 'store_id', 'state_id']
+
+CALENDAR_DTYPES = {
+    'date': str,
+    'wm_yr_wk': np.int16,
+    'weekday': 'category',
+    'wday': np.int8,
+    'month': np.int8,
+    'year': np.int16,
+    'd': 'category',
+    'event_name_1': 'category',
+    'event_type_1': 'category',
+    'event_name_2': 'category',
+    'event_type_2': 'category',
+    'snap_CA': np.int8,
+    'snap_TX': np.int8,
+    'snap_WI': np.int8,
+}
+
+# Every column that is not an id is a daily d_XXXX sales column
+SALES_DTYPES = defaultdict(lambda: np.int16, {c: 'category' for c in ID_COLUMNS})
+
+SELL_PRICES_DTYPES = {
+    'store_id': 'category',
+    'item_id': 'category',
+    'wm_yr_wk': np.int16,
+    'sell_price': np.float32,
+}
+
+
+def _file_hash(path: Path) -> str:
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _is_valid(source: Path, metadata_path: Path) -> bool:
+    if not metadata_path.exists():
+        return False
+    with open(metadata_path) as f:
+        metadata = json.load(f)
+    stat = source.stat()
+    if metadata['size'] != stat.st_size:
+        return False
+    if metadata['mtime_ns'] == stat.st_mtime_ns:
+        return True
+    # The file was touched: only rebuild when its content really changed
+    if metadata['sha1'] != _file_hash(source):
+        return False
+    metadata['mtime_ns'] = stat.st_mtime_ns
+    with open(metadata_path, 'w') as f:
+        json.dump(metadata, f)
+    return True
+
+
+def read_csv_cached(source: Path, cache_directory: Path, dtype) -> DataFrame:
+    cache_directory.mkdir(parents=True, exist_ok=True)
+    cache_path = cache_directory / (source.stem + '.arrow')
+    metadata_path = cache_directory / (source.stem + '.json')
+
+    if not (cache_path.exists() and _is_valid(source, metadata_path)):
+        stat = source.stat()
+        df = pd.read_csv(source, dtype=dtype)
+        # Uncompressed so that later runs can memory-map the columns as is
+        tmp_path = cache_path.with_suffix('.tmp')
+        feather.write_feather(df, tmp_path, compression='uncompressed')
+        os.replace(tmp_path, cache_path)
+        with open(metadata_path, 'w') as f:
+            json.dump({'source': str(source), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                       'sha1': _file_hash(source)}, f)
+        return df
+
+    table: pa.Table = feather.read_table(cache_path, memory_map=True)
+    return table.to_pandas(split_blocks=True)
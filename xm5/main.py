@@ -1,9 +1,12 @@
 # This is a sample Python script.
+import os
 import time
 from functools import partial
 
+from data_gold.cached_repository import CachedObservationRepository
 from data_gold.domain import Scope, SegmentationScheme, OfferSegment
 from data_gold.in_memory_repository import BasicObservationRepository, BasicPriceRepository, BasicSkuStatusRepository
+from model.feature_store import FeatureStore, StoredFeaturizer
 from model.featurizer import FeatureBuilder
 from model.forecaster import CatBoostForecaster, LagForecaster
 from model.validator import ForecasterValidator
@@ -14,7 +17,8 @@ from xm5.utilities import build_sku_segmentation, build_store_segmentation, buil
 if __name__ == '__main__':
 
     # Initialize repositories
-    m5Data = M5Data.load_from_files("/Users/louis-philippebigras/Documents/m5-forecasting-accuracy")
+    data_directory = "/Users/louis-philippebigras/Documents/m5-forecasting-accuracy"
+    m5Data = M5Data.load_from_files(data_directory)
     m5_sku_details_repository = M5SkuDetailsRepository(m5Data)
     sku_details = m5_sku_details_repository.find_all()
 
@@ -23,8 +27,11 @@ if __name__ == '__main__':
     m5_price_history_repository = M5PriceHistoryRepository(m5_data=m5Data, all_sku_details=sku_details)
     m5_store_details_repository = M5StoreDetailsRepository(m5_data=m5Data)
 
-    observation_repository = BasicObservationRepository(transaction_repository=m5_transaction_repository,
-                                                        all_sku_details=sku_details)
+    # Lag featurizers and forecasters query overlapping periods: each period is aggregated once
+    observation_repository = CachedObservationRepository(
+        BasicObservationRepository(transaction_repository=m5_transaction_repository, all_sku_details=sku_details))
+    # Appended days change the totals of their periods
+    m5_transaction_repository.append_listeners.append(observation_repository.invalidate_dates)
     price_repository = BasicPriceRepository(price_history_repository=m5_price_history_repository,all_sku_details=sku_details)
     sku_status_repository = BasicSkuStatusRepository(sku_history_repository=m5_sku_history_repository, all_sku_details=sku_details)
 
@@ -57,11 +64,17 @@ if __name__ == '__main__':
     fb = FeatureBuilder(observation_repository, price_repository, sku_status_repository)
 
     price_lag_1 = fb.price_lag(1)
-    sales_lag_1 = fb.sales_lag(1)
-    sales_lag_2 = fb.sales_lag(2)
+    # One query for both lags, with distinct feature names
+    sales_lags = fb.sales_lags([1, 2])
     log_price_lag_1 = fb.log(price_lag_1)
  #   normalized_log_price_lag_1 = fb.normalize(log_price_lag_1, training_scope)
-    composite_features = fb.concat([price_lag_1, sales_lag_1, sales_lag_2])
+    # Features are stored by featurizer configuration and data: retraining runs read them instead of recomputing them,
+    # until the csv files change or days and prices are appended
+    feature_store = FeatureStore(os.path.join(data_directory, "features"))
+    composite_features = StoredFeaturizer(fb.concat([price_lag_1, sales_lags], n_jobs=2),
+                                          feature_store=feature_store,
+                                          data_key=lambda: f"{m5_transaction_repository.data_key}|"
+                                                           f"{m5_price_history_repository.data_key}")
 
     cat_boost_forecaster = CatBoostForecaster(featurizer=composite_features,
                                               observation_repository=observation_repository)
@@ -1,15 +1,30 @@
 from collections import defaultdict
 from dataclasses import dataclass
 from pathlib import Path
+import hashlib
 import uuid
 
+import numpy as np
 from pandas import DataFrame
 
 import pandas as pd
 
-from data_silver.domain import SkuDetails, PriceHistory, SkuHistory, StoreDetails, Transaction
+from data_silver.domain import SkuDetails, PriceHistory, SkuHistory, StoreDetails, TransactionColumns, \
+    SkuStoreDateIndex
+from data_silver.arrays import ensure_capacity
 from data_silver.repository import SkuDetailsRepository, PriceHistoryRepository, TransactionRepository, \
     SkuHistoryRepository, StoreDetailsRepository
+from xm5.columnar_cache import read_csv_cached, ID_COLUMNS, CALENDAR_DTYPES, SALES_DTYPES, SELL_PRICES_DTYPES
+
+
+M5_FILE_NAMES = ['calendar.csv', 'sales_train_evaluation.csv', 'sales_train_validation.csv', 'sell_prices.csv']
+
+
+def _get_appended_key(key: str, df: DataFrame) -> str:
+    # The key of the data once df is appended to the data identified by key
+    digest = hashlib.sha1(key.encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
 
 
 @dataclass
@@ -19,16 +34,31 @@ class M5Data:
     sales_train_validation : DataFrame
     sales_train_evaluation : DataFrame
     sell_prices : DataFrame
+    # Identifies the files the data was loaded from, with their size and modification time
+    source_key : str = ''
 
     @staticmethod
-    def load_from_files(directory : str):
+    def load_from_files(directory : str, cache_directory : str = None):
         root = Path(directory)
-
-        calendar_df = pd.read_csv(root / 'calendar.csv')
-        sales_train_evaluation = pd.read_csv(root / 'sales_train_evaluation.csv')
-        sales_train_validation = pd.read_csv(root / 'sales_train_validation.csv')
-        sell_prices = pd.read_csv(root / 'sell_prices.csv')
-        return M5Data(calendar_df=calendar_df,sales_train_validation=sales_train_validation,sales_train_evaluation=sales_train_evaluation,sell_prices=sell_prices)
+        identifiers = []
+        for file_name in M5_FILE_NAMES:
+            stat = (root / file_name).stat()
+            identifiers.append(f"{file_name}:{stat.st_size}:{stat.st_mtime_ns}")
+
+        if cache_directory is None:
+            calendar_df = pd.read_csv(root / 'calendar.csv')
+            sales_train_evaluation = pd.read_csv(root / 'sales_train_evaluation.csv')
+            sales_train_validation = pd.read_csv(root / 'sales_train_validation.csv')
+            sell_prices = pd.read_csv(root / 'sell_prices.csv')
+        else:
+            # Typed columnar copies of the csv files, memory-mapped once they exist
+            cache_root = Path(cache_directory)
+            calendar_df = read_csv_cached(root / 'calendar.csv', cache_root, CALENDAR_DTYPES)
+            sales_train_evaluation = read_csv_cached(root / 'sales_train_evaluation.csv', cache_root, SALES_DTYPES)
+            sales_train_validation = read_csv_cached(root / 'sales_train_validation.csv', cache_root, SALES_DTYPES)
+            sell_prices = read_csv_cached(root / 'sell_prices.csv', cache_root, SELL_PRICES_DTYPES)
+        return M5Data(calendar_df=calendar_df,sales_train_validation=sales_train_validation,sales_train_evaluation=sales_train_evaluation,sell_prices=sell_prices,
+                      source_key='|'.join(identifiers))
 
 
 
@@ -99,25 +129,67 @@ class M5PriceHistoryRepository(PriceHistoryRepository):
         self.sku_details_by_sku = {}
         for sku_details in all_sku_details:
             self.sku_details_by_sku[sku_details.sku_number] = sku_details
+        self.date_by_week = None
+        # Shared arrays the preloaded histories are views of; appended histories own their arrays
+        self.change_dates = None
+        self.prices = None
+        self.offsets = None
+        # Identifies the prices: the source files, then every append_prices
+        self.data_key = m5_data.source_key
         self._preload()
 
 
     def _preload(self):
-        mapping_date = {}
-        for record in self.m5_data.calendar_df.itertuples():
-            if record.weekday == 'Saturday':
-                mapping_date[record.wm_yr_wk] = record.date
-        price_change_by_sku_and_store = defaultdict(list)
-        for r in self.m5_data.sell_prices.itertuples():
-            price_change_date = mapping_date[r.wm_yr_wk]
-            price_change_by_sku_and_store[r.item_id,r.store_id].append((price_change_date,r.sell_price))
-        for k,v in price_change_by_sku_and_store.items():
-            price_history = PriceHistory(sku_number=k[0],store_number=k[1],price_changes=v)
-            self.price_history_by_sku_and_store[price_history.sku_number,price_history.store_number] = price_history
-            sku_details = self.sku_details_by_sku[r.item_id]
+        calendar_df = self.m5_data.calendar_df
+        saturdays = calendar_df[calendar_df.weekday == 'Saturday']
+        self.date_by_week = pd.Series(saturdays.date.to_numpy(dtype=object), index=saturdays.wm_yr_wk.to_numpy())
+
+        # Every price change sorted once by (item, store, week): each history is a contiguous run of rows
+        sell_prices = self.m5_data.sell_prices
+        item_codes, items = pd.factorize(sell_prices.item_id)
+        store_codes, stores = pd.factorize(sell_prices.store_id)
+        weeks = sell_prices.wm_yr_wk.to_numpy()
+        order = np.lexsort((weeks, store_codes, item_codes))
+        item_codes, store_codes = item_codes[order], store_codes[order]
+        self.change_dates = self.date_by_week.loc[weeks[order]].to_numpy()
+        self.prices = sell_prices.sell_price.to_numpy()[order]
+        self.offsets = np.flatnonzero(np.r_[True, (item_codes[1:] != item_codes[:-1]) |
+                                            (store_codes[1:] != store_codes[:-1]), True])
+
+        for start, end in zip(self.offsets[:-1].tolist(), self.offsets[1:].tolist()):
+            price_history = PriceHistory(sku_number=items[item_codes[start]], store_number=stores[store_codes[start]],
+                                         change_dates=self.change_dates[start:end], prices=self.prices[start:end])
+            self._register(price_history)
+
+    def _register(self, price_history: PriceHistory):
+        self.price_history_by_sku_and_store[price_history.sku_number,price_history.store_number] = price_history
+        sku_details = self.sku_details_by_sku.get(price_history.sku_number)
+        if sku_details is not None:
             for l in sku_details.labels.values():
                 self.price_history_by_category[l].append(price_history)
 
+    def append_prices(self, sell_prices: DataFrame) -> list[PriceHistory]:
+        # New weeks of sell_prices.csv rows: only the histories of the given (item, store) pairs are extended, in place,
+        # so that the lists by category keep pointing at them. Returns the histories that changed.
+        updated = []
+        for (item_id, store_id), rows in sell_prices.groupby(['item_id', 'store_id'], observed=True, sort=False):
+            rows = rows.sort_values('wm_yr_wk')
+            change_dates = self.date_by_week.loc[rows.wm_yr_wk.to_numpy()].to_numpy()
+            prices = rows.sell_price.to_numpy()
+            price_history = self.price_history_by_sku_and_store.get((item_id, store_id))
+            if price_history is None:
+                price_history = PriceHistory(sku_number=item_id, store_number=store_id,
+                                             change_dates=change_dates, prices=prices)
+                self._register(price_history)
+            else:
+                if len(price_history.change_dates) and change_dates[0] <= price_history.change_dates[-1]:
+                    raise ValueError(f"Prices of {item_id} in {store_id} can only be appended after "
+                                     f"{price_history.change_dates[-1]}")
+                price_history.change_dates = np.concatenate([price_history.change_dates, change_dates])
+                price_history.prices = np.concatenate([price_history.prices, prices])
+            updated.append(price_history)
+        self.data_key = _get_appended_key(self.data_key, sell_prices)
+        return updated
 
     def find_by_category(self, label: str):
         return self.price_history_by_category[label]
@@ -126,7 +198,7 @@ class M5PriceHistoryRepository(PriceHistoryRepository):
         return self.price_history_by_sku_and_store.get((sku, store_number))
 
     def find_all(self):
-        return list(self.sku_details_by_sku.values())
+        return list(self.price_history_by_sku_and_store.values())
 
 class M5StoreDetailsRepository(StoreDetailsRepository):
 
@@ -160,44 +232,142 @@ class M5StoreDetailsRepository(StoreDetailsRepository):
 
 class M5TransactionRepository(TransactionRepository):
 
-    def __init__(self, m5_data : M5Data):
+    def __init__(self, m5_data : M5Data, validation_only : bool = False):
         self.m5_data = m5_data
-        self.df = None
+        self.validation_only = validation_only
+        # One row per (sku, store) series, and its daily sales in a dense (series x day) matrix
+        self.series_df = None
+        self.series_index = None
+        self.transaction_dates = None
+        self.date_index = None
+        self.sales_qty = None
+        self.source_by_transaction_date = {}
+        # Called with the dates of every append_days, e.g. to invalidate the caches of the appended periods
+        self.append_listeners = []
+        # Identifies the transactions: the source files and the days read from them, then every append_days
+        self.data_key = f"{m5_data.source_key}|validation_only={validation_only}"
         self._preprocess()
 
     def _preprocess(self):
-        sales_df = self.m5_data.sales_train_validation
-        column_names = sales_df.columns
-        key_columns = column_names[0:6]
-        melted_df_1 = sales_df.melt(id_vars=key_columns, var_name='d',value_name='sales_qty')
-
-        sales_df = self.m5_data.sales_train_evaluation
-        column_names = sales_df.columns
-        key_columns = column_names[0:6]
-        melted_df_2 = sales_df.melt(id_vars=key_columns, var_name='d',value_name='sales_qty')
-
-        df = pd.concat([melted_df_1,melted_df_2],ignore_index=True)
-        calendar_df = self.m5_data.calendar_df[['date','d']]
-        df = pd.merge(df,calendar_df,on='d')
-        df = df.rename(columns={"item_id": "sku_number", "dept_id": "dept",'cat_id':'cat',
-                                'store_id':'store_number','date':'transaction_date'})
-        self.df = df[['sku_number','dept','cat','store_number','transaction_date','sales_qty']]
-
-    def find_by_category(self, label_type : str, label: str, start_date: str, end_date: str) -> list[Transaction]:
-
-        df = self.df
-        df = df[(df[label_type] == label) & (df['transaction_date'] >= start_date) & (df['transaction_date'] <= end_date)]
-        return df.itertuples()
-
-    def find_by_sku_store_and_date(self, sku_store_dates : list[str,str,str])->list[Transaction]:
-        df = self.df
-        records = []
-        for sku_store_date in sku_store_dates:
-            records.append({'sku_number' : sku_store_date[0],'store_number' : sku_store_date[1],'transaction_date' : sku_store_date[2]})
-        scope_df = pd.DataFrame(records)
-        df = pd.merge(df,scope_df)
-        return df.itertuples()
-
-
-
-
+        # The evaluation file extends the validation file with the last days: each (sku, store, day) is kept once,
+        # from the evaluation file when it has the day
+        validation_df = self.m5_data.sales_train_validation
+        evaluation_df = self.m5_data.sales_train_evaluation
+        validation_days = [c for c in validation_df.columns if c not in ID_COLUMNS]
+        evaluation_days = [c for c in evaluation_df.columns if c not in ID_COLUMNS]
+
+        validation_only_days = [d for d in validation_days if d not in set(evaluation_days)]
+        if validation_only_days:
+            keys = ['item_id', 'store_id']
+            evaluation_df = evaluation_df.join(validation_df.set_index(keys)[validation_only_days], on=keys)
+
+        days = validation_days if self.validation_only else evaluation_days + validation_only_days
+        date_by_day_no = self.m5_data.calendar_df.set_index('d')['date']
+        dates = date_by_day_no[days].to_numpy(dtype=object)
+        order = np.argsort(dates, kind='stable')
+        days = [days[i] for i in order]
+        self.transaction_dates = dates[order]
+        self.date_index = pd.Index(self.transaction_dates)
+        validation_day_set = set(validation_days)
+        for day, date in zip(days, self.transaction_dates):
+            self.source_by_transaction_date[date] = 'validation' if day in validation_day_set else 'evaluation'
+
+        series_df = evaluation_df[['item_id', 'dept_id', 'cat_id', 'store_id']]
+        self.series_df = series_df.rename(columns={"item_id": "sku_number", "dept_id": "dept", 'cat_id': 'cat',
+                                                   'store_id': 'store_number'}).reset_index(drop=True)
+        self.series_index = pd.MultiIndex.from_arrays([self.series_df.store_number.astype(str),
+                                                       self.series_df.sku_number.astype(str)])
+        # sales_qty is a view of a buffer with room for the days appended later
+        self._sales_qty_buffer = evaluation_df[days].to_numpy(dtype=np.float32)
+        self.sales_qty = self._sales_qty_buffer
+
+    def append_days(self, sales_df: DataFrame):
+        # New d_XXXX columns in the layout of sales_train_evaluation.csv, for known or new series. Only the new cells
+        # are written: the matrix grows into spare room, and series missing from sales_df sold nothing on these days.
+        days = [c for c in sales_df.columns if c not in ID_COLUMNS]
+        date_by_day_no = self.m5_data.calendar_df.set_index('d')['date']
+        unknown = date_by_day_no.index.get_indexer(days) < 0
+        if unknown.any():
+            raise ValueError(f"Days missing from the calendar: {np.array(days)[unknown]}")
+        dates = date_by_day_no[days].to_numpy(dtype=object)
+        order = np.argsort(dates, kind='stable')
+        days, dates = [days[i] for i in order], dates[order]
+        if (dates[1:] == dates[:-1]).any():
+            raise ValueError("Each day can only be appended once")
+        if len(dates) and len(self.transaction_dates) and dates[0] <= self.transaction_dates[-1]:
+            raise ValueError(f"Only days after {self.transaction_dates[-1]} can be appended")
+
+        series_rows = self.series_index.get_indexer(pd.MultiIndex.from_arrays([sales_df.store_id.astype(str),
+                                                                               sales_df.item_id.astype(str)]))
+        new_series = series_rows < 0
+        if new_series.any():
+            n_known = len(self.series_df)
+            new_series_df = sales_df.loc[new_series, ['item_id', 'dept_id', 'cat_id', 'store_id']].rename(
+                columns={"item_id": "sku_number", "dept_id": "dept", 'cat_id': 'cat', 'store_id': 'store_number'})
+            self.series_df = pd.concat([self.series_df, new_series_df], ignore_index=True)
+            self.series_index = pd.MultiIndex.from_arrays([self.series_df.store_number.astype(str),
+                                                           self.series_df.sku_number.astype(str)])
+            series_rows[new_series] = np.arange(n_known, len(self.series_df))
+
+        n_known_days = len(self.transaction_dates)
+        self._sales_qty_buffer = ensure_capacity(self._sales_qty_buffer, (len(self.series_df), n_known_days + len(days)),
+                                                 0)
+        self.sales_qty = self._sales_qty_buffer[:len(self.series_df), :n_known_days + len(days)]
+        self.sales_qty[series_rows, n_known_days:] = sales_df[days].to_numpy(dtype=np.float32)
+
+        self.transaction_dates = np.concatenate([self.transaction_dates, dates])
+        self.date_index = pd.Index(self.transaction_dates)
+        for date in dates:
+            self.source_by_transaction_date[date] = 'appended'
+        self.data_key = _get_appended_key(self.data_key, sales_df)
+        for listener in self.append_listeners:
+            listener(dates.tolist())
+
+    def _find_block(self, series_rows: np.ndarray, date_slice: slice) -> TransactionColumns:
+        n_days = len(self.transaction_dates[date_slice])
+        return TransactionColumns(
+            transaction_date=np.tile(self.transaction_dates[date_slice], len(series_rows)),
+            store_number=np.repeat(self.series_df.store_number.to_numpy()[series_rows], n_days),
+            sku_number=np.repeat(self.series_df.sku_number.to_numpy()[series_rows], n_days),
+            sales_qty=self.sales_qty[series_rows, date_slice].ravel())
+
+    def find_by_category(self, label_type : str, label: str, start_date: str, end_date: str) -> TransactionColumns:
+        series_rows = np.flatnonzero(self.series_df[label_type].to_numpy() == label)
+        date_slice = slice(np.searchsorted(self.transaction_dates, start_date, side='left'),
+                           np.searchsorted(self.transaction_dates, end_date, side='right'))
+        return self._find_block(series_rows, date_slice)
+
+    def find_by_sku_store_and_date(self, sku_store_dates : list[str,str,str]) -> TransactionColumns:
+        if not sku_store_dates:
+            return self._find_block(np.empty(0, dtype=int), slice(0, 0))
+        sku_numbers, store_numbers, transaction_dates = (np.asarray(c, dtype=object) for c in zip(*sku_store_dates))
+        series_rows = self.series_index.get_indexer(pd.MultiIndex.from_arrays([store_numbers, sku_numbers]))
+        date_positions = self.date_index.get_indexer(transaction_dates)
+        found = (series_rows >= 0) & (date_positions >= 0)
+        return TransactionColumns(transaction_date=transaction_dates[found],
+                                  store_number=store_numbers[found],
+                                  sku_number=sku_numbers[found],
+                                  sales_qty=self.sales_qty[series_rows[found], date_positions[found]])
+
+    def find_by_sku_store_date_index(self, sku_store_date_index: SkuStoreDateIndex) -> TransactionColumns:
+        index = sku_store_date_index
+        series_rows = self.series_index.get_indexer(pd.MultiIndex.from_arrays([index.stores[index.store_idx],
+                                                                               index.skus[index.sku_idx]]))
+        date_positions = self.date_index.get_indexer(index.dates[index.date_idx])
+        series_found = series_rows >= 0
+        date_found = date_positions >= 0
+        date_positions = date_positions[date_found]
+        n_series, n_dates = series_found.sum(), len(date_positions)
+
+        # Whole rows of the daily matrix are sliced at once when the scope covers consecutive days
+        series_rows = series_rows[series_found]
+        if n_dates > 0 and (np.diff(date_positions) == 1).all():
+            sales_qty = self.sales_qty[series_rows, date_positions[0]:date_positions[-1] + 1]
+        else:
+            sales_qty = self.sales_qty[np.ix_(series_rows, date_positions)]
+
+        return TransactionColumns(
+            transaction_date=pd.Categorical.from_codes(np.tile(index.date_idx[date_found], n_series), index.dates),
+            store_number=pd.Categorical.from_codes(np.repeat(index.store_idx[series_found], n_dates), index.stores),
+            sku_number=pd.Categorical.from_codes(np.repeat(index.sku_idx[series_found], n_dates), index.skus),
+            sales_qty=sales_qty.ravel())